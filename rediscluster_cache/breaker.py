@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Circuit breaker of a cluster node.
+
+A closed breaker lets every command through and records its outcome.
+When too many of the recent commands failed, or were slower than
+``slow_call``, it opens and commands fail at once with
+``CircuitBreakerOpen`` instead of waiting for the socket timeouts. After
+``open_time`` seconds it is half open: a few commands are let through as
+probes, it closes again when they succeed and opens when one fails.
+'''
+import collections
+import threading
+import time
+
+from redis.exceptions import ConnectionError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreakerOpen( ConnectionError ):
+    """
+    Raised instead of sending a command to a node whose breaker is open.
+    """
+
+
+class CircuitBreaker( object ):
+    """
+    Error rate and latency driven circuit breaker.
+
+    Enable it with::
+
+        "CIRCUIT_BREAKER_CLASS": "rediscluster_cache.breaker.CircuitBreaker",
+        "CIRCUIT_BREAKER_KWARGS": {"window": 20, "min_calls": 10, "error_rate": 0.5,
+                                   "slow_call": 1, "open_time": 5},
+    """
+
+    def __init__( self, name = None, window = 20, min_calls = 10, error_rate = 0.5,
+                  slow_call = None, open_time = 5, half_open_calls = 1 ):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.open_time = open_time
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._calls = collections.deque( maxlen = window )
+        self._latencies = collections.deque( maxlen = window )
+        self.state = CLOSED
+        self._opened_at = 0
+        self._probes = 0
+        self._probe_successes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def before( self ):
+        """
+        Called before a command, raises ``CircuitBreakerOpen`` if it must
+        not be sent.
+        """
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self._opened_at < self.open_time:
+                    self.rejected += 1
+                    raise CircuitBreakerOpen( "Circuit breaker of %s is open" % self.name )
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitBreakerOpen( "Circuit breaker of %s is half open" % self.name )
+                self._probes += 1
+
+    def cancel( self ):
+        """
+        Give back the probe taken by a command which did not get an answer
+        for reasons of its own.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def success( self, latency ):
+        """
+        Record a command answered after latency seconds.
+        """
+        self.record( latency, self.slow_call is not None and latency > self.slow_call )
+
+    def failure( self, latency ):
+        """
+        Record a command which failed after latency seconds.
+        """
+        self.record( latency, True )
+
+    def record( self, latency, failed ):
+        with self._lock:
+            self._latencies.append( latency )
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+            if self.state == OPEN:
+                return
+
+            self._calls.append( failed )
+            if len( self._calls ) >= self.min_calls and \
+                    float( sum( self._calls ) ) / len( self._calls ) >= self.error_rate:
+                self._open()
+
+    def after_fork( self ):
+        """
+        Recreate the lock in a forked process, and give back the probes
+        the threads of the parent were making.
+        """
+        self._lock = threading.Lock()
+        self._probes = 0
+
+    def _open( self ):
+        self.state = OPEN
+        self._opened_at = time.time()
+        self._calls.clear()
+        self.opened += 1
+
+    def allows( self ):
+        """
+        Whether a command would be let through now, without counting it
+        as a probe.
+        """
+        if self.state == OPEN:
+            return time.time() - self._opened_at >= self.open_time
+        if self.state == HALF_OPEN:
+            return self._probes < self.half_open_calls
+        return True
+
+    def latency( self, percentile = 0.95 ):
+        """
+        Latency below which the given share of the recent commands were
+        answered, None before any command.
+        """
+        with self._lock:
+            latencies = sorted( self._latencies )
+        if not latencies:
+            return None
+        return latencies[min( len( latencies ) - 1, int( percentile * len( latencies ) ) )]
+
+    def stats( self ):
+        with self._lock:
+            calls = len( self._calls )
+            failures = sum( self._calls )
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failure_rate": float( failures ) / calls if calls else 0.0,
+            "latency_p95": self.latency( 0.95 ),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
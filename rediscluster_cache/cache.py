@@ -5,8 +5,10 @@ import functools
 import logging
 
 from rediscluster_cache.base import BaseCache
+from rediscluster_cache.deadline import with_deadline
 
 from rediscluster_cache.exceptions import ConnectionInterrupted
+from rediscluster_cache.namespace import Namespace
 from rediscluster_cache.util import load_class
 
 IGNORE_EXCEPTIONS = False
@@ -70,6 +72,7 @@ class RedisClusterCache( BaseCache ):
         return self.client.incr_version(*args, **kwargs)
 
     @omit_exception
+    @with_deadline
     def decr_version( self, *args, **kwargs ):
         return super( RedisClusterCache, self ).decr_version( *args, **kwargs )
 
@@ -78,10 +81,11 @@ class RedisClusterCache( BaseCache ):
         return self.client.add(*args, **kwargs)
 
     @omit_exception
-    def get(self, key, default=None, version=None, client=None):
+    @with_deadline
+    def get(self, key, default=None, version=None, client=None, lazy=None):
         try:
             return self.client.get(key, default=default, version=version,
-                                   client=client)
+                                   client=client, lazy=lazy)
         except ConnectionInterrupted as e:
             if self._ignore_exceptions:
                 if REDIS_LOG_IGNORED_EXCEPTIONS:
@@ -89,11 +93,41 @@ class RedisClusterCache( BaseCache ):
                 return default
             raise
 
+    def counter(self, *args, **kwargs):
+        return self.client.counter(*args, **kwargs)
+
+    def flush_writes(self, timeout=None):
+        return self.client.flush_writes(timeout)
+
+    @omit_exception(return_value=(None, 0))
+    def get_with_ttl(self, *args, **kwargs):
+        return self.client.get_with_ttl(*args, **kwargs)
+
+    @omit_exception
+    def get_and_touch(self, *args, **kwargs):
+        return self.client.get_and_touch(*args, **kwargs)
+
+    @omit_exception
+    def incr_with_ttl(self, *args, **kwargs):
+        return self.client.incr_with_ttl(*args, **kwargs)
+
+    @omit_exception(return_value=(None, None))
+    def gets(self, *args, **kwargs):
+        return self.client.gets(*args, **kwargs)
+
+    @omit_exception(return_value=False)
+    def cas(self, *args, **kwargs):
+        return self.client.cas(*args, **kwargs)
+
+    def get_stream(self, *args, **kwargs):
+        return self.client.get_stream(*args, **kwargs)
+
     @omit_exception
     def delete(self, *args, **kwargs):
         return self.client.delete(*args, **kwargs)
 
     @omit_exception
+    @with_deadline
     def delete_many(self, *args, **kwargs):
         return super( RedisClusterCache, self ).delete_many( *args, **kwargs )
 
@@ -103,11 +137,15 @@ class RedisClusterCache( BaseCache ):
 
     @omit_exception(return_value={})
     def get_many(self, *args, **kwargs):
-        return super( RedisClusterCache, self ).get_many( *args, **kwargs )
+        return self.client.get_many(*args, **kwargs)
+
+    @omit_exception(return_value=((), None))
+    def get_many_columnar(self, *args, **kwargs):
+        return self.client.get_many_columnar(*args, **kwargs)
 
     @omit_exception
     def set_many(self, *args, **kwargs):
-        return super( RedisClusterCache, self ).set_many( *args, **kwargs )
+        return self.client.set_many(*args, **kwargs)
 
     @omit_exception
     def incr(self, *args, **kwargs):
@@ -129,11 +167,68 @@ class RedisClusterCache( BaseCache ):
     def expire(self, *args, **kwargs):
         return self.client.expire(*args, **kwargs)
 
+    @omit_exception(return_value=False)
+    def touch(self, *args, **kwargs):
+        return self.client.touch(*args, **kwargs)
+
+    @omit_exception(return_value={})
+    def touch_many(self, *args, **kwargs):
+        return self.client.touch_many(*args, **kwargs)
+
+    @omit_exception(return_value={})
+    def expire_many(self, *args, **kwargs):
+        return self.client.expire_many(*args, **kwargs)
+
+    @omit_exception(return_value={})
+    def persist_many(self, *args, **kwargs):
+        return self.client.persist_many(*args, **kwargs)
+
+    @omit_exception(return_value={})
+    def ttl_many(self, *args, **kwargs):
+        return self.client.ttl_many(*args, **kwargs)
+
+    @omit_exception(return_value=0)
+    def invalidate_tags(self, *args, **kwargs):
+        return self.client.invalidate_tags(*args, **kwargs)
+
+    @omit_exception
+    def prune_tags(self, *args, **kwargs):
+        return self.client.prune_tags(*args, **kwargs)
+
+    def namespace(self, name):
+        """
+        Return a view of the cache whose keys live in the namespace name,
+        all invalidated at once by ``invalidate_namespace``.
+        """
+        return Namespace(self, name)
+
+    @omit_exception
+    def invalidate_namespace(self, *args, **kwargs):
+        return self.client.invalidate_namespace(*args, **kwargs)
+
     @omit_exception
     def lock(self, *args, **kwargs):
         return self.client.lock(*args, **kwargs)
 
+    def stats(self):
+        return self.client.stats()
+
     @omit_exception
     def close(self, **kwargs):
         self.client.close(**kwargs)
 
+    def release(self):
+        """
+        Close the client for good and give back its reference to the node
+        manager shared with the other caches of the cluster, the last one
+        stops its topology checks. Django calls close after every request,
+        release is meant for the end of the process or of the cache. The
+        cache builds a new client if it is used again.
+        """
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.close()
+            finally:
+                client.release()
+
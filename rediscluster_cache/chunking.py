@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Storage of large values as several chunks.
+
+A chunked value is stored as a small manifest under the cache key, the
+chunks live under keys sharing the hash tag of the cache key so that all
+of them are in the same slot and can be handled in one transaction. The
+chunk keys also hold a digest of the whole cache key, keys sharing a hash
+tag never share chunks.
+'''
+import hashlib
+import random
+
+# Prefix of a manifest. Encoded values never start with a NUL byte,
+# neither pickle, zlib nor integers do.
+CHUNK_MANIFEST = b"\x00rcc-chunks:"
+
+CHUNK_SIZE = 512 * 1024
+
+# A manifest is always shorter than this.
+MANIFEST_MAX_SIZE = 64
+
+
+def hash_tag( key ):
+    """
+    Return the part of the key used by redis cluster for hashing.
+    """
+    start = key.find( "{" )
+    if start > -1:
+        end = key.find( "}", start + 1 )
+        if end > -1 and end != start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def can_chunk( key ):
+    """
+    Whether chunk keys can be placed in the slot of the given key.
+    """
+    return "}" not in hash_tag( key )
+
+
+def chunk_key( key, generation, index ):
+    digest = hashlib.sha1( key if isinstance( key, bytes ) else key.encode( "utf-8" ) ).hexdigest()
+    return "{%s}:chunk:%s:%s:%d" % ( hash_tag( key ), digest, generation, index )
+
+
+def split_chunks( value, size ):
+    """
+    Split a buffer, or a list of buffers, into memoryviews of ``size``
+    bytes. Only chunks spanning two buffers are copied.
+    """
+    if not isinstance( value, list ):
+        value = [value]
+
+    chunks = []
+    pending = None
+    for part in value:
+        part = memoryview( part )
+        offset = 0
+        if pending is not None:
+            offset = size - len( pending )
+            pending += part[:offset]
+            if len( pending ) < size:
+                continue
+            chunks.append( memoryview( pending ) )
+            pending = None
+        while len( part ) - offset >= size:
+            chunks.append( part[offset:offset + size] )
+            offset += size
+        if offset < len( part ):
+            pending = bytearray( part[offset:] )
+    if pending:
+        chunks.append( memoryview( pending ) )
+    return chunks
+
+
+class ChunkManifest( object ):
+    """
+    Describes the chunks of a value: a generation unique to the write,
+    the number of chunks, the total size and whether the chunks hold the
+    raw bytes given by the caller instead of an encoded value.
+    """
+    __slots__ = ( "generation", "count", "size", "raw" )
+
+    def __init__( self, count, size, raw = False, generation = None ):
+        self.generation = generation or "%08x" % random.getrandbits( 32 )
+        self.count = count
+        self.size = size
+        self.raw = raw
+
+    def keys( self, key ):
+        return [chunk_key( key, self.generation, index ) for index in range( self.count )]
+
+    def dumps( self ):
+        manifest = "%s:%d:%d:%d" % ( self.generation, self.count, self.size, int( self.raw ) )
+        return CHUNK_MANIFEST + manifest.encode( "ascii" )
+
+    @classmethod
+    def loads( cls, value ):
+        """
+        Return the manifest stored in value, or None if value is a plain
+        encoded value.
+        """
+        if not isinstance( value, bytes ) or not value.startswith( CHUNK_MANIFEST ):
+            return None
+        try:
+            generation, count, size, raw = value[len( CHUNK_MANIFEST ):].decode( "ascii" ).split( ":" )
+            return cls( int( count ), int( size ), raw = raw == "1", generation = generation )
+        except ( ValueError, UnicodeDecodeError ):
+            return None
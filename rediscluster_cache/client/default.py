@@ -4,14 +4,33 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+import os
 import socket
+import threading
 import warnings
+from multiprocessing import TimeoutError as AsyncTimeoutError
+from multiprocessing.pool import ThreadPool
 
+from redis.connection import Encoder
 from redis.exceptions import ConnectionError
 
+from rediscluster_cache.chunking import CHUNK_MANIFEST, CHUNK_SIZE, MANIFEST_MAX_SIZE, ChunkManifest, can_chunk, \
+    split_chunks
+from rediscluster_cache.colocation import KEY_GROUP_SLOTS, group_key
+from rediscluster_cache.compressor.identity import IdentityCompressor
+from rediscluster_cache.deadline import bound, current as current_deadline, deadline_scope, expired, with_deadline
 from rediscluster_cache.exceptions import ConnectionInterrupted, CompressorError
-from rediscluster_cache.nodemanager import NodeManager
-from rediscluster_cache.util import DEFAULT_TIMEOUT, get_key_func, CacheKey, load_class, integer_types
+from rediscluster_cache.hedge import Hedger
+from rediscluster_cache.namespace import GENERATION_KEY, NAMESPACE_TIMEOUT, NamespaceGenerations, \
+    initial_generation
+from rediscluster_cache.nodemanager import get_node_manager, release_node_manager
+from rediscluster_cache.scripts import value_token
+from rediscluster_cache.counter import Counter
+from rediscluster_cache.writebehind import DELETE, EXPIRE, SET
+from rediscluster_cache.tags import TAG_PRUNE_COUNT, TAG_PRUNE_RATE, TAG_SHARDS, should_prune, tag_key, tag_keys
+from rediscluster_cache.serializers.record import get_schema
+from rediscluster_cache.util import DEFAULT_TIMEOUT, get_key_func, default_key_func, CacheKey, LazyValue, load_class, \
+    integer_types, smart_text
 
 # Compatibility with redis-py 2.10.6+
 try:
@@ -20,6 +39,47 @@ try:
 except ImportError:
     _main_exceptions = (ConnectionError, socket.timeout)
 
+# redis-py 3+ sends memoryviews as they are, older versions need bytes.
+_memoryview_args = isinstance(Encoder("utf-8", "strict", False).encode(memoryview(b"")), memoryview)
+
+
+def _redis_arg(value):
+    """
+    Return a buffer in a form redis-py sends without copying it, if it can.
+    """
+    if isinstance(value, bytes):
+        return value
+    if _memoryview_args:
+        return value if isinstance(value, memoryview) else memoryview(value)
+    return memoryview(value).tobytes()
+
+
+def _payload_size(value):
+    if isinstance(value, list):
+        return sum(len(memoryview(part)) for part in value)
+    return len(value)
+
+
+# Values smaller than this are encoded and decoded inline, handing them
+# to the codec pool costs more than it saves.
+CODEC_MIN_SIZE = 16 * 1024
+
+# Made keys remembered by a client, the cache is emptied when full.
+KEY_CACHE_SIZE = 10000
+
+
+class _Inline(object):
+    """
+    Already computed result, mirrors the ``get`` of a pool ``AsyncResult``.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, timeout=None):
+        return self.value
+
 
 class DefaultClient(object):
 
@@ -48,7 +108,114 @@ class DefaultClient(object):
         self._serializer = serializer_cls(options=self._options)
         self._compressor = compressor_cls(options=self._options)
 
-        self.node_manager = NodeManager( self._server, self._params )
+        # Values of the size of a record of the record serializer are
+        # never read as integers.
+        schema = getattr(self._serializer, "schema", None)
+        self._record_size = schema.size if schema is not None else None
+
+        self._codec_workers = int(self._options.get("CODEC_WORKERS", 0))
+        self._codec_min_size = int(self._options.get("CODEC_MIN_SIZE", CODEC_MIN_SIZE))
+        self._fanout_workers = int(self._options.get("FANOUT_WORKERS", 0))
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+
+        # Values larger than CHUNK_THRESHOLD bytes are stored in chunks of
+        # CHUNK_SIZE bytes, 0 disables chunking.
+        self._chunk_threshold = int(self._options.get("CHUNK_THRESHOLD", 0))
+        self._chunk_size = int(self._options.get("CHUNK_SIZE", CHUNK_SIZE))
+
+        # Return LazyValue instances from get/get_many unless the call
+        # asks otherwise.
+        self._lazy_decode = bool(self._options.get("LAZY_DECODE", False))
+
+        # With HEDGE_READS, a get not answered within the p95 latency of its
+        # node (HEDGE_DELAY without a circuit breaker to measure it) is also
+        # sent to another node of the slot, for at most HEDGE_BUDGET of the
+        # reads.
+        self._hedger = None
+        if self._options.get("HEDGE_READS", False):
+            self._hedger = Hedger(workers=int(self._options.get("HEDGE_WORKERS", 16)),
+                                  budget=float(self._options.get("HEDGE_BUDGET", 0.05)))
+        self._hedge_delay = float(self._options.get("HEDGE_DELAY", 0.05))
+        self._hedge_percentile = float(self._options.get("HEDGE_PERCENTILE", 0.95))
+
+        # Generations of namespaces are trusted for NAMESPACE_TIMEOUT
+        # seconds before being read again.
+        self._namespaces = NamespaceGenerations(
+            self, float(self._options.get("NAMESPACE_TIMEOUT", NAMESPACE_TIMEOUT)))
+
+        # Keys of the same KEY_GROUP_FUNCTION group share a hash tag, spread
+        # over KEY_GROUP_SLOTS slots.
+        key_group = self._options.get("KEY_GROUP_FUNCTION")
+        if key_group is not None and not callable(key_group):
+            key_group = load_class(key_group)
+        self._key_group = key_group
+        self._key_group_slots = int(self._options.get("KEY_GROUP_SLOTS", KEY_GROUP_SLOTS))
+
+        # With WRITE_BEHIND, set, delete and expire are queued and made by
+        # background flushers unless called with write_behind=False.
+        self._write_behind = bool(self._options.get("WRITE_BEHIND", False))
+        self._writer_cls = load_class(self._options.get("WRITE_BEHIND_CLASS",
+                                                        "rediscluster_cache.writebehind.WriteBehindQueue"))
+        self._writer_kwargs = self._options.get("WRITE_BEHIND_KWARGS", {})
+        self._writer = None
+
+        # Increments of counters are added up in the process and flushed
+        # in batches by the aggregator.
+        self._aggregator_cls = load_class(self._options.get("COUNTER_AGGREGATOR_CLASS",
+                                                            "rediscluster_cache.counter.CounterAggregator"))
+        self._aggregator_kwargs = self._options.get("COUNTER_AGGREGATOR_KWARGS", {})
+        self._aggregator = None
+
+        # Locks woken on release, with fencing tokens. LOCK_CLASS None gives
+        # the polling lock of redis-py.
+        lock_cls = self._options.get("LOCK_CLASS", "rediscluster_cache.lock.ClusterLock")
+        self._lock_cls = load_class(lock_cls) if lock_cls is not None else None
+        self._lock_kwargs = self._options.get("LOCK_KWARGS", {})
+
+        # Keys made with the default prefix and version, by cache key.
+        self._key_cache_size = int(self._options.get("KEY_CACHE_SIZE", KEY_CACHE_SIZE))
+        self._made_keys = {}
+        self._made_keys_for = None
+        self._key_heads = {}
+
+        # The members of a tag are spread over TAG_SHARDS sets.
+        self._tag_shards = int(self._options.get("TAG_SHARDS", TAG_SHARDS))
+        self._tag_prune_rate = float(self._options.get("TAG_PRUNE_RATE", TAG_PRUNE_RATE))
+
+        self._node_manager = get_node_manager( self._server, self._params )
+
+    @property
+    def node_manager(self):
+        """
+        Node manager shared by the clients of the same cluster in the process.
+        """
+        if self._node_manager is None:
+            self._node_manager = get_node_manager(self._server, self._params)
+        return self._node_manager
+
+    def release(self):
+        """
+        Give back the reference to the shared node manager, the last client
+        releasing it stops its topology checks.
+
+        The write-behind queue and the counter aggregator keep running
+        across ``close``, called after every request, and are flushed and
+        stopped here.
+        """
+        writer = getattr(self, "_writer", None)
+        if writer is not None:
+            self._writer = None
+            writer.close()
+        aggregator = getattr(self, "_aggregator", None)
+        if aggregator is not None:
+            self._aggregator = None
+            aggregator.close()
+
+        node_manager = getattr(self, "_node_manager", None)
+        if node_manager is not None:
+            self._node_manager = None
+            release_node_manager(node_manager)
 
     def __contains__(self, key):
         return self.has_key(key)
@@ -66,30 +233,404 @@ class DefaultClient(object):
     def get_clients( self ):
         return self.node_manager.get_clients()
 
-    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+    def _interrupted(self, client, error):
+        """
+        Report a failed command to the node manager and wrap its error.
+        """
+        self.node_manager.report_error(client, error)
+        return ConnectionInterrupted(connection=client, parent=error)
+
+    def group_by_client(self, keys, write=True):
+        """
+        Group already made keys by the node serving them.
+
+        Returns a list of ``(client, keys)`` pairs, one per node.
+        """
+        groups = {}
+        for key in keys:
+            client = self.get_client(key, write=write)
+            group = groups.get(id(client.connection_pool))
+            if group is None:
+                group = groups[id(client.connection_pool)] = (client, [])
+            group[1].append(key)
+        return list(groups.values())
+
+    @property
+    def codec_pool(self):
+        """
+        Lazy pool of codec worker threads, ``None`` if CODEC_WORKERS is not set.
+
+        zlib (and most native compressors) release the GIL while working,
+        so large values are compressed and decompressed in parallel.
+        """
+        return self._thread_pool("codec", self._codec_workers)
+
+    @property
+    def fanout_pool(self):
+        """
+        Lazy pool of threads running the pipelines of the nodes of a
+        multi-node read in parallel, ``None`` if FANOUT_WORKERS is not set.
+        """
+        return self._thread_pool("fanout", self._fanout_workers)
+
+    @property
+    def writer(self):
+        """
+        Lazy write-behind queue.
+        """
+        if self._writer is None:
+            with self._pools_lock:
+                if self._writer is None:
+                    self._writer = self._writer_cls(self, **self._writer_kwargs)
+        return self._writer
+
+    def _writes_behind(self, write_behind, client):
+        if write_behind is None:
+            write_behind = self._write_behind
+        return write_behind and client is None
+
+    def _discard_write(self, key):
+        # A direct write overrides the queued one.
+        if self._writer is not None:
+            self._writer.discard(key)
+
+    def queue_write(self, client, pipe, op, key, *args):
+        """
+        Add a write-behind operation to the pipeline of its node. Returns
+        False if it needed its own transaction and was made at once.
+        """
+        if op == SET:
+            value, ex, raw = args
+            if raw:
+                self._set_chunked(client, key, value, True, ex)
+                return False
+            if self._chunk_threshold or isinstance(value, list):
+                self._set_encoded(client, key, value, ex)
+                return False
+            pipe.set(key, value, ex=ex)
+        elif self._chunk_threshold:
+            # The chunks are handled in a transaction.
+            if op == DELETE:
+                self._delete(client, key)
+            else:
+                self._expire(client, key, args[0])
+            return False
+        elif op == DELETE:
+            pipe.delete(key)
+        elif args[0] is None:
+            pipe.persist(key)
+        else:
+            pipe.expire(key, args[0])
+        return True
+
+    @property
+    def aggregator(self):
+        """
+        Lazy aggregator of the counters.
+        """
+        if self._aggregator is None:
+            with self._pools_lock:
+                if self._aggregator is None:
+                    self._aggregator = self._aggregator_cls(self, **self._aggregator_kwargs)
+        return self._aggregator
+
+    def counter(self, key, timeout=DEFAULT_TIMEOUT, version=None, exact=False):
+        """
+        Return a counter whose increments are added up in the process and
+        flushed in batches. A counter created by a flush expires after
+        timeout. With exact, reads add the deltas not flushed yet.
+        """
+        return Counter(self, self.make_key(key, version=version), self._get_seconds(timeout), exact=exact)
+
+    @with_deadline
+    def get_counter(self, key, version=None, client=None, exact=False):
+        """
+        Value of a counter in redis, 0 if it does not exist. With exact it
+        is read from the master, replicas may lag behind.
+        """
+        key = self.make_key(key, version=version)
+
+        if client is None:
+            client = self.get_client(key, write=exact)
+
+        try:
+            value = client.get(key)
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+        return int(value) if value is not None else 0
+
+    def flush_writes(self, timeout=None):
+        """
+        Wait until the queued writes are made, returns False if some are
+        still pending after timeout seconds.
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    def _thread_pool(self, name, workers):
+        # A pool inherited from a parent process has no threads and is
+        # replaced.
+        if workers <= 0:
+            return None
+        pid, pool = self._pools.get(name, (None, None))
+        if pid != os.getpid():
+            with self._pools_lock:
+                pid, pool = self._pools.get(name, (None, None))
+                if pid != os.getpid():
+                    pool = ThreadPool(workers)
+                    self._pools[name] = (os.getpid(), pool)
+        return pool
+
+    @with_deadline
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False, tags=None,
+            write_behind=None):
         """
         Persist a value to the cache, and set an optional expiration time.
         Also supports optional nx parameter. If set to True - will use redis setnx instead of set.
+        The key is invalidated with any of the given tags by ``invalidate_tags``.
+        With write_behind, the value is queued and False returned if it was dropped.
         """
         nkey = self.make_key( key, version = version )
 
+        if timeout is True:
+            warnings.warn("Using True as timeout value, is now deprecated.", DeprecationWarning)
+            timeout = int( self._backend.default_timeout )
+
+        ex = self._get_expiry(timeout)
+
+        if self._writes_behind(write_behind, client) and not (nx or xx or tags):
+            if isinstance(value, bytes) and self._should_chunk(nkey, value):
+                return self.writer.put(SET, nkey, value, ex, True)
+            return self.writer.put(SET, nkey, self.encode(value), ex, False)
+        self._discard_write(nkey)
+
         if not client:
             client = self.get_client( nkey, write = True )
 
-        nvalue = self.encode(value)
+        # Large bytes values are chunked as they are, skipping the codecs.
+        if isinstance(value, bytes) and self._should_chunk(nkey, value):
+            result = self._set_chunked(client, nkey, value, True, ex, nx=nx, xx=xx)
+        else:
+            result = self._set_encoded(client, nkey, self.encode(value), ex, nx=nx, xx=xx)
 
-        if timeout is True:
-            warnings.warn("Using True as timeout value, is now deprecated.", DeprecationWarning)
-            timeout = int( self._backend.default_timeout )
+        if tags and result:
+            # Tagged once stored, so that pruning never drops the key, and
+            # removed again rather than left untagged.
+            try:
+                self._add_tags(nkey, tags, ex)
+            except ConnectionInterrupted:
+                try:
+                    self.delete(nkey, client=client)
+                except ConnectionInterrupted:
+                    pass
+                raise
+        return result
+
+    def _set_encoded(self, client, key, value, ex, nx=False, xx=False):
+        """
+        Store an encoded value, chunked or from a list of buffers if needed.
+        """
+        if self._should_chunk(key, value):
+            return self._set_chunked(client, key, value, False, ex, nx=nx, xx=xx)
+        if isinstance(value, list):
+            return self._set_parts(client, key, value, ex, nx=nx, xx=xx)
+        if self._chunk_threshold:
+            # A chunked value it replaces leaves its chunks behind otherwise.
+            return self._set_replacing(client, key, lambda pipe: pipe.set(key, value, ex=ex), nx=nx, xx=xx)
+
+        try:
+            return client.set( key, value, ex = ex , nx = nx, xx = xx )
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+    def _should_chunk(self, key, value):
+        return (self._chunk_threshold > 0 and
+                not isinstance(value, integer_types) and
+                _payload_size(value) > self._chunk_threshold and
+                can_chunk(key))
+
+    def _set_chunked(self, client, key, value, raw, ex, nx=False, xx=False):
+        """
+        Store value as chunks plus a manifest in a single transaction,
+        replacing the chunks of a previous chunked value.
+        """
+        chunks = split_chunks(value, self._chunk_size)
+        manifest = ChunkManifest(len(chunks), _payload_size(value), raw=raw)
+
+        def _write(pipe):
+            for chunk_key, chunk in zip(manifest.keys(key), chunks):
+                pipe.set(chunk_key, _redis_arg(chunk), ex=ex)
+            pipe.set(key, manifest.dumps(), ex=ex)
+
+        return self._set_replacing(client, key, _write, nx=nx, xx=xx)
+
+    def _set_replacing(self, client, key, write, nx=False, xx=False):
+        """
+        Store a value with ``write(pipe)`` in a transaction watching key,
+        deleting the chunks of the chunked value it replaces.
+        """
+        def _set(pipe):
+            # The head of the current value is enough to spot a manifest.
+            head = pipe.getrange(key, 0, MANIFEST_MAX_SIZE - 1)
+            if nx or xx:
+                exists = bool(head) or bool(pipe.exists(key))
+                if (nx and exists) or (xx and not exists):
+                    return False
+            previous = ChunkManifest.loads(head)
+
+            pipe.multi()
+            write(pipe)
+            if previous is not None:
+                pipe.delete(*previous.keys(key))
+            return True
 
-        if timeout == DEFAULT_TIMEOUT:
-            timeout = int( self._backend.default_timeout )
-        ex = datetime.timedelta( seconds = timeout )
         try:
-            return client.set( nkey, nvalue, ex = ex , nx = nx, xx = xx )
+            return client.transaction(_set, key, value_from_callable=True)
         except _main_exceptions as e:
-            raise ConnectionInterrupted(connection=client, parent=e)
+            raise self._interrupted(client, e)
 
+    def _set_parts(self, client, key, parts, ex, nx=False, xx=False):
+        """
+        Store a value given as a list of buffers with SET and APPENDs in
+        one transaction, so the buffers are never joined.
+        """
+        def _write(pipe):
+            pipe.set(key, _redis_arg(parts[0]), ex=ex)
+            for part in parts[1:]:
+                pipe.append(key, _redis_arg(part))
+
+        if nx or xx or self._chunk_threshold:
+            return self._set_replacing(client, key, _write, nx=nx, xx=xx)
+
+        def _set(pipe):
+            pipe.multi()
+            _write(pipe)
+            return True
+
+        try:
+            return client.transaction(_set, value_from_callable=True)
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+    def _get_chunked(self, client, key, manifest):
+        """
+        Fetch all chunks of a value in one pipeline and join them into a
+        preallocated buffer. Returns None if a chunk is gone.
+        """
+        pipe = client.pipeline(transaction=False)
+        for chunk_key in manifest.keys(key):
+            pipe.get(chunk_key)
+        try:
+            chunks = pipe.execute()
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+        value = bytearray(manifest.size)
+        offset = 0
+        for chunk in chunks:
+            if chunk is None or offset + len(chunk) > manifest.size:
+                return None
+            value[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        if offset != manifest.size:
+            return None
+
+        if manifest.raw:
+            return bytes(value)
+        # Python 2 codecs only accept str.
+        if bytes is str:
+            return bytes(value)
+        return value
+
+    def _get_manifest_keys(self, pipe, key):
+        """
+        Return the manifest key and its chunk keys, read through a watching
+        pipeline, or an empty list if the key does not exist.
+        """
+        value = pipe.get(key)
+        if value is None:
+            return []
+        manifest = ChunkManifest.loads(value)
+        if manifest is None:
+            return [key]
+        return [key] + manifest.keys(key)
+
+    def _get_expiry(self, timeout):
+        """
+        Translate a cache timeout into the ``ex`` argument of redis SET.
+        """
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self._backend.default_timeout
+        if timeout is None:
+            return None
+        return datetime.timedelta( seconds = int( timeout ) )
+
+    def _get_seconds(self, timeout):
+        """
+        Translate a cache timeout into seconds, None for no expiry and 0 to
+        expire at once.
+        """
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self._backend.default_timeout
+        if timeout is None:
+            return None
+        return max( 0, int( timeout ) )
+
+    @staticmethod
+    def _script_seconds(seconds):
+        # The scripts take -1 for no expiry.
+        return -1 if seconds is None else seconds
+
+    @with_deadline
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Set a bunch of values in the cache at once from a dict of key/value
+        pairs, with one pipeline per node.
+
+        Returns a list of keys that failed insertion.
+        """
+        if timeout is True:
+            warnings.warn("Using True as timeout value, is now deprecated.", DeprecationWarning)
+            timeout = int( self._backend.default_timeout )
+        ex = self._get_expiry(timeout)
+
+        # Start encoding everything first, large values are compressed by
+        # the codec pool while the pipelines of other nodes are running.
+        keys = {}
+        values = {}
+        for key, value in data.items():
+            nkey = self.make_key(key, version=version)
+            keys[nkey] = key
+            values[nkey] = self.encode_async(value)
+
+        failed = []
+        for client, nkeys in self.group_by_client(keys, write=True):
+            pipe = client.pipeline(transaction=False)
+            for nkey in list(nkeys):
+                try:
+                    nvalue = values[nkey].get(bound(None))
+                except AsyncTimeoutError:
+                    # Out of time budget before the value was encoded.
+                    failed.append(keys[nkey])
+                    nkeys.remove(nkey)
+                    continue
+                if self._chunk_threshold or isinstance(nvalue, list):
+                    # Written by a transaction of their own, which also
+                    # removes the chunks of the values they replace.
+                    try:
+                        self._set_encoded(client, nkey, nvalue, ex)
+                    except ConnectionInterrupted:
+                        failed.append(keys[nkey])
+                    continue
+                pipe.set(nkey, nvalue, ex=ex)
+            try:
+                pipe.execute()
+            except _main_exceptions:
+                failed.extend(keys[nkey] for nkey in nkeys)
+        return failed
+
+    @with_deadline
     def incr_version( self, key, delta = 1, version = None ):
         """
         Adds delta to the cache version for the supplied key. Returns the
@@ -101,12 +642,12 @@ class DefaultClient(object):
 
         old_key = self.make_key(key, version)
         old_client = self.get_client( old_key, write = True )
-        value = self.get( old_key, version = version, client = old_client )
+        value = self.get( old_key, version = version, client = old_client, lazy = False )
 
         try:
             ttl = old_client.ttl( old_key )
         except _main_exceptions as e:
-            raise ConnectionInterrupted( connection = old_client, parent = e )
+            raise self._interrupted(old_client, e)
 
         if value is None:
             raise ValueError("Key '%s' not found" % key)
@@ -118,6 +659,7 @@ class DefaultClient(object):
         self.delete( old_key, client = old_client )
         return version + delta
 
+    @with_deadline
     def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
         """
         Add a value to the cache, failing if the key already exists.
@@ -126,67 +668,694 @@ class DefaultClient(object):
         """
         return self.set(key, value, timeout, version=version, client=client, nx=True)
 
-    def get(self, key, default=None, version=None, client=None):
+    @with_deadline
+    def get(self, key, default=None, version=None, client=None, lazy=None):
         """
         Retrieve a value from the cache.
 
-        Returns decoded value if key is found, the default if not.
+        Returns decoded value if key is found, the default if not. With
+        ``lazy`` (default: LAZY_DECODE option) a found value is returned
+        as a LazyValue, decoded on first access.
         """
+        if lazy is None:
+            lazy = self._lazy_decode
+
         key = self.make_key( key, version = version )
 
+        hedged = client is None and self._hedger is not None
         if client is None:
             client = self.get_client( key, write = False )
 
         try:
-            value = client.get(key)
+            if hedged:
+                value = self._hedged_get(client, key)
+            else:
+                value = client.get(key)
         except _main_exceptions as e:
-            raise ConnectionInterrupted(connection=client, parent=e)
+            raise self._interrupted(client, e)
 
+        return self._load(client, key, value, default, lazy)
+
+    def _load(self, client, key, value, default=None, lazy=False):
+        """
+        Turn a raw value read at key into what the caller gets, fetching
+        its chunks if it is chunked.
+        """
         if value is None:
             return default
 
+        manifest = ChunkManifest.loads(value)
+        if manifest is not None:
+            value = self._get_chunked(client, key, manifest)
+            if value is None:
+                return default
+            if manifest.raw:
+                return LazyValue(value) if lazy else value
+
+        if lazy:
+            return LazyValue(value, self.decode)
         return self.decode(value)
 
-    def expire(self, key, timeout, version=None, client=None):
+    def run_script(self, client, name, keys=(), args=()):
+        """
+        Run a script of the registry on the node of client.
+        """
+        return self.node_manager.scripts.run(client, name, keys, args)
+
+    def run_namespace_script(self, name, namespace):
+        """
+        Run a script of the registry on the generation key of a namespace.
+        """
+        key = self.make_key(GENERATION_KEY % namespace, group=False)
+        client = self.get_client(key, write=True)
+        try:
+            return self.run_script(client, name, [key], [initial_generation()])
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+    @with_deadline
+    def namespace_generation(self, namespace):
+        """
+        Current generation of a namespace.
+        """
+        return self._namespaces.get(namespace)
+
+    @with_deadline
+    def invalidate_namespace(self, namespace):
+        """
+        Make every key of a namespace unreachable with one INCR of its
+        generation. Returns the new generation.
+        """
+        return self._namespaces.bump(namespace)
+
+    def _tag_keys(self, tags):
+        return [self.make_key(key, group=False) for tag in tags for key in tag_keys(tag, self._tag_shards)]
+
+    def _add_tags(self, nkey, tags, ex):
+        """
+        Add a made key to the sets of its tags, in the shard of its slot.
+        """
+        shard = self.node_manager.keyslot(nkey) % self._tag_shards
+        seconds = int(ex.total_seconds()) if ex else 0
+        keys = [self.make_key(tag_key(tag, shard), group=False) for tag in tags]
+        for client, group in self.group_by_client(keys, write=True):
+            try:
+                self.node_manager.scripts.run_many(
+                    client, "tag_add", [([key], [nkey, seconds]) for key in group])
+            except _main_exceptions as e:
+                raise self._interrupted(client, e)
+
+        if should_prune(self._tag_prune_rate):
+            self._prune_tag_keys(keys)
+
+    def _prune_tag_keys(self, keys):
+        """
+        Remove a sample of the members which no longer exist from tag sets.
+        """
+        for key in keys:
+            client = self.get_client(key, write=True)
+            try:
+                members = [smart_text(member) for member in client.srandmember(key, TAG_PRUNE_COUNT) or ()]
+            except _main_exceptions as e:
+                raise self._interrupted(client, e)
+            if not members:
+                continue
+            gone = [member for _, member, exists in self._iter_many(members, commands=[("EXISTS", ())])
+                    if not exists]
+            if gone:
+                try:
+                    client.srem(key, *gone)
+                except _main_exceptions as e:
+                    raise self._interrupted(client, e)
+
+    @with_deadline
+    def prune_tags(self, tags):
+        """
+        Remove a sample of the members which no longer exist from the sets
+        of the given tags.
+        """
+        self._prune_tag_keys(self._tag_keys(tags))
+
+    @with_deadline
+    def invalidate_tags(self, tags):
+        """
+        Delete every key set with any of the given tags, with one pipeline
+        per node. Returns the number of keys deleted.
+        """
+        keys = self._tag_keys(tags)
+        members = set()
+        read = {}
+        for _, key, value in self._iter_many(keys, write=True, commands=[("SMEMBERS", ())]):
+            if value:
+                read[key] = list(value)
+                members.update(smart_text(member) for member in value)
+
+        deleted = sum(self._apply_many(list(members), ("UNLINK", ())).values()) if members else 0
+        # Only the members read leave the sets: a key tagged since then was
+        # not deleted and keeps its tag.
+        for client, nkeys in self.group_by_client(read, write=True):
+            pipe = client.pipeline(transaction=False)
+            for key in nkeys:
+                pipe.srem(key, *read[key])
+            try:
+                pipe.execute()
+            except _main_exceptions as e:
+                raise self._interrupted(client, e)
+        return deleted
+
+    @with_deadline
+    def get_with_ttl(self, key, default=None, version=None, client=None):
+        """
+        Retrieve a value and its remaining time to live in one round trip.
+
+        Returns a ``(value, ttl)`` tuple, ttl as returned by ``ttl``:
+        ``(default, 0)`` if the key does not exist.
+        """
+        key = self.make_key(key, version=version)
+
+        if client is None:
+            client = self.get_client(key, write=False)
+
+        try:
+            reply = self.run_script(client, "get_with_ttl", [key])
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+        if reply is None:
+            return default, 0
+        value, ttl = reply
+        return self._load(client, key, value, default), ttl if ttl >= 0 else None
+
+    @with_deadline
+    def get_and_touch(self, key, timeout=DEFAULT_TIMEOUT, default=None, version=None, client=None):
+        """
+        Retrieve a value and give it a new expiry time in one round trip.
+        """
+        key = self.make_key(key, version=version)
+
+        if client is None:
+            client = self.get_client(key, write=True)
+
+        seconds = self._get_seconds(timeout)
+        try:
+            value = self.run_script(client, "get_and_touch", [key], [self._script_seconds(seconds)])
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+        manifest = ChunkManifest.loads(value) if self._chunk_threshold else None
+        if manifest is not None:
+            # The chunks need their expiry time updated too, or deleted
+            # with the manifest.
+            if seconds == 0:
+                value = self._load(client, key, value, default)
+                try:
+                    client.delete(*manifest.keys(key))
+                except _main_exceptions as e:
+                    raise self._interrupted(client, e)
+                return value
+            self.touch(key, timeout, client=client)
+        return self._load(client, key, value, default)
+
+    @with_deadline
+    def incr_with_ttl(self, key, delta=1, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        """
+        Add delta to an integer value, creating it with the given timeout
+        if it does not exist. Keys which already have an expiry time keep
+        it. Returns the new value.
+        """
+        key = self.make_key(key, version=version)
+
+        if client is None:
+            client = self.get_client(key, write=True)
+
+        try:
+            return self.run_script(client, "incr_with_ttl", [key],
+                                   [delta, self._script_seconds(self._get_seconds(timeout))])
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+    @with_deadline
+    def gets(self, key, default=None, version=None, client=None):
+        """
+        Retrieve a value with the version token ``cas`` compares to.
+
+        Returns a ``(value, token)`` tuple, ``(default, "")`` if the key
+        does not exist.
+        """
+        key = self.make_key(key, version=version)
+
+        if client is None:
+            client = self.get_client(key, write=True)
+
+        try:
+            value = client.get(key)
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+        return self._load(client, key, value, default), value_token(value)
+
+    @with_deadline
+    def cas(self, key, value, token, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        """
+        Set a value only if the stored one still has the version token
+        returned by ``gets``, an empty or None token meaning that the key
+        must not exist. The value is never chunked.
+
+        Returns ``True`` if the value was set, ``False`` if it changed.
+        """
+        key = self.make_key(key, version=version)
+
+        if client is None:
+            client = self.get_client(key, write=True)
+
+        nvalue = self.encode(value)
+        if isinstance(nvalue, list):
+            nvalue = b"".join(memoryview(part).tobytes() for part in nvalue)
+        try:
+            reply = self.run_script(client, "compare_and_set", [key],
+                                    [token or "", nvalue, self._script_seconds(self._get_seconds(timeout)),
+                                     CHUNK_MANIFEST])
+            # The chunks of a replaced chunked value are left alone by the script.
+            manifest = ChunkManifest.loads(reply)
+            if manifest is not None:
+                client.delete(*manifest.keys(key))
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+        return bool(reply)
+
+    def _hedged_get(self, client, key):
+        breaker = getattr(client, "breaker", None)
+        delay = breaker.latency(self._hedge_percentile) if breaker is not None else None
+        if delay is None:
+            delay = self._hedge_delay
+        return self._hedger.call(client, ("GET", key),
+                                 lambda: self.node_manager.get_backup_node(key, client), delay)
+
+    def get_stream(self, key, version=None, client=None):
+        """
+        Iterate over a chunked bytes value one chunk per round trip, so
+        the whole value is never held in memory.
+
+        Values that are not chunked bytes are yielded whole, decoded.
+        """
         key = self.make_key( key, version = version )
 
+        if client is None:
+            client = self.get_client( key, write = False )
+
+        try:
+            value = client.get(key)
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+        if value is None:
+            return
+
+        manifest = ChunkManifest.loads(value)
+        if manifest is None:
+            yield self.decode(value)
+            return
+        if not manifest.raw:
+            value = self._get_chunked(client, key, manifest)
+            if value is not None:
+                yield self.decode(value)
+            return
+
+        for chunk_key in manifest.keys(key):
+            try:
+                chunk = client.get(chunk_key)
+            except _main_exceptions as e:
+                raise self._interrupted(client, e)
+            if chunk is None:
+                raise ValueError("Chunk '%s' of key '%s' not found" % (chunk_key, key))
+            yield chunk
+
+    @with_deadline
+    def get_many(self, keys, version=None, lazy=None):
+        """
+        Retrieve many keys, with one pipeline per node.
+
+        Returns a dict mapping each found key to its decoded value, or to
+        a LazyValue with ``lazy`` (default: LAZY_DECODE option). Keys not
+        fetched and decoded by the deadline are left out.
+        """
+        if not keys:
+            return {}
+        if lazy is None:
+            lazy = self._lazy_decode
+
+        map_keys = {}
+        for key in keys:
+            map_keys[self.make_key(key, version=version)] = key
+
+        # Decoding of one node's values overlaps with the round trip to
+        # the next node when a codec pool is configured.
+        pending = []
+        for client, nkey, value in self._iter_many(map_keys):
+            if value is None:
+                continue
+            manifest = ChunkManifest.loads(value)
+            if manifest is not None:
+                value = self._get_chunked(client, nkey, manifest)
+                if value is None:
+                    continue
+                if manifest.raw:
+                    pending.append((map_keys[nkey], _Inline(LazyValue(value) if lazy else value)))
+                    continue
+            if lazy:
+                pending.append((map_keys[nkey], _Inline(LazyValue(value, self.decode))))
+            else:
+                pending.append((map_keys[nkey], self.decode_async(value)))
+
+        # Values not decoded by the deadline are left out.
+        results = {}
+        for key, result in pending:
+            try:
+                results[key] = result.get(bound(None))
+            except AsyncTimeoutError:
+                pass
+        return results
+
+    def _iter_many(self, keys, write=False, commands=None):
+        """
+        Fetch the raw values of made keys with one pipeline per node,
+        yielding ``(client, key, value)`` as each node answers.
+
+        ``commands`` is a list of ``(command, args)`` pairs of redis
+        commands to send for each key instead of GET, the value is then
+        the reply of the command, or a tuple of the replies of all.
+
+        With a fan-out pool the nodes are queried in parallel. The keys of
+        the nodes not answering by the deadline of the thread are left out.
+        """
+        groups = self.group_by_client(keys, write=write)
+        pool = self.fanout_pool
+        if pool is not None and len(groups) > 1:
+            at = current_deadline()
+            results = [(client, nkeys, pool.apply_async(self._fetch_many, (client, nkeys, at, commands)))
+                       for client, nkeys in groups]
+            for client, nkeys, result in results:
+                try:
+                    values = result.get(bound(None))
+                except AsyncTimeoutError:
+                    continue
+                except _main_exceptions as e:
+                    if expired():
+                        continue
+                    raise self._interrupted(client, e)
+                for nkey, value in zip(nkeys, values):
+                    yield client, nkey, value
+            return
+
+        for client, nkeys in groups:
+            if expired():
+                return
+            try:
+                values = self._fetch_many(client, nkeys, commands=commands)
+            except _main_exceptions as e:
+                if expired():
+                    return
+                raise self._interrupted(client, e)
+
+            for nkey, value in zip(nkeys, values):
+                yield client, nkey, value
+
+    def _fetch_many(self, client, nkeys, deadline=None, commands=None):
+        if commands is None:
+            return self._mget_many(client, nkeys, deadline)
+        with deadline_scope(deadline=deadline):
+            pipe = client.pipeline(transaction=False)
+            for nkey in nkeys:
+                for command, args in commands:
+                    pipe.execute_command(command, nkey, *args)
+            replies = pipe.execute()
+        if len(commands) == 1:
+            return replies
+        step = len(commands)
+        return [tuple(replies[i:i + step]) for i in range(0, len(replies), step)]
+
+    def _mget_many(self, client, nkeys, deadline=None):
+        """
+        Fetch the values of keys of one node, with one MGET per slot.
+        """
+        slots = {}
+        for index, nkey in enumerate(nkeys):
+            slots.setdefault(self.node_manager.keyslot(nkey), []).append(index)
+        groups = list(slots.values())
+
+        with deadline_scope(deadline=deadline):
+            pipe = client.pipeline(transaction=False)
+            for indexes in groups:
+                if len(indexes) == 1:
+                    pipe.get(nkeys[indexes[0]])
+                else:
+                    pipe.mget([nkeys[index] for index in indexes])
+            replies = pipe.execute()
+
+        values = [None] * len(nkeys)
+        for indexes, reply in zip(groups, replies):
+            if len(indexes) == 1:
+                values[indexes[0]] = reply
+            else:
+                for index, value in zip(indexes, reply):
+                    values[index] = value
+        return values
+
+    def _apply_many(self, keys, command, check=None):
+        """
+        Send a ``(command, args)`` pair to many made keys and to the chunks
+        of the chunked ones, with one pipeline per node. A ``check`` pair
+        is sent to the made keys only, after command.
+
+        Returns a dict of the keys to the replies, to pairs of the replies
+        of command and check with check.
+        """
+        commands = [command]
+        if check is not None:
+            commands.append(check)
+        if self._chunk_threshold:
+            # The head of the values is enough to spot the manifests.
+            commands.insert(0, ("GETRANGE", (0, MANIFEST_MAX_SIZE - 1)))
+
+        result = {}
+        chunk_keys = []
+        for _, nkey, replies in self._iter_many(keys, write=True, commands=commands):
+            if len(commands) == 1:
+                replies = (replies,)
+            if self._chunk_threshold:
+                manifest = ChunkManifest.loads(replies[0])
+                if manifest is not None:
+                    chunk_keys.extend(manifest.keys(nkey))
+                replies = replies[1:]
+            result[nkey] = tuple(replies) if check is not None else replies[0]
+
+        if chunk_keys:
+            for _ in self._iter_many(chunk_keys, write=True, commands=[command]):
+                pass
+        return result
+
+    def _expire_many(self, keys, seconds, version=None):
+        """
+        Set the expiry time of many keys and of their chunks to seconds,
+        None to remove it, 0 to delete them. Returns a dict of the keys to
+        whether they exist, as ``expire`` does.
+        """
+        map_keys = dict((self.make_key(key, version=version), key) for key in keys)
+        if seconds is None:
+            # PERSIST answers 0 for keys without expiry time too.
+            replies = self._apply_many(list(map_keys), ("PERSIST", ()), check=("EXISTS", ()))
+            return dict((map_keys[nkey], bool(persisted) or bool(exists))
+                        for nkey, (persisted, exists) in replies.items())
+        return dict((map_keys[nkey], bool(reply))
+                    for nkey, reply in self._apply_many(list(map_keys), ("EXPIRE", (seconds,))).items())
+
+    @with_deadline
+    def touch_many(self, keys, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Update the expiry time of many keys using timeout, with one
+        pipeline per node. Returns a dict of the keys to whether they
+        exist.
+
+        The nodes are sent their pipelines one after the other, or in
+        parallel with FANOUT_WORKERS.
+        """
+        return self._expire_many(keys, self._get_seconds(timeout), version=version)
+
+    @with_deadline
+    def expire_many(self, keys, timeout, version=None):
+        """
+        Set the expiry time of many keys to timeout seconds, None to
+        remove it, with one pipeline per node (in parallel with
+        FANOUT_WORKERS). Returns a dict of the keys to whether they exist.
+        """
+        return self._expire_many(keys, timeout, version=version)
+
+    @with_deadline
+    def persist_many(self, keys, version=None):
+        """
+        Remove the expiry time of many keys, with one pipeline per node
+        (in parallel with FANOUT_WORKERS). Returns a dict of the keys to
+        whether they exist.
+        """
+        return self._expire_many(keys, None, version=version)
+
+    @with_deadline
+    def ttl_many(self, keys, version=None):
+        """
+        Returns the remaining time to live of many keys, as ``ttl`` does,
+        with one pipeline per node (in parallel with FANOUT_WORKERS).
+        """
+        map_keys = dict((self.make_key(key, version=version), key) for key in keys)
+        return dict((map_keys[nkey], self._ttl_value(t))
+                    for _, nkey, t in self._iter_many(list(map_keys), commands=[("TTL", ())]))
+
+    @with_deadline
+    def get_many_columnar(self, keys, schema=None, version=None, as_numpy=None):
+        """
+        Retrieve many records of the same schema and decode them in one
+        pass, instead of building a dict per key.
+
+        ``schema`` is a RecordSchema or a list of ``(name, format)`` pairs,
+        by default the schema of the record serializer. Returns a tuple of
+        the found keys, in the given order, and their records as a numpy
+        structured array or a dict of column lists (see
+        RecordSchema.unpack_many). Values not matching the schema size
+        are left out.
+        """
+        schema = get_schema(schema) or getattr(self._serializer, "schema", None)
+        if schema is None:
+            raise ValueError("A record schema is required")
+
+        map_keys = [(self.make_key(key, version=version), key) for key in keys]
+        raw = dict((nkey, value) for _, nkey, value in self._iter_many([nkey for nkey, _ in map_keys]))
+
+        decompress = not isinstance(self._compressor, IdentityCompressor)
+        found = []
+        values = []
+        for nkey, key in map_keys:
+            value = raw.get(nkey)
+            if value is None:
+                continue
+            if decompress:
+                try:
+                    value = self._compressor.decompress(value)
+                except CompressorError:
+                    pass
+            if len(value) == schema.size:
+                found.append(key)
+                values.append(value)
+
+        return found, schema.unpack_many(values, as_numpy=as_numpy)
+
+    @with_deadline
+    def expire(self, key, timeout, version=None, client=None, write_behind=None):
+        """
+        Set the expiry time of a key to timeout seconds, None to remove it.
+        Return True if successful or False if the key does not exist.
+        """
+        key = self.make_key( key, version = version )
+
+        if self._writes_behind(write_behind, client):
+            return self.writer.put(EXPIRE, key, timeout)
+        self._discard_write(key)
+
         if client is None:
             client = self.get_client( key, write = True )
 
-        if client.exists(key):
-            client.expire(key, timeout)
+        return self._expire(client, key, timeout)
 
-    def touch( self, key, timeout = DEFAULT_TIMEOUT, version = None ):
+    def _expire(self, client, key, timeout):
+        if self._chunk_threshold:
+            # The chunks expire together with their manifest.
+            def _expire(pipe):
+                keys = self._get_manifest_keys(pipe, key)
+                pipe.multi()
+                for chunk_key in keys:
+                    if timeout is None:
+                        pipe.persist(chunk_key)
+                    else:
+                        pipe.expire(chunk_key, timeout)
+
+            try:
+                results = client.transaction(_expire, key)
+            except _main_exceptions as e:
+                raise self._interrupted(client, e)
+            # A reply per existing key.
+            return bool(results)
+
+        # EXPIRE leaves missing keys alone.
+        try:
+            if timeout is None:
+                return bool(client.persist(key)) or bool(client.exists(key))
+            return bool(client.expire(key, timeout))
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
+
+    @with_deadline
+    def touch( self, key, timeout = DEFAULT_TIMEOUT, version = None, client = None, write_behind = None ):
         """
         Update the key's expiry time using timeout. Return True if successful
         or False if the key does not exist.
         """
-        return self.expire( key, timeout, version = version )
+        return self.expire( key, self._get_seconds( timeout ), version = version, client = client,
+                            write_behind = write_behind )
 
     def lock(self, key, version=None, timeout=None, sleep=0.1,
-             blocking_timeout=None, client=None):
+             blocking_timeout=None, client=None, **kwargs):
+        """
+        Return a lock of key, of LOCK_CLASS. The other keyword arguments,
+        such as auto_renew, go to the lock class along with LOCK_KWARGS.
+        """
         key = self.make_key( key, version = version )
 
+        if self._lock_cls is not None and client is None:
+            options = dict(self._lock_kwargs, **kwargs)
+            return self._lock_cls(self, key, timeout=timeout, sleep=sleep,
+                                  blocking_timeout=blocking_timeout, **options)
+
         if client is None:
             client = self.get_client( key, write = True )
 
         return client.lock(key, timeout=timeout, sleep=sleep,
                            blocking_timeout=blocking_timeout)
 
-    def delete(self, key, version=None, prefix=None, client=None):
+    @with_deadline
+    def delete(self, key, version=None, prefix=None, client=None, write_behind=None):
         """
         Remove a key from the cache.
         """
         key = self.make_key( key, version = version, prefix = prefix )
 
+        if self._writes_behind(write_behind, client):
+            return self.writer.put(DELETE, key)
+        self._discard_write(key)
+
         if client is None:
             client = self.get_client( key, write = True )
 
+        return self._delete(client, key)
+
+    def _delete(self, client, key):
+        if self._chunk_threshold:
+            # The chunks are removed together with their manifest.
+            def _delete(pipe):
+                keys = self._get_manifest_keys(pipe, key)
+                pipe.multi()
+                if keys:
+                    pipe.delete(*keys)
+
+            try:
+                result = client.transaction(_delete, key)
+            except _main_exceptions as e:
+                raise self._interrupted(client, e)
+            return 1 if result and result[0] else 0
+
         try:
             return client.delete( key )
         except _main_exceptions as e:
-            raise ConnectionInterrupted(connection=client, parent=e)
+            raise self._interrupted(client, e)
 
+    @with_deadline
     def clear( self ):
         """
         Flush all cache keys.
@@ -204,6 +1373,9 @@ class DefaultClient(object):
         Decode the given value.
         """
         try:
+            if self._is_record(value):
+                # A packed record, even if its bytes happen to be digits.
+                raise ValueError
             value = int(value)
         except (ValueError, TypeError):
             try:
@@ -214,14 +1386,52 @@ class DefaultClient(object):
             value = self._serializer.loads(value)
         return value
 
+    def _is_record(self, value):
+        return (self._record_size is not None and
+                not isinstance(value, integer_types) and
+                len(value) == self._record_size)
+
+    def decode_async(self, value):
+        """
+        Decode the given value in the codec pool if it is large enough,
+        inline otherwise. Returns an object whose ``get()`` gives the result.
+        """
+        pool = self.codec_pool
+        if pool is not None and len(value) >= self._codec_min_size:
+            return pool.apply_async(self.decode, (value,))
+        return _Inline(self.decode(value))
+
+    def encode_async(self, value):
+        """
+        Encode the given value, compressing it in the codec pool if the
+        serialized value is large enough. Returns an object whose ``get()``
+        gives the result.
+        """
+        pool = self.codec_pool
+        if pool is None or not (isinstance(value, bool) or not isinstance(value, integer_types)):
+            return _Inline(self.encode(value))
+
+        # Serializers hold the GIL, only compression is worth a handoff.
+        group = type(value).__name__
+        value = self._serializer.dumps(value)
+        if isinstance(value, list):
+            return _Inline(value)
+        if len(value) >= self._codec_min_size:
+            return pool.apply_async(self._compressor.compress_group, (value, group))
+        return _Inline(self._compressor.compress_group(value, group))
+
     def encode(self, value):
         """
         Encode the given value.
         """
 
         if isinstance(value, bool) or not isinstance(value, integer_types):
+            group = type(value).__name__
             value = self._serializer.dumps(value)
-            value = self._compressor.compress(value)
+            # Out of band buffers are stored as they are.
+            if isinstance(value, list):
+                return value
+            value = self._compressor.compress_group(value, group)
             return value
 
         return value
@@ -238,13 +1448,7 @@ class DefaultClient(object):
                 # if key expired after exists check, then we get
                 # key with wrong value and ttl -1.
                 # use lua script for atomicity
-                lua = """
-                local exists = redis.call('EXISTS', KEYS[1])
-                if (exists == 1) then
-                    return redis.call('INCRBY', KEYS[1], ARGV[1])
-                else return false end
-                """
-                value = client.eval(lua, 1, key, delta)
+                value = self.run_script(client, "incr_existing", [key], [delta])
                 if value is None:
                     raise ValueError("Key '%s' not found" % key)
             except ResponseError:
@@ -260,14 +1464,15 @@ class DefaultClient(object):
                 # means, that key have expired
                 if timeout == -2:
                     raise ValueError("Key '%s' not found" % key)
-                value = self.get(key, version=version, client=client) + delta
+                value = self.get(key, version=version, client=client, lazy=False) + delta
                 self.set(key, value, version=version, timeout=timeout,
                          client=client)
         except _main_exceptions as e:
-            raise ConnectionInterrupted(connection=client, parent=e)
+            raise self._interrupted(client, e)
 
         return value
 
+    @with_deadline
     def incr(self, key, delta=1, version=None, client=None):
         """
         Add delta to value in the cache. If the key does not exist, raise a
@@ -275,6 +1480,7 @@ class DefaultClient(object):
         """
         return self._incr(key=key, delta=delta, version=version, client=client)
 
+    @with_deadline
     def decr(self, key, delta=1, version=None, client=None):
         """
         Decreace delta to value in the cache. If the key does not exist, raise a
@@ -283,6 +1489,7 @@ class DefaultClient(object):
         return self._incr(key=key, delta=-delta, version=version,
                           client=client)
 
+    @with_deadline
     def ttl(self, key, version=None, client=None):
         """
         Returns the remaining time to live of a key that has a timeout.
@@ -294,11 +1501,15 @@ class DefaultClient(object):
         if client is None:
             client = self.get_client( key, write = False )
 
-        if not client.exists(key):
-            return 0
+        try:
+            t = client.ttl(key)
+        except _main_exceptions as e:
+            raise self._interrupted(client, e)
 
-        t = client.ttl(key)
+        return self._ttl_value(t)
 
+    @staticmethod
+    def _ttl_value(t):
         if t >= 0:
             return t
         elif t == -1:
@@ -309,6 +1520,7 @@ class DefaultClient(object):
             # Should never reach here
             return None
 
+    @with_deadline
     def has_key(self, key, version=None, client=None):
         """
         Test if key exists.
@@ -321,21 +1533,83 @@ class DefaultClient(object):
         try:
             return client.exists(key)
         except _main_exceptions as e:
-            raise ConnectionInterrupted(connection=client, parent=e)
+            raise self._interrupted(client, e)
 
-    def make_key(self, key, version=None, prefix=None):
+    def make_key(self, key, version=None, prefix=None, group=True):
+        """
+        Build the redis key of a cache key, with the hash tag of its group
+        unless group is False.
+
+        Keys made with the default prefix and version are remembered, a
+        repeated key is looked up instead of built again.
+        """
         if isinstance( key, CacheKey ):
             return key
 
+        if version is None and prefix is None and group and isinstance(key, str):
+            backend = self._backend
+            made_for = (backend.key_prefix, backend.version)
+            if made_for != self._made_keys_for:
+                self._made_keys = {}
+                self._made_keys_for = made_for
+            made = self._made_keys.get(key)
+            if made is None:
+                made = self._make_key(key, None, None, True)
+                if len(self._made_keys) >= self._key_cache_size:
+                    self._made_keys = {}
+                self._made_keys[key] = made
+            return made
+
+        return self._make_key(key, version, prefix, group)
+
+    def _make_key(self, key, version, prefix, group):
         if prefix is None:
             prefix = self._backend.key_prefix
 
         if version is None:
             version = self._backend.version
 
+        if group and self._key_group is not None:
+            key_group = self._key_group(key)
+            if key_group is not None and "{" not in smart_text(key):
+                key = group_key(key, key_group, self._key_group_slots)
+
+        if self._backend.key_func is default_key_func:
+            head = self._key_heads.get((prefix, version))
+            if head is None:
+                head = self._key_heads[(prefix, version)] = "%s:%s:" % (prefix, version)
+            return CacheKey( head + (key if isinstance(key, str) else "%s" % (key,)) )
+
         return CacheKey( self._backend.key_func( key, prefix, version ) )
 
+    def stats(self):
+        """
+        Return runtime statistics of the client components.
+        """
+        stats = {
+            "pools": self.node_manager.connection_factory.pool_stats(),
+            "breakers": self.node_manager.breaker_stats(),
+            "limiters": self.node_manager.limiter_stats(),
+        }
+        if hasattr(self._compressor, "stats"):
+            stats["compressor"] = self._compressor.stats()
+        if self._hedger is not None:
+            stats["hedging"] = self._hedger.stats()
+        if self._writer is not None:
+            stats["write_behind"] = self._writer.stats()
+        if self._aggregator is not None:
+            stats["counters"] = self._aggregator.stats()
+        return stats
+
     def close( self ):
+        with self._pools_lock:
+            pools, self._pools = self._pools, {}
+        for pid, pool in pools.values():
+            if pid == os.getpid():
+                pool.close()
+        if self._hedger is not None:
+            self._hedger.close()
+
         clients = self.get_clients()
         if clients:
             for client in self.get_clients():
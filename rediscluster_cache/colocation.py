@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Co-location of related keys in the same slot.
+
+With ``KEY_GROUP_FUNCTION`` the client asks a function for the group of
+every key it builds, for example the user or tenant the key belongs to,
+and puts the group into a hash tag so that all the keys of the group
+live in one slot. Their multi-key reads are then served by one node, in
+one MGET::
+
+    "KEY_GROUP_FUNCTION": "rediscluster_cache.colocation.segment_group",
+
+A group can be spread over ``KEY_GROUP_SLOTS`` slots, chosen by the hash
+of the key, so that a large group does not make one slot hot.
+'''
+from rediscluster_cache.util import crc16, smart_bytes, smart_text
+
+# Slots the keys of a group are spread over.
+KEY_GROUP_SLOTS = 1
+
+
+def segment_group( key, separator = ":", segments = 2 ):
+    """
+    Group keys by their leading segments: "user:42:profile" and
+    "user:42:orders" are in group "user:42". Keys with fewer segments are
+    in no group.
+    """
+    parts = smart_text( key ).split( separator, segments )
+    if len( parts ) <= segments:
+        return None
+    return separator.join( parts[:segments] )
+
+
+def group_key( key, group, slots = KEY_GROUP_SLOTS ):
+    """
+    Prefix a key with the hash tag of its group.
+    """
+    if slots > 1:
+        group = "%s.%d" % ( group, crc16( smart_bytes( key ) ) % slots )
+    return "{%s}:%s" % ( group, key )
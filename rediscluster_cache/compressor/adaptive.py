@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+from rediscluster_cache.compressor.base import BaseCompressor
+from rediscluster_cache.util import load_class
+
+_timer = getattr( time, "perf_counter", time.time )
+
+ADAPTIVE_COMPRESSOR = "rediscluster_cache.compressor.zlib.ZlibCompressor"
+COMPRESS_MIN_GAIN = 0.1
+COMPRESS_MIN_SAVED_RATE = 1024 * 1024
+COMPRESS_WARMUP = 10
+COMPRESS_RESAMPLE_INTERVAL = 100
+
+# Weight of the newest sample in the moving averages.
+SMOOTHING = 0.2
+
+
+class CompressionStats( object ):
+    """
+    Learned compression behaviour of one value group.
+    """
+
+    def __init__( self ):
+        self.enabled = True
+        self.samples = 0
+        self.skipped = 0
+        self.gain = None
+        self.compress_time = None
+        self.saved = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record( self, gain, elapsed, size_in, size_out, min_gain, min_saved_rate, warmup ):
+        saved = size_in - size_out
+        if self.gain is None:
+            self.gain = gain
+            self.compress_time = elapsed
+            self.saved = saved
+        else:
+            self.gain += SMOOTHING * ( gain - self.gain )
+            self.compress_time += SMOOTHING * ( elapsed - self.compress_time )
+            self.saved += SMOOTHING * ( saved - self.saved )
+        self.samples += 1
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+        if self.samples >= warmup:
+            saved_rate = self.saved_rate()
+            self.enabled = self.gain >= min_gain and ( saved_rate is None or saved_rate >= min_saved_rate )
+
+    def saved_rate( self ):
+        """
+        Bytes saved per second spent compressing, None if too fast to tell.
+        """
+        if not self.compress_time:
+            return None
+        return self.saved / self.compress_time
+
+    def as_dict( self ):
+        return {
+            "compress": self.enabled,
+            "gain": self.gain,
+            "samples": self.samples,
+            "skipped": self.skipped,
+            "compress_time": self.compress_time,
+            "saved_rate": self.saved_rate(),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+class AdaptiveCompressor( BaseCompressor ):
+    """
+    Wraps another compressor and learns, per value group, whether
+    compression pays off.
+
+    Values of a group are compressed until ``COMPRESS_WARMUP`` samples
+    were taken. From then on compression is skipped while the average
+    gain (saved fraction of bytes) stays below ``COMPRESS_MIN_GAIN``, or
+    while compressing saves fewer than ``COMPRESS_MIN_SAVED_RATE`` bytes
+    per second it takes; every ``COMPRESS_RESAMPLE_INTERVAL`` skipped
+    values one is compressed again so that a change in the data is
+    noticed.
+
+    Values that do not reach the gain are stored uncompressed, which also
+    makes decoding them cheap: the wrapped compressor rejects them on the
+    header check instead of inflating them.
+    """
+
+    def __init__( self, options ):
+        super( AdaptiveCompressor, self ).__init__( options )
+        compressor_cls = load_class( options.get( "ADAPTIVE_COMPRESSOR", ADAPTIVE_COMPRESSOR ) )
+        self._compressor = compressor_cls( options = options )
+
+        self.min_gain = float( options.get( "COMPRESS_MIN_GAIN", COMPRESS_MIN_GAIN ) )
+        self.min_saved_rate = float( options.get( "COMPRESS_MIN_SAVED_RATE", COMPRESS_MIN_SAVED_RATE ) )
+        self.warmup = max( 1, int( options.get( "COMPRESS_WARMUP", COMPRESS_WARMUP ) ) )
+        self.resample_interval = max( 1, int( options.get( "COMPRESS_RESAMPLE_INTERVAL",
+                                                           COMPRESS_RESAMPLE_INTERVAL ) ) )
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _get_stats( self, group ):
+        stats = self._groups.get( group )
+        if stats is None:
+            with self._lock:
+                stats = self._groups.setdefault( group, CompressionStats() )
+        return stats
+
+    def _should_compress( self, stats ):
+        if stats.enabled:
+            return True
+        with self._lock:
+            stats.skipped += 1
+            return stats.skipped % self.resample_interval == 0
+
+    def compress( self, value ):
+        return self.compress_group( value, None )
+
+    def compress_group( self, value, group ):
+        stats = self._get_stats( group )
+        if not self._should_compress( stats ):
+            return value
+
+        start = _timer()
+        compressed = self._compressor.compress( value )
+        elapsed = _timer() - start
+
+        # Below the minimal length of the wrapped compressor.
+        if compressed is value:
+            return value
+
+        gain = 1.0 - float( len( compressed ) ) / len( value )
+        with self._lock:
+            stats.record( gain, elapsed, len( value ), len( compressed ),
+                          self.min_gain, self.min_saved_rate, self.warmup )
+
+        if gain < self.min_gain:
+            return value
+        return compressed
+
+    def decompress( self, value ):
+        return self._compressor.decompress( value )
+
+    def stats( self ):
+        """
+        Return the learned decision and measurements of every group.
+        """
+        with self._lock:
+            return dict( ( group or "default", stats.as_dict() )
+                         for group, stats in self._groups.items() )
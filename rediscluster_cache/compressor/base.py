@@ -8,5 +8,13 @@ class BaseCompressor(object):
     def compress(self, value):
         raise NotImplementedError
 
+    def compress_group(self, value, group):
+        """
+        Compress a value of the given group (the type name of the value
+        before serialization). Compressors that do not keep per group
+        state just compress it.
+        """
+        return self.compress(value)
+
     def decompress(self, value):
         raise NotImplementedError
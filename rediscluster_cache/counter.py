@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Counters added up in the process and flushed in batches.
+
+Increments of a counter are added to a local delta, in one of several
+stripes chosen by the thread so that threads seldom wait on the same
+lock. A background thread flushes the deltas every ``interval`` seconds,
+or as soon as ``max_pending`` counters have one, with one pipeline of
+INCRBY per node::
+
+    views = cache.counter( "views:%d" % page_id )
+    views.incr()
+    views.get()               # redis value, without the local deltas
+    views.get( exact = True ) # plus the deltas not flushed yet
+
+Pending deltas are flushed when the interpreter exits.
+'''
+import atexit
+import os
+import threading
+import weakref
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
+
+from rediscluster_cache.exceptions import ConnectionInterrupted
+from rediscluster_cache.nodemanager import TOPOLOGY_ERRORS
+
+_aggregators = weakref.WeakSet()
+
+
+class _Stripe( object ):
+    __slots__ = ( "lock", "deltas", "in_flight" )
+
+    def __init__( self ):
+        self.lock = threading.Lock()
+        self.deltas = {}
+        self.in_flight = {}
+
+
+class CounterAggregator( object ):
+    """
+    Local deltas of counters, flushed to redis by a background thread.
+    """
+
+    def __init__( self, client, stripes = 16, interval = 1.0, max_pending = 1000 ):
+        self._client = client
+        self.stripes = max( 1, stripes )
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self._timeouts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.flushes = 0
+        self.flushed = 0
+        self.failed = 0
+
+        self._closed = False
+        self._start()
+        _aggregators.add( self )
+
+    def _start( self ):
+        self._pid = os.getpid()
+        self._stripes = [_Stripe() for _ in range( self.stripes )]
+        self._wake = threading.Event()
+        self._thread = threading.Thread( target = self._run, name = "rediscluster-cache-counters" )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add( self, key, delta, seconds = None ):
+        """
+        Add delta to the local delta of a made key. seconds is the expiry
+        time given to the counter when the flush creates it.
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # The deltas of the parent are its own to flush.
+                    self._start()
+        if seconds is not None:
+            self._timeouts[key] = seconds
+        stripe = self._stripes[get_ident() % self.stripes]
+        with stripe.lock:
+            stripe.deltas[key] = stripe.deltas.get( key, 0 ) + delta
+            pending = len( stripe.deltas )
+        if pending * self.stripes >= self.max_pending:
+            self._wake.set()
+
+    def pending( self, key ):
+        """
+        Local delta of a made key, flushing or not flushed yet.
+        """
+        delta = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                delta += stripe.deltas.get( key, 0 ) + stripe.in_flight.get( key, 0 )
+        return delta
+
+    def _run( self ):
+        while not self._closed:
+            self._wake.wait( self.interval )
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Counted as failed, the deltas are kept for the next flush.
+                pass
+
+    def _take( self ):
+        deltas = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                # In flight as soon as taken, for the exact reads.
+                taken, stripe.deltas = stripe.deltas, {}
+                for key, delta in taken.items():
+                    stripe.in_flight[key] = stripe.in_flight.get( key, 0 ) + delta
+            for key, delta in taken.items():
+                deltas[key] = deltas.get( key, 0 ) + delta
+        self._flushed( [key for key, delta in deltas.items() if not delta] )
+        # Deltas and expiry times of the counters flushed, the expiry times
+        # are given again by the next increments.
+        timeouts = dict( ( key, self._timeouts.pop( key, None ) ) for key in deltas )
+        return dict( ( key, delta ) for key, delta in deltas.items() if delta ), timeouts
+
+    def _restore( self, timeouts ):
+        # The deltas still in flight were not flushed, back to their stripes.
+        restored = set()
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key, delta in stripe.in_flight.items():
+                    stripe.deltas[key] = stripe.deltas.get( key, 0 ) + delta
+                    restored.add( key )
+                stripe.in_flight = {}
+        for key in restored:
+            if timeouts.get( key ) is not None:
+                self._timeouts.setdefault( key, timeouts[key] )
+
+    def flush( self ):
+        """
+        Send the local deltas to redis, with one pipeline per node.
+        Returns the number of counters updated.
+        """
+        with self._flush_lock:
+            deltas, timeouts = self._take()
+            if not deltas:
+                return 0
+            try:
+                return self._flush( deltas, timeouts )
+            finally:
+                self._restore( timeouts )
+
+    def _flush( self, deltas, timeouts ):
+        client = self._client
+        self.flushes += 1
+        flushed = 0
+        for node, keys in client.group_by_client( deltas, write = True ):
+            plain = [key for key in keys if timeouts.get( key ) is None]
+            expiring = [key for key in keys if timeouts.get( key ) is not None]
+            try:
+                if plain:
+                    pipe = node.pipeline( transaction = False )
+                    for key in plain:
+                        pipe.incrby( key, deltas[key] )
+                    flushed += self._applied( node, plain, pipe.execute( raise_on_error = False ) )
+                    plain = []
+                if expiring:
+                    results = client.node_manager.scripts.run_many(
+                        node, "incr_with_ttl", [( [key], [deltas[key], timeouts[key]] ) for key in expiring],
+                        raise_on_error = False )
+                    flushed += self._applied( node, expiring, results )
+            except Exception as e:
+                # Whether redis applied them is not known, they are left in
+                # flight and sent again by the next flush.
+                self.failed += len( plain ) + len( expiring )
+                if not isinstance( e, ConnectionInterrupted ):
+                    client.node_manager.report_error( node, e )
+        self.flushed += flushed
+        return flushed
+
+    def _applied( self, node, keys, results ):
+        """
+        Take the keys whose increment redis applied out of flight, returns
+        their number. Keys answered with an error reply are left in flight
+        when the error is about the topology, dropped otherwise.
+        """
+        applied = []
+        dropped = []
+        for key, result in zip( keys, results ):
+            if not isinstance( result, Exception ):
+                applied.append( key )
+                continue
+            self.failed += 1
+            if str( result ).startswith( TOPOLOGY_ERRORS ):
+                self._client.node_manager.report_error( node, result )
+            else:
+                # Such as WRONGTYPE, sending it again would not help.
+                dropped.append( key )
+        self._flushed( applied + dropped )
+        return len( applied )
+
+    def _flushed( self, keys ):
+        # Counted by redis.
+        for stripe in self._stripes:
+            with stripe.lock:
+                for key in keys:
+                    stripe.in_flight.pop( key, None )
+
+    def close( self ):
+        """
+        Flush the pending deltas and stop the flushing thread.
+        """
+        if self._pid != os.getpid():
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join( 1 )
+        self.flush()
+
+    def stats( self ):
+        return {
+            "counters": sum( len( stripe.deltas ) for stripe in self._stripes ),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failed": self.failed,
+        }
+
+
+class Counter( object ):
+    """
+    Handle of a counter aggregated by the client.
+    """
+    __slots__ = ( "_client", "key", "_seconds", "exact" )
+
+    def __init__( self, client, key, seconds = None, exact = False ):
+        self._client = client
+        self.key = key
+        self._seconds = seconds
+        self.exact = exact
+
+    def incr( self, delta = 1 ):
+        self._client.aggregator.add( self.key, delta, self._seconds )
+
+    def decr( self, delta = 1 ):
+        self._client.aggregator.add( self.key, -delta, self._seconds )
+
+    def get( self, exact = None ):
+        """
+        Value of the counter in redis, plus the deltas of the process not
+        flushed yet with exact, by default the mode of the counter.
+        """
+        if exact is None:
+            exact = self.exact
+        value = self._client.get_counter( self.key, exact = exact )
+        if exact:
+            value += self._client.aggregator.pending( self.key )
+        return value
+
+    def flush( self ):
+        return self._client.aggregator.flush()
+
+
+@atexit.register
+def _flush_on_exit():
+    for aggregator in list( _aggregators ):
+        try:
+            aggregator.close()
+        except Exception:
+            pass
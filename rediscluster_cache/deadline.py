@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+End to end time budgets of cache operations.
+
+A deadline is an absolute ``time.time()`` set for the current thread by
+``deadline_scope``, or by the ``deadline``/``timeout_budget`` arguments of
+the cache operations. Commands are not sent once it passed, and socket
+timeouts, pool and limiter waits and fan-out joins are cut to the time
+left::
+
+    with deadline_scope( timeout_budget = 0.05 ):
+        cache.get_many( keys )
+'''
+import contextlib
+import functools
+import threading
+import time
+
+from redis.exceptions import TimeoutError
+
+_local = threading.local()
+
+
+class DeadlineExceeded( TimeoutError ):
+    """
+    Raised instead of sending a command after the deadline.
+    """
+
+
+def current():
+    """
+    Return the deadline of the current thread, None if there is none.
+    """
+    return getattr( _local, "deadline", None )
+
+
+def remaining():
+    """
+    Return the seconds left until the deadline, None without deadline.
+    """
+    deadline = getattr( _local, "deadline", None )
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def expired():
+    deadline = getattr( _local, "deadline", None )
+    return deadline is not None and time.time() >= deadline
+
+
+def check():
+    """
+    Raise ``DeadlineExceeded`` if the deadline passed.
+    """
+    if expired():
+        raise DeadlineExceeded( "Deadline exceeded" )
+
+
+def bound( timeout ):
+    """
+    Cut a timeout in seconds, None meaning no timeout, to the time left.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max( left, 0 )
+    return left if timeout is None else min( timeout, left )
+
+
+@contextlib.contextmanager
+def deadline_scope( deadline = None, timeout_budget = None ):
+    """
+    Run the block with a deadline, given as an absolute ``time.time()`` or
+    as a budget of seconds from now. A nested scope never extends the
+    deadline of an outer one.
+    """
+    previous = current()
+    at = previous
+    if deadline is not None:
+        at = deadline if at is None else min( at, deadline )
+    if timeout_budget is not None:
+        budget_at = time.time() + timeout_budget
+        at = budget_at if at is None else min( at, budget_at )
+    _local.deadline = at
+    try:
+        yield at
+    finally:
+        _local.deadline = previous
+
+
+def with_deadline( method ):
+    """
+    Let method take ``deadline`` and ``timeout_budget`` keyword arguments,
+    running it in a ``deadline_scope`` of these.
+    """
+    @functools.wraps( method )
+    def _decorator( *args, **kwargs ):
+        deadline = kwargs.pop( "deadline", None )
+        timeout_budget = kwargs.pop( "timeout_budget", None )
+        if deadline is None and timeout_budget is None:
+            return method( *args, **kwargs )
+        with deadline_scope( deadline, timeout_budget ):
+            return method( *args, **kwargs )
+    return _decorator
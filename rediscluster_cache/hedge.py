@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Hedged reads: when a node is slow to answer a read, the same read is sent
+to another node serving the slot and the first reply is used.
+'''
+import os
+import socket
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+from rediscluster_cache.deadline import DeadlineExceeded, bound, current, deadline_scope, expired
+from rediscluster_cache.pool import _guarded
+
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue
+
+# Seconds between two looks at the reply of primary once a backup read is
+# in flight.
+POLL_INTERVAL = 0.001
+
+
+def _left( timeout, end ):
+    """
+    Cut a timeout in seconds, None meaning no timeout, to the time left
+    until end.
+    """
+    if end is None:
+        return timeout
+    left = max( end - time.time(), 0 )
+    return left if timeout is None else min( timeout, left )
+
+
+class HedgeBudget( object ):
+    """
+    Token bucket keeping hedges under a share of the reads. Every read
+    adds ``ratio`` token, a hedge takes one.
+    """
+
+    def __init__( self, ratio, burst = 10 ):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float( burst )
+        self._lock = threading.Lock()
+
+    def record( self ):
+        with self._lock:
+            self._tokens = min( self.burst, self._tokens + self.ratio )
+
+    def take( self ):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Hedger( object ):
+    """
+    Sends the backup reads to a pool of worker threads, while the primary
+    read waits on the thread of the caller.
+    """
+
+    def __init__( self, workers = 16, budget = 0.05 ):
+        self.workers = workers
+        self.budget = HedgeBudget( budget )
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.hedged = 0
+        self.backup_wins = 0
+
+    @property
+    def pool( self ):
+        # A pool inherited from a parent process has no threads.
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPool( self.workers )
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _submit( self, node, args, replies ):
+        deadline = current()
+
+        def call():
+            # Under the deadline of the caller. READONLY only holds for the
+            # connection it is sent on, it goes with the read to allow it
+            # on a replica.
+            with deadline_scope( deadline ):
+                try:
+                    pipe = node.pipeline( transaction = False )
+                    pipe.execute_command( "READONLY" )
+                    pipe.execute_command( *args )
+                    value = pipe.execute( raise_on_error = False )[1]
+                    if isinstance( value, Exception ):
+                        raise value
+                    replies.put( ( True, value ) )
+                except Exception as e:
+                    replies.put( ( False, e ) )
+        self.pool.apply_async( call )
+
+    def call( self, primary, args, get_backup, delay ):
+        """
+        Send the command args to primary and return its reply. If primary
+        has not answered after delay seconds and the budget allows it, the
+        command is also sent from a worker thread to the node returned by
+        ``get_backup`` and the first successful reply is returned.
+
+        Every wait is bounded by the socket timeout of primary, cut to the
+        deadline of the caller.
+        """
+        self.reads += 1
+        self.budget.record()
+        return _guarded( primary, self._call, primary, args, get_backup, delay )
+
+    def _call( self, primary, args, get_backup, delay ):
+        pool = primary.connection_pool
+        connection = pool.get_connection( args[0] )
+        try:
+            return self._read( primary, connection, args, get_backup, delay )
+        except ( ConnectionError, TimeoutError, socket.timeout ):
+            connection.disconnect()
+            raise
+        finally:
+            pool.release( connection )
+
+    def _read( self, primary, connection, args, get_backup, delay ):
+        connection.send_command( *args )
+        timeout = bound( connection.socket_timeout )
+        end = None if timeout is None else time.time() + timeout
+
+        if connection.can_read( _left( delay, end ) ):
+            return primary.parse_response( connection, args[0] )
+        backup = get_backup()
+        if backup is None or not self.budget.take():
+            return primary.parse_response( connection, args[0] )
+        self.hedged += 1
+        replies = Queue()
+        self._submit( backup, args, replies )
+
+        while True:
+            try:
+                ok, value = replies.get_nowait()
+            except Empty:
+                pass
+            else:
+                if not ok:
+                    # Only primary is left.
+                    return primary.parse_response( connection, args[0] )
+                self.backup_wins += 1
+                # The reply of primary is still to come.
+                connection.disconnect()
+                return value
+            left = _left( None, end )
+            if left is not None and left <= 0:
+                if expired():
+                    raise DeadlineExceeded( "Deadline exceeded waiting for a hedged read" )
+                raise TimeoutError( "Timeout reading from socket" )
+            if connection.can_read( _left( POLL_INTERVAL, end ) ):
+                try:
+                    return primary.parse_response( connection, args[0] )
+                except Exception as e:
+                    return self._backup_reply( replies, end, e )
+
+    def _backup_reply( self, replies, end, error ):
+        # primary failed, the backup may still answer in time.
+        try:
+            ok, value = replies.get( timeout = _left( None, end ) )
+        except Empty:
+            raise error
+        if not ok:
+            raise error
+        self.backup_wins += 1
+        return value
+
+    def stats( self ):
+        return {
+            "reads": self.reads,
+            "hedged": self.hedged,
+            "backup_wins": self.backup_wins,
+        }
+
+    def close( self ):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
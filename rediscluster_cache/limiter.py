@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Admission control: a limit on the commands in flight on one node.
+'''
+import threading
+import time
+
+from redis.exceptions import ConnectionError
+
+from rediscluster_cache.deadline import bound
+
+# Weight of a new latency in the smoothed latency of a node.
+SMOOTHING = 0.05
+
+
+class AdmissionRejected( ConnectionError ):
+    """
+    Raised when a command did not get a slot of its node in time.
+    """
+
+
+class ConcurrencyLimiter( object ):
+    """
+    Adaptive limit of the commands in flight on one node.
+
+    Commands over the limit wait up to ``queue_timeout`` seconds for a slot
+    and are rejected after that. With ``adaptive`` the limit grows by one
+    for every limit commands answered in time, and shrinks by ``backoff``
+    when a command fails or takes more than ``latency_target`` seconds,
+    ``tolerance`` times the smoothed latency of the node by default. It
+    stays between ``min_limit`` and ``max_limit``.
+
+    Enable it with::
+
+        "CONCURRENCY_LIMITER_CLASS": "rediscluster_cache.limiter.ConcurrencyLimiter",
+        "CONCURRENCY_LIMITER_KWARGS": {"limit": 32, "max_limit": 128, "queue_timeout": 0.05},
+    """
+
+    def __init__( self, name = None, limit = 32, min_limit = 4, max_limit = 256, queue_timeout = 0.05,
+                  adaptive = True, latency_target = None, tolerance = 2.0, backoff = 0.9 ):
+        self.name = name
+        self.limit = float( limit )
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.tolerance = tolerance
+        self.backoff = backoff
+
+        self._condition = threading.Condition()
+        self._latency = None
+        self._last_decrease = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def acquire( self ):
+        """
+        Take a slot for a command, raises ``AdmissionRejected`` if none is
+        free within ``queue_timeout`` seconds, or before the deadline.
+        """
+        with self._condition:
+            if self.in_flight >= int( self.limit ):
+                deadline = time.time() + bound( self.queue_timeout )
+                while self.in_flight >= int( self.limit ):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected( "Too many commands in flight on %s" % self.name )
+                    self._condition.wait( remaining )
+            self.in_flight += 1
+            self.admitted += 1
+
+    def cancel( self ):
+        """
+        Give back a slot without accounting for its command, which was not
+        sent or ran out of the caller's time budget.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def release( self, latency, failed = False ):
+        """
+        Give back the slot of a command answered, or failed, after latency
+        seconds.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                self._adapt( latency, failed )
+            self._condition.notify()
+
+    def _adapt( self, latency, failed ):
+        if self._latency is None:
+            self._latency = latency
+        target = self.latency_target or self.tolerance * self._latency
+        if failed or latency > target:
+            # Shrink at most once per smoothed latency, a burst of slow
+            # replies is one overload.
+            now = time.time()
+            if now - self._last_decrease >= self._latency:
+                self.limit = max( self.min_limit, self.limit * self.backoff )
+                self._last_decrease = now
+        else:
+            self.limit = min( self.max_limit, self.limit + 1.0 / self.limit )
+        if not failed:
+            self._latency += SMOOTHING * ( latency - self._latency )
+
+    def after_fork( self ):
+        """
+        Reset the slots in a forked process, the commands the threads of
+        the parent had in flight are not in flight here.
+        """
+        self._condition = threading.Condition()
+        self.in_flight = 0
+
+    def stats( self ):
+        with self._condition:
+            return {
+                "limit": int( self.limit ),
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "latency": self._latency,
+            }
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Cluster lock woken on release instead of polling.
+
+The lock key, its wake list and its fencing counter share a hash tag, so
+that the scripts of the lock run on one node. A waiter which finds the
+lock taken blocks on BLPOP of the wake list, and the release pushes one
+token on it: the next waiter tries again at once instead of after
+``sleep`` seconds. A waiter also wakes up when the lease of the holder
+runs out, or every ``WAKE_INTERVAL`` seconds.
+
+Each acquire returns a new ``fencing_token``, increasing for the lock, to
+be sent along with the writes it guards so that a holder whose lease ran
+out can be told apart. With ``auto_renew`` a background thread gives the
+lock a full lease every third of it while it is held.
+
+Threads of a process wait their turn on a local lock first, so that only
+one thread per process contends on redis::
+
+    with cache.lock( "report", timeout = 10, auto_renew = True ) as lock:
+        store.write( report, fence = lock.fencing_token )
+'''
+import math
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from redis.client import StrictRedis
+from redis.exceptions import LockError, ResponseError
+
+from rediscluster_cache.chunking import can_chunk, hash_tag
+from rediscluster_cache.deadline import bound
+
+# Longest wait on the wake list, in seconds.
+WAKE_INTERVAL = 1
+
+# Milliseconds a wake token left by a release waits for a waiter.
+WAKE_TTL = 5000
+
+# Shortest wait on the wake list, in seconds: BLPOP rounds a shorter one
+# down to 0, which waits forever.
+MIN_WAKE_WAIT = 0.01
+
+_local_locks = weakref.WeakValueDictionary()
+_local_locks_lock = threading.Lock()
+
+
+class _LocalLock( object ):
+    """
+    Lock of the threads of the process, with a timeout on Python 2 too.
+    """
+
+    def __init__( self ):
+        self._condition = threading.Condition()
+        self._held = False
+
+    def acquire( self, blocking = True, timeout = None ):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._held:
+                if not blocking:
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait( remaining )
+            self._held = True
+            return True
+
+    def release( self ):
+        with self._condition:
+            self._held = False
+            self._condition.notify()
+
+
+def local_lock( name ):
+    """
+    Local lock shared by the cluster locks of name in this process.
+    """
+    # Locks held by the threads of a parent are not held in a fork.
+    key = ( os.getpid(), name )
+    with _local_locks_lock:
+        lock = _local_locks.get( key )
+        if lock is None:
+            lock = _local_locks[key] = _LocalLock()
+        return lock
+
+
+class ClusterLock( object ):
+    """
+    Lock of a made key with wake-up on release, fencing tokens and lease
+    renewal. ``timeout`` is the lease in seconds, None for none.
+    """
+    # Redis before 6.0 only takes whole seconds for the BLPOP timeout.
+    integer_timeouts = False
+
+    def __init__( self, client, name, timeout = None, sleep = 0.1, blocking = True,
+                  blocking_timeout = None, auto_renew = False ):
+        self._client = client
+        self.name = name
+        self.timeout = timeout
+        self.sleep = sleep
+        self.blocking = blocking
+        self.blocking_timeout = blocking_timeout
+        self.auto_renew = auto_renew
+
+        if can_chunk( name ):
+            tag = hash_tag( name )
+            self.wake_key = "{%s}:lock-wake:%s" % ( tag, name )
+            self.fence_key = "{%s}:lock-fence:%s" % ( tag, name )
+        else:
+            # No key can share the slot of name: no fencing tokens, and
+            # waiters poll.
+            self.wake_key = self.fence_key = None
+
+        self.token = None
+        self.fencing_token = None
+        self.lost = False
+        self._local = local_lock( name )
+        self._renewer = None
+        self._stop_renewing = None
+
+    def __enter__( self ):
+        if self.acquire():
+            return self
+        raise LockError( "Unable to acquire lock within the time specified" )
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        self.release()
+
+    def _node( self ):
+        return self._client.get_client( self.name, write = True )
+
+    def _keys( self, *keys ):
+        return [self.name] + [key for key in keys if key is not None]
+
+    def _lease( self ):
+        return int( self.timeout * 1000 ) if self.timeout else 0
+
+    def acquire( self, blocking = None, blocking_timeout = None ):
+        """
+        Take the lock, waiting up to blocking_timeout seconds if blocking.
+        Returns whether it was taken.
+        """
+        if blocking is None:
+            blocking = self.blocking
+        if blocking_timeout is None:
+            blocking_timeout = self.blocking_timeout
+        deadline = None if blocking_timeout is None else time.time() + blocking_timeout
+
+        if not self._local.acquire( blocking, blocking_timeout ):
+            return False
+        try:
+            acquired = self._acquire( blocking, deadline )
+        except Exception:
+            self._local.release()
+            raise
+        if not acquired:
+            self._local.release()
+            return False
+        if self.auto_renew and self.timeout:
+            self._start_renewing()
+        return True
+
+    def _acquire( self, blocking, deadline ):
+        token = uuid.uuid1().hex
+        lease = self._lease()
+        while True:
+            node = self._node()
+            acquired, value = self._client.run_script( node, "lock_acquire", self._keys( self.fence_key ),
+                                                       [token, lease] )
+            if acquired:
+                self.token = token
+                self.fencing_token = int( value ) if self.fence_key is not None else None
+                self.lost = False
+                return True
+            if not blocking:
+                return False
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._wait( node, remaining, int( value ) )
+
+    def _wait( self, node, remaining, pttl ):
+        # Until the release of the holder, or the end of its lease.
+        wait = WAKE_INTERVAL
+        if pttl >= 0:
+            wait = min( wait, pttl / 1000.0 )
+        if remaining is not None:
+            wait = min( wait, remaining )
+        socket_timeout = node.connection_pool.connection_kwargs.get( "socket_timeout" )
+        if socket_timeout is not None:
+            # Answered before the socket times out.
+            wait = min( wait, socket_timeout / 2.0 )
+        wait = max( bound( wait ), MIN_WAKE_WAIT )
+        if self.wake_key is None:
+            time.sleep( min( self.sleep, wait ) )
+            return
+        try:
+            self._blpop( node, wait )
+        except Exception:
+            time.sleep( min( self.sleep, wait ) )
+
+    def _blpop( self, node, wait ):
+        # A plain client: the blocking wait is not a slow call for the
+        # circuit breaker, nor a long one for the concurrency limiter.
+        client = StrictRedis( connection_pool = node.connection_pool )
+        if not ClusterLock.integer_timeouts:
+            try:
+                return client.blpop( [self.wake_key], wait )
+            except ResponseError as e:
+                if "timeout" not in str( e ):
+                    raise
+                ClusterLock.integer_timeouts = True
+        return client.blpop( [self.wake_key], max( 1, int( math.ceil( wait ) ) ) )
+
+    def locked( self ):
+        """
+        Whether the lock is held, by anyone.
+        """
+        return bool( self._node().exists( self.name ) )
+
+    def owned( self ):
+        """
+        Whether the lock is held with the token of this instance.
+        """
+        if self.token is None:
+            return False
+        value = self._node().get( self.name )
+        return value is not None and value.decode( "utf-8" ) == self.token
+
+    def release( self ):
+        """
+        Release the lock and wake the next waiter.
+        """
+        if self.token is None:
+            raise LockError( "Cannot release an unlocked lock" )
+        self._stop_renewal()
+        token, self.token = self.token, None
+        try:
+            released = self._client.run_script( self._node(), "lock_release", self._keys( self.wake_key ),
+                                                [token, WAKE_TTL] )
+        finally:
+            self._local.release()
+        if not released:
+            raise LockError( "Cannot release a lock that's no longer owned" )
+
+    def extend( self, additional_time ):
+        """
+        Add additional_time seconds to the lease of the lock.
+        """
+        return self._extend( int( additional_time * 1000 ), True )
+
+    def renew( self ):
+        """
+        Give the lock a full lease again.
+        """
+        return self._extend( self._lease(), False )
+
+    def _extend( self, milliseconds, add ):
+        if self.token is None:
+            raise LockError( "Cannot extend an unlocked lock" )
+        if self.timeout is None:
+            raise LockError( "Cannot extend a lock with no timeout" )
+        if not self._client.run_script( self._node(), "lock_extend", [self.name],
+                                        [self.token, milliseconds, 1 if add else 0] ):
+            raise LockError( "Cannot extend a lock that's no longer owned" )
+        return True
+
+    def _start_renewing( self ):
+        self._stop_renewing = stop = threading.Event()
+        self._renewer = threading.Thread( target = self._renew, args = ( stop, ),
+                                          name = "rediscluster-cache-lock-renewer" )
+        self._renewer.daemon = True
+        self._renewer.start()
+
+    def _renew( self, stop ):
+        while not stop.wait( self.timeout / 3.0 ):
+            try:
+                self.renew()
+            except LockError:
+                # The lease ran out and the lock may have another holder.
+                self.lost = True
+                return
+            except Exception:
+                # Tried again at the next third of the lease.
+                pass
+
+    def _stop_renewal( self ):
+        if self._stop_renewing is not None:
+            self._stop_renewing.set()
+            if self._renewer is not threading.current_thread():
+                self._renewer.join( 1 )
+            self._stop_renewing = self._renewer = None
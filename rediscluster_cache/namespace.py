@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Namespaces: groups of keys invalidated at once.
+
+The keys of a namespace include its current generation, a counter stored
+in redis and cached by each client for ``NAMESPACE_TIMEOUT`` seconds.
+Invalidating a namespace is a single INCR of the generation: the keys of
+the old generation are no longer reachable and age out by their TTL::
+
+    users = cache.namespace( "users" )
+    users.set( 42, user )
+    users.invalidate()
+
+Other processes see a new generation within ``NAMESPACE_TIMEOUT``.
+'''
+import threading
+import time
+
+from rediscluster_cache.exceptions import ConnectionInterrupted
+
+# Seconds a client trusts the generation of a namespace it read.
+NAMESPACE_TIMEOUT = 1
+
+GENERATION_KEY = "namespace:%s"
+
+
+def initial_generation():
+    """
+    Generation of a namespace missing from redis: milliseconds since the
+    epoch, so that a generation evicted by redis is not used again.
+    """
+    return int( time.time() * 1000 )
+
+
+class NamespaceGenerations( object ):
+    """
+    Local cache of the generations of namespaces, read from and bumped on
+    redis by the client.
+    """
+
+    def __init__( self, client, timeout = NAMESPACE_TIMEOUT ):
+        self._client = client
+        self.timeout = timeout
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get( self, name ):
+        cached = self._generations.get( name )
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+        try:
+            generation = self._client.run_namespace_script( "namespace_generation", name )
+        except ConnectionInterrupted:
+            # Better a stale generation than no cache at all.
+            if cached is None:
+                raise
+            return cached[0]
+        return self._store( name, generation )
+
+    def bump( self, name ):
+        generation = self._client.run_namespace_script( "namespace_bump", name )
+        return self._store( name, generation )
+
+    def _store( self, name, generation ):
+        generation = int( generation )
+        with self._lock:
+            self._generations[name] = ( generation, time.time() + self.timeout )
+        return generation
+
+
+def _key_method( name, return_value = None ):
+    def method( self, key, *args, **kwargs ):
+        try:
+            return getattr( self._cache, name )( self.make_key( key ), *args, **kwargs )
+        except ConnectionInterrupted as e:
+            return self._omit( e, return_value )
+    method.__name__ = name
+    return method
+
+
+def _keys_method( name, return_value = None ):
+    def method( self, keys, *args, **kwargs ):
+        try:
+            generation = self.generation
+            map_keys = dict( ( self.make_key( key, generation ), key ) for key in keys )
+            result = getattr( self._cache, name )( list( map_keys ), *args, **kwargs )
+        except ConnectionInterrupted as e:
+            return self._omit( e, return_value )
+        return dict( ( map_keys[key], value ) for key, value in result.items() )
+    method.__name__ = name
+    return method
+
+
+class Namespace( object ):
+    """
+    View of a cache whose keys live in the namespace ``name``.
+    """
+
+    def __init__( self, cache, name ):
+        self._cache = cache
+        self.name = name
+
+    @property
+    def generation( self ):
+        return self._cache.client.namespace_generation( self.name )
+
+    def make_key( self, key, generation = None ):
+        if generation is None:
+            generation = self.generation
+        return "%s:%d:%s" % ( self.name, generation, key )
+
+    def invalidate( self ):
+        """
+        Make every key of the namespace unreachable, returns the new
+        generation.
+        """
+        return self._cache.invalidate_namespace( self.name )
+
+    def _omit( self, error, return_value ):
+        # The generation could not be read, the cache decorators did not
+        # see the error.
+        if self._cache._ignore_exceptions:
+            return return_value
+        raise error.parent
+
+    def get( self, key, default = None, *args, **kwargs ):
+        try:
+            return self._cache.get( self.make_key( key ), default, *args, **kwargs )
+        except ConnectionInterrupted as e:
+            return self._omit( e, default )
+
+    set = _key_method( "set" )
+    add = _key_method( "add" )
+    delete = _key_method( "delete" )
+    incr = _key_method( "incr" )
+    decr = _key_method( "decr" )
+    has_key = _key_method( "has_key", False )
+    ttl = _key_method( "ttl" )
+    touch = _key_method( "touch", False )
+    expire = _key_method( "expire", False )
+    get_with_ttl = _key_method( "get_with_ttl", ( None, 0 ) )
+    get_and_touch = _key_method( "get_and_touch" )
+    incr_with_ttl = _key_method( "incr_with_ttl" )
+    gets = _key_method( "gets", ( None, None ) )
+    cas = _key_method( "cas", False )
+
+    get_many = _keys_method( "get_many", {} )
+    touch_many = _keys_method( "touch_many", {} )
+    expire_many = _keys_method( "expire_many", {} )
+    persist_many = _keys_method( "persist_many", {} )
+    ttl_many = _keys_method( "ttl_many", {} )
+
+    def set_many( self, data, *args, **kwargs ):
+        try:
+            generation = self.generation
+            map_keys = dict( ( self.make_key( key, generation ), key ) for key in data )
+            failed = self._cache.set_many( dict( ( nkey, data[key] ) for nkey, key in map_keys.items() ),
+                                           *args, **kwargs )
+        except ConnectionInterrupted as e:
+            return self._omit( e, list( data ) )
+        return [map_keys[key] for key in failed]
+
+    def delete_many( self, keys, *args, **kwargs ):
+        try:
+            generation = self.generation
+            return self._cache.delete_many( [self.make_key( key, generation ) for key in keys], *args, **kwargs )
+        except ConnectionInterrupted as e:
+            return self._omit( e, None )
+
+    def __contains__( self, key ):
+        return self.has_key( key )
@@ -7,17 +7,24 @@ Created on 2019年7月25日
 @author: leon-sk
 '''
 import logging
+import os
 import random
 import socket
-import thread
 import threading
 import time
+from multiprocessing.pool import ThreadPool
 
-from redis._compat import b, unicode, bytes, long, basestring
-from redis.exceptions import ConnectionError
+from redis._compat import b, unicode, bytes, long, basestring, nativestr
+from redis.exceptions import ConnectionError, ResponseError
 
+from rediscluster_cache.breaker import CircuitBreakerOpen
+from rediscluster_cache.deadline import DeadlineExceeded, expired
+from rediscluster_cache.limiter import AdmissionRejected
 from rediscluster_cache.pool import get_connection_factory
-from rediscluster_cache.util import crc16
+from rediscluster_cache.scripts import ScriptRegistry
+from rediscluster_cache.slotmap import read_snapshot, write_snapshot
+from rediscluster_cache.topology import SharedTopology
+from rediscluster_cache.util import crc16, load_class
 
 # Compatibility with redis-py 2.10.6+
 try:
@@ -26,6 +33,16 @@ try:
 except ImportError:
     _main_exceptions = ( ConnectionError, socket.timeout )
 
+# Error replies redirecting a command to another node: the slot map is
+# reloaded even when the configuration epochs did not change.
+REDIRECT_ERRORS = ( "MOVED ", "ASK " )
+
+# Error replies meaning the slot map of the client is outdated.
+TOPOLOGY_ERRORS = REDIRECT_ERRORS + ( "CLUSTERDOWN", )
+
+# Keys whose slot is remembered, the cache is emptied when full.
+KEYSLOT_CACHE_SIZE = 65536
+
 
 class NodeManager( object ):
     '''
@@ -45,49 +62,163 @@ class NodeManager( object ):
         if not isinstance( self._server, ( list, tuple, set ) ):
             self._server = self._server.split( "," )
         self.check_interval = self._options.get( "CHECK_INTERVAL", 300 )
+        self.min_refresh_interval = float( self._options.get( "MIN_REFRESH_INTERVAL", 1 ) )
+        self.refresh_backoff = float( self._options.get( "REFRESH_BACKOFF", 0.5 ) )
+        self.refresh_backoff_max = float( self._options.get( "REFRESH_BACKOFF_MAX", 30 ) )
+        self.startup_workers = int( self._options.get( "STARTUP_WORKERS", 8 ) )
+        self.snapshot_path = self._options.get( "SLOTS_SNAPSHOT" )
+        self.prefork_warmup = bool( self._options.get( "PREFORK_WARMUP", False ) )
+        breaker_cls_path = self._options.get( "CIRCUIT_BREAKER_CLASS" )
+        self.breaker_cls = load_class( breaker_cls_path ) if breaker_cls_path else None
+        self.breaker_cls_kwargs = self._options.get( "CIRCUIT_BREAKER_KWARGS", {} )
+        self.breakers = {}
+        limiter_cls_path = self._options.get( "CONCURRENCY_LIMITER_CLASS" )
+        self.limiter_cls = load_class( limiter_cls_path ) if limiter_cls_path else None
+        self.limiter_cls_kwargs = self._options.get( "CONCURRENCY_LIMITER_KWARGS", {} )
+        self.limiters = {}
+        self._pid = os.getpid()
+        shared_path = self._options.get( "SHARED_TOPOLOGY" )
+        self.shared = SharedTopology( shared_path ) if shared_path else None
+        self._shared_generation = 0
         self.checking = False
+        self._checker = None
+        self._wake = threading.Event()
+        self._refresh_requested = False
+        self._refresh_forced = False
+        self._last_refresh = 0
+        self._epochs = None
         self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
 
         self._nodes = [None] * NodeManager.Slots
+        self._ranges = []
         self._keyslot = {}
+        self.scripts = ScriptRegistry()
 
         self.connection_factory = get_connection_factory( options = self._options )
-        self.init_nodes()
+        if not self.load_shared() and not self.load_snapshot():
+            self.init_nodes()
 
     def __del__( self ):
         self.close()
 
     def close( self ):
         self.checking = False
+        self._wake.set()
+        checker = self._checker
+        if checker is not None and checker is not threading.current_thread():
+            checker.join( 1 )
+        self._checker = None
+        if self.shared is not None:
+            self.shared.close()
 
     def __start_checking_thread( self ):
         if not self.checking:
             self.checking = True
-            thread.start_new_thread( self.__checking_loop, () )
+            self._wake.clear()
+            self._checker = threading.Thread( target = self.__checking_loop,
+                                              name = "rediscluster-cache-checker" )
+            self._checker.daemon = True
+            self._checker.start()
 
-    def __test_client( self ):
-        connected = True
-        clients = self.get_clients()
-        if clients:
-            for client in clients:
-                try:
-                    self.cluster_slots( client = client )
-                except _main_exceptions as ex:
-                    self.logger.debug( str( ex ) )
-                    connected = False
-        else:
-            connected = False
-        return connected
+    def check_fork( self ):
+        '''
+        Reinitialise the manager in a process forked after it was built.
+        '''
+        if self._pid != os.getpid():
+            self.__after_fork()
+
+    def __after_fork( self ):
+        self._pid = os.getpid()
+        # Locks may have been held by threads which do not exist here.
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self.scripts.after_fork()
+        # Nor do the commands they had in flight.
+        for guard in list( self.breakers.values() ) + list( self.limiters.values() ):
+            after_fork = getattr( guard, "after_fork", None )
+            if after_fork is not None:
+                after_fork()
+        self.connection_factory.after_fork()
+        if self.shared is not None:
+            self.shared.after_fork()
+
+        # The checker thread did not survive the fork.
+        was_checking, self.checking, self._checker = self.checking, False, None
+        if was_checking:
+            self.__start_checking_thread()
+
+        if self.prefork_warmup:
+            warmer = threading.Thread( target = self.__warm_up_quietly,
+                                       name = "rediscluster-cache-warmup" )
+            warmer.daemon = True
+            warmer.start()
+
+    def __warm_up_quietly( self ):
+        try:
+            self.warm_up()
+        except Exception as ex:
+            self.logger.warning( "Failed to warm up the node pools: %s", ex )
+
+    def request_refresh( self, force = False ):
+        '''
+        Ask the checker thread to reload the slot map, without waiting.
+        With force, it is reloaded even if the epochs did not change.
+        '''
+        self._refresh_forced = self._refresh_forced or force
+        self._refresh_requested = True
+        self._wake.set()
 
     def __checking_loop( self ):
+        '''
+        Refresh the slot map when asked to, and every CHECK_INTERVAL
+        seconds. Refreshes are at least MIN_REFRESH_INTERVAL seconds
+        apart, failed ones are retried with a jittered exponential backoff.
+        '''
+        failures = 0
+        delay = self.check_interval
+        retry_at = 0
         while self.checking:
+            self._wake.wait( delay )
+            self._wake.clear()
+
+            # A request does not cut short the spacing, nor the backoff
+            # after failed refreshes.
+            not_before = max( self._last_refresh + self.min_refresh_interval, retry_at )
+            while self.checking and time.time() < not_before:
+                self._wake.wait( not_before - time.time() )
+                self._wake.clear()
+            if not self.checking:
+                break
+            requested, self._refresh_requested = self._refresh_requested, False
+            forced, self._refresh_forced = self._refresh_forced, False
             try:
-                connected = self.__test_client()
-                if not connected:
-                    self.reset_nodes()
-                time.sleep( self.check_interval )
-            except:
-                pass
+                # With a shared topology only the leader polls the cluster,
+                # the others refresh when their own requests fail.
+                if requested or self.shared is None or self.shared.try_lead():
+                    self.refresh_topology( force = forced )
+                if self.shared is not None and self.shared.leader and \
+                        self.shared.generation() != self._shared_generation:
+                    self.publish()
+                failures = 0
+                delay = self.check_interval
+                retry_at = 0
+            except Exception as ex:
+                failures += 1
+                delay = self.refresh_delay( failures )
+                retry_at = time.time() + delay
+                self._refresh_requested = self._refresh_requested or requested
+                self._refresh_forced = self._refresh_forced or forced
+                self.logger.warning( "Failed to refresh the cluster slots, retrying in %.1fs: %s",
+                                     delay, ex )
+
+    def refresh_delay( self, failures ):
+        '''
+        Delay before retrying after the given number of failed refreshes.
+        '''
+        delay = min( self.refresh_backoff_max, self.refresh_backoff * 2 ** min( failures - 1, 16 ) )
+        return random.uniform( delay / 2, delay )
 
     def connect( self, index = None ):
         """
@@ -107,6 +238,7 @@ class NodeManager( object ):
         operations for obtain a native redis client/connection
         instance.
         """
+        self.check_fork()
         client = None
         try:
             for index in range( len( self._server ) ):
@@ -127,6 +259,7 @@ class NodeManager( object ):
         operations for obtain a native redis client/connection
         instance.
         """
+        self.check_fork()
         clients = []
         try:
             for index in range( len( self._server ) ):
@@ -163,7 +296,7 @@ class NodeManager( object ):
         Tuned for compatibility with python 2.7.x
         """
         slot = self._keyslot.get( key )
-        if not slot:
+        if slot is None:
             k = self.encode( key )
 
             start = k.find( b"{" )
@@ -174,6 +307,8 @@ class NodeManager( object ):
                     k = k[start + 1:end]
 
             slot = crc16( k ) % self.Slots
+            if len( self._keyslot ) >= KEYSLOT_CACHE_SIZE:
+                self._keyslot.clear()
             self._keyslot[key] = slot
         return slot
 
@@ -205,6 +340,7 @@ class NodeManager( object ):
             '''
         if not client:
             return False
+        result = None
         try:
             result = client.execute_command( "readonly" )
         except:
@@ -236,38 +372,276 @@ class NodeManager( object ):
     def get_connections( self, params ):
         connections = []
         if params:
-            index = 0
             for param in params:
                 host = param[0]
                 port = param[1]
                 connection = self.connection_factory.connect( {"host":host, "port":port} )
                 if not connection:
                     continue
+                if self.breaker_cls is not None and hasattr( connection, "breaker" ):
+                    connection.breaker = self.get_breaker( host, port )
+                if self.limiter_cls is not None and hasattr( connection, "limiter" ):
+                    connection.limiter = self.get_limiter( host, port )
                 self.update_server( host, port )
                 connections.append( connection )
-                if index != 0:
-                    self.readonly( connection )
-                index += 1
         return connections
 
+    def get_breaker( self, host, port ):
+        '''
+        Return the circuit breaker of a node, shared by all its clients.
+        '''
+        name = "{0}:{1}".format( host, port )
+        breaker = self.breakers.get( name )
+        if breaker is None:
+            breaker = self.breakers.setdefault( name, self.breaker_cls( name = name, **self.breaker_cls_kwargs ) )
+        return breaker
+
+    def breaker_stats( self ):
+        '''
+        Return the state of the circuit breakers, by node name.
+        '''
+        return dict( ( name, breaker.stats() ) for name, breaker in list( self.breakers.items() ) )
+
+    def get_limiter( self, host, port ):
+        '''
+        Return the concurrency limiter of a node, shared by all its clients.
+        '''
+        name = "{0}:{1}".format( host, port )
+        limiter = self.limiters.get( name )
+        if limiter is None:
+            limiter = self.limiters.setdefault( name, self.limiter_cls( name = name, **self.limiter_cls_kwargs ) )
+        return limiter
+
+    def limiter_stats( self ):
+        '''
+        Return the state of the concurrency limiters, by node name.
+        '''
+        return dict( ( name, limiter.stats() ) for name, limiter in list( self.limiters.items() ) )
+
+    def parallel( self, func, items ):
+        '''
+        Call func for every item, on up to STARTUP_WORKERS threads.
+        '''
+        items = list( items )
+        if self.startup_workers <= 1 or len( items ) <= 1:
+            return [func( item ) for item in items]
+        pool = ThreadPool( min( self.startup_workers, len( items ) ) )
+        try:
+            return pool.map( func, items )
+        finally:
+            pool.close()
+            pool.join()
+
+    def cluster_epochs( self, client ):
+        '''
+        Return the address, configuration epoch, role, master and slots of
+        every node known to client, from CLUSTER NODES. The slots are part
+        of it as CLUSTER SETSLOT NODE does not always bump the epoch.
+        '''
+        epochs = []
+        for line in nativestr( client.execute_command( "cluster", "nodes" ) ).splitlines():
+            fields = line.split()
+            if len( fields ) < 8:
+                continue
+            role = "master" if "master" in fields[2].split( "," ) else "slave"
+            epochs.append( ( fields[0], fields[1], fields[6], role, fields[3], tuple( fields[8:] ) ) )
+        return tuple( sorted( epochs ) )
+
+    def fetch_topology( self, epochs = None ):
+        '''
+        Return the configuration epochs and the CLUSTER SLOTS reply of the
+        first node answering, the slots are None when the epochs equal
+        the given ones.
+        '''
+        clients = self.get_clients()
+        random.shuffle( clients )
+        error = None
+        for client in clients:
+            try:
+                try:
+                    current = self.cluster_epochs( client )
+                except ResponseError:
+                    # CLUSTER NODES may be disabled, always reload then.
+                    current = None
+                if current is not None and current == epochs:
+                    return current, None
+                return current, client.execute_command( "cluster", "slots" )
+            except _main_exceptions as ex:
+                self.logger.debug( "Failed to read the topology from %s: %s", client, ex )
+                error = ex
+        raise ConnectionError( "No cluster node answered: %s" % error )
+
     def init_nodes( self ):
         '''
         Initialize all cluster node connections
         '''
-        slots = self.cluster_slots()
+        epochs, slots = self.fetch_topology()
+        self.apply_topology( epochs, slots )
+        self.__start_checking_thread()
+
+    def refresh_topology( self, force = False ):
+        '''
+        Reload the slot map unless the configuration epochs of the cluster
+        are unchanged or force, returns whether it was reloaded.
+        '''
+        with self._refresh_lock:
+            self._last_refresh = time.time()
+            epochs, slots = self.fetch_topology( None if force else self._epochs )
+            if slots is None:
+                return False
+            self.apply_topology( epochs, slots )
+            return True
+
+    def apply_topology( self, epochs, slots ):
         if not slots:
             raise Exception( "Failed to acquire cluster slots" )
+        ranges = []
         for slot in slots:
             if not slot:
                 continue
-            connections = self.get_connections( slot[2:] )
-            start_range = slot[0]
-            end_range = slot[1]
+            params = [( nativestr( param[0] ), int( param[1] ) ) for param in slot[2:]]
+            ranges.append( ( slot[0], slot[1], params ) )
+        self.set_slots( ranges )
+        self._epochs = epochs
+        self.save_snapshot()
+        self.publish()
+
+    def set_slots( self, ranges, connect = True ):
+        '''
+        Route the slots to the given ranges of ``(start, end, [(host, port), ...])``,
+        the master of each range first.
+
+        Ranges which did not change keep their connections. With connect,
+        the replicas of the others are switched to read only mode and the
+        pools warmed up, in parallel, before the new routes are used.
+        '''
+        with self._lock:
+            current = dict( ( ( start, end, tuple( map( tuple, params ) ) ), self._nodes[start] )
+                            for start, end, params in self._ranges )
+        nodes = [None] * NodeManager.Slots
+        changed = []
+        for start_range, end_range, params in ranges:
+            connections = current.get( ( start_range, end_range, tuple( map( tuple, params ) ) ) )
+            if not connections:
+                connections = self.get_connections( params )
+                changed.append( connections )
             for num in range( start_range, end_range + 1 ):
-                self._nodes[num] = connections
+                nodes[num] = connections
+
+        if connect and changed:
+            self.parallel( self.readonly, [node for connections in changed for node in connections[1:]] )
+            self.warm_up( changed )
+
+        with self._lock:
+            self._nodes = nodes
+            self._ranges = ranges
+
+    def load_shared( self ):
+        '''
+        Route with the slot map published in SHARED_TOPOLOGY, if there is
+        one. Returns False when this process has to build the map itself.
+        '''
+        if self.shared is None:
+            return False
+        self.shared.try_lead()
+        generation, ranges = self.shared.read()
+        if not ranges:
+            return False
+
+        self.set_slots( ranges )
+        self._shared_generation = generation
         self.__start_checking_thread()
+        return True
+
+    def sync_shared( self ):
+        '''
+        Switch to the slot map published by the leader when it changed.
+        '''
+        if not self._refresh_lock.acquire( False ):
+            return
+        try:
+            generation, ranges = self.shared.read()
+            if generation == self._shared_generation:
+                return
+            if ranges:
+                self.set_slots( ranges, connect = False )
+            self._shared_generation = generation
+        finally:
+            self._refresh_lock.release()
+
+    def publish( self ):
+        '''
+        Publish the current slot map in SHARED_TOPOLOGY if this process
+        is the leader.
+        '''
+        if self.shared is None or not self.shared.leader:
+            return
+        try:
+            self._shared_generation = self.shared.publish( self._ranges )
+        except ValueError as ex:
+            self.logger.warning( "Failed to publish the cluster slots: %s", ex )
+
+    def load_snapshot( self ):
+        '''
+        Route with the slot map saved by SLOTS_SNAPSHOT, if there is one,
+        and check the topology in the background.
+        '''
+        if not self.snapshot_path:
+            return False
+        try:
+            ranges = read_snapshot( self.snapshot_path )
+        except ( IOError, OSError, ValueError ) as ex:
+            self.logger.debug( "Failed to read slots snapshot: %s", ex )
+            return False
+        if not ranges:
+            return False
+
+        self.set_slots( ranges, connect = False )
+        self.__start_checking_thread()
+        self.request_refresh()
+        return True
+
+    def save_snapshot( self ):
+        '''
+        Save the current slot map to SLOTS_SNAPSHOT for the next process.
+        '''
+        if not self.snapshot_path:
+            return
+        try:
+            write_snapshot( self.snapshot_path, self._ranges )
+        except ( IOError, OSError ) as ex:
+            self.logger.warning( "Failed to write slots snapshot: %s", ex )
+
+    def get_pools( self, nodes = None ):
+        '''
+        Return the distinct connection pools of all cluster nodes.
+        '''
+        pools = {}
+        for connections in nodes or self._nodes:
+            if not connections:
+                continue
+            for connection in connections:
+                pools[id( connection.connection_pool )] = connection.connection_pool
+        return list( pools.values() )
+
+    def warm_up( self, nodes = None ):
+        '''
+        Open the minimal connections of every node pool supporting it,
+        in parallel.
+        '''
+        pools = [pool for pool in self.get_pools( nodes ) if hasattr( pool, "warm_up" )]
+        self.parallel( self.__warm_up_pool, pools )
+
+    def __warm_up_pool( self, pool ):
+        try:
+            pool.warm_up()
+        except _main_exceptions as ex:
+            self.logger.warning( "Failed to warm up pool %s: %s", pool, ex )
 
     def get_node( self, key, write = True ):
+        self.check_fork()
+        if self.shared is not None and self.shared.generation() != self._shared_generation:
+            self.sync_shared()
         with self._lock:
             slot = self.keyslot( key )
             connections = self._nodes[slot]
@@ -277,10 +651,119 @@ class NodeManager( object ):
 
             index = random.randint( 1, len( connections ) - 1 )
             node = connections[index]
+            if not self.__allows( node ):
+                # Read from another replica, or else the master, while the
+                # breaker of this one is open.
+                candidates = [connection for connection in connections[1:] if self.__allows( connection )]
+                if not candidates and self.__allows( connections[0] ):
+                    return connections[0]
+                if candidates:
+                    node = random.choice( candidates )
             self.readonly( node )
             return node
 
-    def reset_nodes( self ):
+    def get_backup_node( self, key, exclude ):
+        '''
+        Return a node serving the slot of key other than exclude, a replica
+        if there is one, to send a hedged read to. None if there is none.
+        The hedged read sends READONLY itself, on its own connection.
+        '''
         with self._lock:
-            self.init_nodes()
+            connections = self._nodes[self.keyslot( key )]
+        candidates = [connection for connection in connections[1:]
+                      if connection is not exclude and self.__allows( connection )]
+        if not candidates:
+            master = connections[0]
+            return master if master is not exclude and self.__allows( master ) else None
+        return random.choice( candidates )
+
+    def __allows( self, client ):
+        breaker = getattr( client, "breaker", None )
+        return breaker is None or breaker.allows()
 
+    def reset_nodes( self ):
+        with self._refresh_lock:
+            self._last_refresh = time.time()
+            self.apply_topology( *self.fetch_topology() )
+
+    def report_error( self, client, error ):
+        '''
+        Called with the errors of commands sent to client. MOVED, ASK or
+        CLUSTERDOWN replies and connection failures schedule a refresh of
+        the slot map.
+        '''
+        if isinstance( error, ResponseError ):
+            if not str( error ).startswith( TOPOLOGY_ERRORS ):
+                return
+        elif not isinstance( error, _main_exceptions ) or \
+                isinstance( error, ( CircuitBreakerOpen, AdmissionRejected, DeadlineExceeded ) ) or expired():
+            # Commands rejected without being sent, or out of their time
+            # budget, say nothing of the topology.
+            return
+        self.logger.debug( "Refreshing the cluster slots after: %s", error )
+        self.request_refresh( force = isinstance( error, ResponseError ) and
+                              str( error ).startswith( REDIRECT_ERRORS ) )
+
+
+
+# Options of the cache parameters which are not about the cluster, caches
+# differing only in these share a node manager.
+CACHE_OPTIONS = ( "OPTIONS", "BACKEND", "LOCATION", "TIMEOUT", "KEY_PREFIX", "VERSION",
+                  "KEY_FUNCTION", "REVERSE_KEY_FUNCTION" )
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def _freeze( value ):
+    if isinstance( value, dict ):
+        return tuple( sorted( ( key, _freeze( item ) ) for key, item in value.items() ) )
+    if isinstance( value, ( list, tuple, set ) ):
+        return tuple( _freeze( item ) for item in value )
+    return value
+
+
+def manager_key( server, options ):
+    """
+    Registry key of a node manager: the seed nodes, in any order, and the
+    options shaping the connections and the topology checks.
+    """
+    if not isinstance( server, ( list, tuple, set ) ):
+        server = server.split( "," )
+    seeds = tuple( sorted( repr( _freeze( seed ) ) for seed in server ) )
+    options = dict( ( key, value ) for key, value in ( options or {} ).items()
+                    if key not in CACHE_OPTIONS )
+    return seeds, repr( _freeze( options ) )
+
+
+def get_node_manager( server, options ):
+    """
+    Return the node manager of the process for the cluster, building it
+    on first use. Every call takes a reference, to give back with
+    ``release_node_manager``.
+    """
+    key = manager_key( server, options )
+    with _managers_lock:
+        manager = _managers.get( key )
+        if manager is None:
+            manager = NodeManager( list( server ) if isinstance( server, ( list, tuple, set ) ) else server,
+                                   options )
+            manager._registry_key = key
+            manager._refs = 0
+            _managers[key] = manager
+        manager._refs += 1
+        return manager
+
+
+def release_node_manager( manager ):
+    """
+    Give back a reference taken by ``get_node_manager``, the last one
+    closes the manager.
+    """
+    with _managers_lock:
+        manager._refs -= 1
+        if manager._refs > 0:
+            return
+        if _managers.get( manager._registry_key ) is manager:
+            del _managers[manager._registry_key]
+    manager.close()
@@ -1,13 +1,337 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from redis.connection import DefaultParser
+import collections
+import os
+import socket
+import threading
+import time
 
+from redis.client import StrictRedis
+from redis.connection import BlockingConnectionPool, ConnectionPool, DefaultParser
+from redis.exceptions import ConnectionError, TimeoutError
+
+from rediscluster_cache.deadline import DeadlineExceeded, check, expired, remaining
 from rediscluster_cache.util import load_class
 
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+try:
+    from redis.client import StrictPipeline as Pipeline
+except ImportError:
+    from redis.client import Pipeline
+
 SOCKET_TIMEOUT = 5
 SOCKET_CONNECT_TIMEOUT = 10
 
+# Window used for the connects per second of the pool stats.
+CONNECT_RATE_WINDOW = 60
+
+
+def drop_inherited_connections( pool ):
+    """
+    Forget the connections a pool inherited from the parent process and
+    reset it for this one.
+
+    The sockets are only closed in this process, ``disconnect`` would shut
+    them down and break them for the parent too.
+    """
+    connections = list( getattr( pool, "_connections", () ) )
+    connections.extend( getattr( pool, "_available_connections", () ) )
+    connections.extend( getattr( pool, "_in_use_connections", () ) )
+    for connection in connections:
+        sock, connection._sock = connection._sock, None
+        try:
+            connection._parser.on_disconnect()
+        except Exception:
+            pass
+        if sock is not None:
+            try:
+                sock.close()
+            except Exception:
+                pass
+    pool.reset()
+
+
+def _guarded( client, func, *args, **kwargs ):
+    """
+    Call func within the concurrency limit of the node of client, reporting
+    its outcome and latency to the limiter and the circuit breaker.
+    """
+    check()
+    breaker, limiter = client.breaker, client.limiter
+    if breaker is None and limiter is None:
+        return func( *args, **kwargs )
+
+    if limiter is not None:
+        limiter.acquire()
+    if breaker is not None:
+        try:
+            breaker.before()
+        except Exception:
+            if limiter is not None:
+                limiter.cancel()
+            raise
+
+    start = time.time()
+    failed = False
+    try:
+        return func( *args, **kwargs )
+    except ( ConnectionError, TimeoutError, socket.timeout ):
+        failed = True
+        raise
+    finally:
+        # Error replies count as answers, the node is up. Running out of
+        # the caller's time budget says nothing about the node.
+        latency = time.time() - start
+        if failed and expired():
+            if breaker is not None:
+                breaker.cancel()
+            if limiter is not None:
+                limiter.cancel()
+        else:
+            if breaker is not None:
+                if failed:
+                    breaker.failure( latency )
+                else:
+                    breaker.success( latency )
+            if limiter is not None:
+                limiter.release( latency, failed )
+
+
+class NodePipeline( Pipeline ):
+    breaker = None
+    limiter = None
+
+    def execute( self, raise_on_error = True ):
+        return _guarded( self, super( NodePipeline, self ).execute, raise_on_error )
+
+
+class NodeClient( StrictRedis ):
+    """
+    Client of one cluster node. Its commands and pipelines go through the
+    concurrency limiter and the circuit breaker of the node, when the node
+    manager gave it these.
+    """
+    breaker = None
+    limiter = None
+
+    def execute_command( self, *args, **options ):
+        return _guarded( self, super( NodeClient, self ).execute_command, *args, **options )
+
+    def pipeline( self, transaction = True, shard_hint = None ):
+        pipe = NodePipeline( self.connection_pool, self.response_callbacks, transaction, shard_hint )
+        pipe.breaker = self.breaker
+        pipe.limiter = self.limiter
+        return pipe
+
+
+def _min_timeout( timeout, left ):
+    return left if timeout is None else min( timeout, left )
+
+
+def apply_deadline( pool, connection ):
+    """
+    Cut the timeouts of a connection just checked out of pool to the time
+    left until the deadline of the thread, or restore them if there is no
+    deadline. Under a deadline timeouts are not retried.
+    """
+    left = remaining()
+    saved = getattr( connection, "_saved_timeouts", None )
+    if left is None:
+        if saved is None:
+            return
+        connection.socket_timeout, connection.socket_connect_timeout, connection.retry_on_timeout = saved
+        connection._saved_timeouts = None
+    else:
+        if left <= 0:
+            pool.release( connection )
+            raise DeadlineExceeded( "Deadline exceeded" )
+        if saved is None:
+            saved = connection._saved_timeouts = ( connection.socket_timeout,
+                                                   connection.socket_connect_timeout,
+                                                   connection.retry_on_timeout )
+        connection.socket_timeout = _min_timeout( saved[0], left )
+        connection.socket_connect_timeout = _min_timeout( saved[1], left )
+        connection.retry_on_timeout = False
+    if connection._sock is not None:
+        connection._sock.settimeout( connection.socket_timeout )
+
+
+class DeadlineConnectionPool( ConnectionPool ):
+    """
+    Connection pool cutting the socket timeouts to the deadline of the
+    calling thread.
+    """
+
+    def get_connection( self, command_name, *keys, **options ):
+        connection = super( DeadlineConnectionPool, self ).get_connection( command_name, *keys, **options )
+        apply_deadline( self, connection )
+        return connection
+
+
+class NodeConnectionPool( BlockingConnectionPool ):
+    """
+    Bounded connection pool of one node.
+
+    Up to ``max_connections`` connections are opened, a checkout waits at
+    most ``timeout`` seconds for a free one instead of opening more.
+    ``min_connections`` are opened ahead of the first request by
+    ``warm_up`` and connections idle for more than ``idle_timeout``
+    seconds are closed again, down to ``min_connections``.
+
+    Enable it with::
+
+        "CONNECTION_POOL_CLASS": "rediscluster_cache.pool.NodeConnectionPool",
+        "CONNECTION_POOL_KWARGS": {"max_connections": 50, "min_connections": 2,
+                                   "timeout": 1, "idle_timeout": 300},
+    """
+
+    def __init__( self, min_connections = 0, idle_timeout = None, **kwargs ):
+        self.min_connections = min_connections
+        self.idle_timeout = idle_timeout
+        super( NodeConnectionPool, self ).__init__( **kwargs )
+
+    def _checkpid( self ):
+        if self.pid != os.getpid():
+            with self._check_lock:
+                if self.pid != os.getpid():
+                    drop_inherited_connections( self )
+
+    def reset( self ):
+        super( NodeConnectionPool, self ).reset()
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._connects = 0
+        self._recent_connects = collections.deque()
+        self._last_reap = time.time()
+
+    def make_connection( self ):
+        connection = super( NodeConnectionPool, self ).make_connection()
+        now = time.time()
+        with self._stats_lock:
+            self._connects += 1
+            self._recent_connects.append( now )
+            self._trim_recent_connects( now )
+        return connection
+
+    def _trim_recent_connects( self, now ):
+        while self._recent_connects and self._recent_connects[0] < now - CONNECT_RATE_WINDOW:
+            self._recent_connects.popleft()
+
+    def get_connection( self, command_name, *keys, **options ):
+        start = time.time()
+        left = remaining()
+        if left is not None and ( self.timeout is None or left < self.timeout ):
+            # Wait no longer than the deadline of the thread for a free
+            # connection.
+            self._checkpid()
+            try:
+                connection = self.pool.get( block = True, timeout = max( left, 0 ) )
+            except Empty:
+                raise DeadlineExceeded( "Deadline exceeded waiting for a connection" )
+            if connection is None:
+                connection = self.make_connection()
+        else:
+            connection = super( NodeConnectionPool, self ).get_connection( command_name, *keys, **options )
+        waited = time.time() - start
+        with self._stats_lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_time += waited
+            self._max_wait = max( self._max_wait, waited )
+
+        if self.idle_timeout and start - self._last_reap >= self.idle_timeout:
+            self._last_reap = start
+            self.reap()
+        apply_deadline( self, connection )
+        return connection
+
+    def release( self, connection ):
+        if connection.pid != self.pid:
+            # Taken in the parent before a fork, not counted in this pool.
+            return
+        connection.last_used = time.time()
+        super( NodeConnectionPool, self ).release( connection )
+        with self._stats_lock:
+            self._in_use -= 1
+
+    def warm_up( self ):
+        """
+        Open ``min_connections`` connections ahead of the first request.
+        """
+        connections = []
+        try:
+            for _ in range( min( self.min_connections, self.max_connections ) ):
+                connection = self.get_connection( "PING" )
+                connections.append( connection )
+                connection.connect()
+        finally:
+            for connection in connections:
+                self.release( connection )
+
+    def reap( self ):
+        """
+        Close the connections idle for more than ``idle_timeout`` seconds,
+        keeping at least ``min_connections``. Returns the number closed.
+        """
+        if not self.idle_timeout:
+            return 0
+
+        # Take every idle connection out of the queue, most recently used
+        # first.
+        idle = []
+        while True:
+            try:
+                idle.append( self.pool.get_nowait() )
+            except Empty:
+                break
+
+        deadline = time.time() - self.idle_timeout
+        reaped = 0
+        kept = []
+        for connection in idle:
+            if ( connection is not None and
+                    len( self._connections ) > self.min_connections and
+                    getattr( connection, "last_used", 0 ) < deadline ):
+                connection.disconnect()
+                self._connections.remove( connection )
+                reaped += 1
+                connection = None
+            kept.append( connection )
+
+        # Put them back oldest first, with the free slots at the bottom so
+        # that open connections are reused before new ones are opened.
+        kept.reverse()
+        kept.sort( key = lambda connection: connection is not None )
+        for connection in kept:
+            self.pool.put_nowait( connection )
+        return reaped
+
+    def stats( self ):
+        now = time.time()
+        with self._stats_lock:
+            self._trim_recent_connects( now )
+            created = len( self._connections )
+            return {
+                "max_connections": self.max_connections,
+                "min_connections": self.min_connections,
+                "connections": created,
+                "in_use": self._in_use,
+                "idle": created - self._in_use,
+                "checkouts": self._checkouts,
+                "wait_time": self._wait_time,
+                "max_wait": self._max_wait,
+                "connects": self._connects,
+                "connects_per_sec": float( len( self._recent_connects ) ) / CONNECT_RATE_WINDOW,
+            }
+
 
 class ConnectionFactory(object):
 
@@ -18,15 +342,16 @@ class ConnectionFactory(object):
     # (DefaultClient) instance for every request.
 
     _pools = {}
+    _pools_pid = os.getpid()
 
     def __init__(self, options):
         pool_cls_path = options.get("CONNECTION_POOL_CLASS",
-                                    "redis.connection.ConnectionPool")
+                                    "rediscluster_cache.pool.DeadlineConnectionPool")
         self.pool_cls = load_class( pool_cls_path )
         self.pool_cls_kwargs = options.get("CONNECTION_POOL_KWARGS", {})
 
         redis_client_cls_path = options.get("REDIS_CLIENT_CLASS",
-                                            "redis.client.StrictRedis")
+                                            "rediscluster_cache.pool.NodeClient")
         self.redis_client_cls = load_class( redis_client_cls_path )
         self.redis_client_cls_kwargs = options.get("REDIS_CLIENT_KWARGS", {})
 
@@ -101,6 +426,8 @@ class ConnectionFactory(object):
         Reimplement this method if you want distinct
         connection pool instance caching behavior.
         """
+        if ConnectionFactory._pools_pid != os.getpid():
+            self.after_fork()
         name = self.get_connection_name( params )
         if name not in self._pools:
             self._pools[name] = self.get_connection_pool( params )
@@ -124,6 +451,25 @@ class ConnectionFactory(object):
 
         return pool
 
+    @classmethod
+    def after_fork( cls ):
+        """
+        Drop the connections every pool inherited from the parent process,
+        the pools open new ones when next used.
+        """
+        if cls._pools_pid == os.getpid():
+            return
+        cls._pools_pid = os.getpid()
+        for pool in list( cls._pools.values() ):
+            drop_inherited_connections( pool )
+
+    def pool_stats( self ):
+        """
+        Return the stats of every pool able to report them, by node name.
+        """
+        return dict( ( name, pool.stats() ) for name, pool in list( self._pools.items() )
+                     if hasattr( pool, "stats" ) )
+
 
 def get_connection_factory(path=None, options=None):
     if path is None and options is not None:
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Lua scripts of the client, run with EVALSHA.
+
+A script is loaded with SCRIPT LOAD the first time it runs on a node and
+loaded again when the node answers NOSCRIPT, after a failover to a
+replica which never saw it or a SCRIPT FLUSH.
+'''
+import hashlib
+import threading
+
+from redis.exceptions import NoScriptError
+
+# INCRBY on an existing key only.
+INCR_EXISTING = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+# Value and TTL of a key, false if it does not exist.
+GET_WITH_TTL = """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    return false
+end
+return {value, redis.call('TTL', KEYS[1])}
+"""
+
+# Value of a key, giving it a new TTL: ARGV[1] seconds, -1 for none. A
+# TTL of 0 expires the key at once.
+GET_AND_TOUCH = """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    return false
+end
+local seconds = tonumber(ARGV[1])
+if seconds < 0 then
+    redis.call('PERSIST', KEYS[1])
+elseif seconds == 0 then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('EXPIRE', KEYS[1], seconds)
+end
+return value
+"""
+
+# INCRBY, creating the key with a TTL of ARGV[2] seconds (-1 for none, 0
+# expires it at once).
+INCR_WITH_TTL = """
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+local seconds = tonumber(ARGV[2])
+if seconds == 0 then
+    redis.call('DEL', KEYS[1])
+elseif seconds > 0 and redis.call('TTL', KEYS[1]) == -1 then
+    redis.call('EXPIRE', KEYS[1], seconds)
+end
+return value
+"""
+
+# SET ARGV[2], with a TTL of ARGV[3] seconds (-1 for none, 0 expires it at
+# once), if the SHA1 of the current value is ARGV[1], or ARGV[1] is empty
+# and there is no value. Returns the replaced value if it starts with the
+# chunk manifest prefix ARGV[4], so that its chunks can be deleted.
+COMPARE_AND_SET = """
+local current = redis.call('GET', KEYS[1])
+local token = ''
+if current then
+    token = redis.sha1hex(current)
+end
+if token ~= ARGV[1] then
+    return 0
+end
+local seconds = tonumber(ARGV[3])
+if seconds < 0 then
+    redis.call('SET', KEYS[1], ARGV[2])
+elseif seconds == 0 then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', seconds)
+end
+if current and string.sub(current, 1, string.len(ARGV[4])) == ARGV[4] then
+    return current
+end
+return 1
+"""
+
+# Generation of a namespace, created as ARGV[1] if it does not exist.
+NAMESPACE_GENERATION = """
+local generation = redis.call('GET', KEYS[1])
+if not generation then
+    redis.call('SET', KEYS[1], ARGV[1])
+    return ARGV[1]
+end
+return generation
+"""
+
+# Next generation of a namespace, counting from ARGV[1] if it does not exist.
+NAMESPACE_BUMP = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return redis.call('INCR', KEYS[1])
+"""
+
+# SADD ARGV[1] to a tag set, which expires with its longest lived member:
+# ARGV[2] is the TTL of the member, 0 for none.
+TAG_ADD = """
+local created = redis.call('EXISTS', KEYS[1]) == 0
+redis.call('SADD', KEYS[1], ARGV[1])
+local timeout = tonumber(ARGV[2])
+local ttl = redis.call('TTL', KEYS[1])
+if timeout == 0 then
+    redis.call('PERSIST', KEYS[1])
+elseif created or (ttl >= 0 and ttl < timeout) then
+    redis.call('EXPIRE', KEYS[1], timeout)
+end
+return 1
+"""
+
+# SET a lock to the token ARGV[1] if it is free, with a lease of ARGV[2]
+# milliseconds (0 for none): {1, next fencing token from KEYS[2]}, or
+# {0, PTTL of the lock} if it is taken.
+LOCK_ACQUIRE = """
+local ok
+if tonumber(ARGV[2]) > 0 then
+    ok = redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2])
+else
+    ok = redis.call('SET', KEYS[1], ARGV[1], 'NX')
+end
+if not ok then
+    return {0, redis.call('PTTL', KEYS[1])}
+end
+if KEYS[2] then
+    return {1, redis.call('INCR', KEYS[2])}
+end
+return {1, 0}
+"""
+
+# DEL a lock held with the token ARGV[1] and leave one wake token on the
+# list KEYS[2] for ARGV[2] milliseconds.
+LOCK_RELEASE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if KEYS[2] then
+    redis.call('DEL', KEYS[2])
+    redis.call('RPUSH', KEYS[2], 1)
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+# Lease of ARGV[2] milliseconds for a lock held with the token ARGV[1],
+# added to the lease left if ARGV[3] is 1.
+LOCK_EXTEND = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local lease = tonumber(ARGV[2])
+if ARGV[3] == '1' then
+    local pttl = redis.call('PTTL', KEYS[1])
+    if pttl > 0 then
+        lease = lease + pttl
+    end
+end
+redis.call('PEXPIRE', KEYS[1], lease)
+return 1
+"""
+
+SCRIPTS = {
+    "incr_existing": INCR_EXISTING,
+    "get_with_ttl": GET_WITH_TTL,
+    "get_and_touch": GET_AND_TOUCH,
+    "incr_with_ttl": INCR_WITH_TTL,
+    "compare_and_set": COMPARE_AND_SET,
+    "namespace_generation": NAMESPACE_GENERATION,
+    "namespace_bump": NAMESPACE_BUMP,
+    "tag_add": TAG_ADD,
+    "lock_acquire": LOCK_ACQUIRE,
+    "lock_release": LOCK_RELEASE,
+    "lock_extend": LOCK_EXTEND,
+}
+
+
+def value_token( value ):
+    """
+    Version token of a raw value, as computed by COMPARE_AND_SET.
+    """
+    if value is None:
+        return ""
+    return hashlib.sha1( value ).hexdigest()
+
+
+class Script( object ):
+    __slots__ = ( "name", "source", "sha" )
+
+    def __init__( self, name, source ):
+        self.name = name
+        self.source = source
+        self.sha = hashlib.sha1( source.encode( "utf-8" ) ).hexdigest()
+
+
+class ScriptRegistry( object ):
+    """
+    Named Lua scripts and the nodes they are loaded on.
+    """
+
+    def __init__( self, scripts = None ):
+        self._scripts = {}
+        self._loaded = set()
+        self._lock = threading.Lock()
+        for name, source in ( scripts or SCRIPTS ).items():
+            self.register( name, source )
+
+    def after_fork( self ):
+        # The lock may have been held by a thread which does not exist here.
+        self._lock = threading.Lock()
+
+    def register( self, name, source ):
+        script = Script( name, source )
+        self._scripts[name] = script
+        return script
+
+    def _node( self, client ):
+        kwargs = client.connection_pool.connection_kwargs
+        return "{0}:{1}".format( kwargs.get( "host" ), kwargs.get( "port" ) )
+
+    def load( self, client, name ):
+        """
+        Load a script on the node of client.
+        """
+        script = self._scripts[name]
+        client.script_load( script.source )
+        with self._lock:
+            self._loaded.add( ( self._node( client ), script.sha ) )
+        return script
+
+    def run( self, client, name, keys = (), args = () ):
+        """
+        Run a script on the node of client with EVALSHA, loading it first
+        on a node which does not have it.
+        """
+        script = self._scripts[name]
+        node = self._node( client )
+        if ( node, script.sha ) not in self._loaded:
+            self.load( client, name )
+        keys_and_args = list( keys ) + list( args )
+        try:
+            return client.evalsha( script.sha, len( keys ), *keys_and_args )
+        except NoScriptError:
+            with self._lock:
+                self._loaded.discard( ( node, script.sha ) )
+            self.load( client, name )
+            return client.evalsha( script.sha, len( keys ), *keys_and_args )
+
+    def run_many( self, client, name, calls, raise_on_error = True ):
+        """
+        Run a script once for each ``(keys, args)`` pair of calls, in one
+        pipeline on the node of client. Without raise_on_error the error
+        replies are returned in place of the results.
+        """
+        script = self._scripts[name]
+        node = self._node( client )
+        calls = list( calls )
+        results = [None] * len( calls )
+        pending = list( range( len( calls ) ) )
+        for attempt in ( 0, 1 ):
+            if ( node, script.sha ) not in self._loaded:
+                self.load( client, name )
+            pipe = client.pipeline( transaction = False )
+            for index in pending:
+                keys, args = calls[index]
+                pipe.evalsha( script.sha, len( keys ), *( list( keys ) + list( args ) ) )
+            missing = []
+            for index, reply in zip( pending, pipe.execute( raise_on_error = False ) ):
+                results[index] = reply
+                if isinstance( reply, NoScriptError ):
+                    missing.append( index )
+            if not missing or attempt:
+                break
+            # Only the calls which did not run are sent again.
+            with self._lock:
+                self._loaded.discard( ( node, script.sha ) )
+            pending = missing
+        if raise_on_error:
+            for reply in results:
+                if isinstance( reply, Exception ):
+                    raise reply
+        return results
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import re
+import struct
+
+from rediscluster_cache.serializers.base import BaseSerializer
+from rediscluster_cache.util import force_bytes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_field_format = re.compile(r"^(\d*)([?bBhHiIlLqQefds])$")
+
+# struct format codes to numpy types, both little endian without padding.
+_numpy_types = {
+    "?": "?", "b": "i1", "B": "u1", "h": "<i2", "H": "<u2", "i": "<i4", "I": "<u4",
+    "l": "<i4", "L": "<u4", "q": "<i8", "Q": "<u8", "e": "<f2", "f": "<f4", "d": "<f8",
+}
+
+
+class RecordSchema(object):
+    """
+    Fixed layout of a record: a list of ``(name, format)`` pairs where
+    format is a single struct code, or ``Ns`` for bytes of length N.
+
+        RecordSchema([("id", "q"), ("score", "d"), ("name", "16s")])
+    """
+
+    def __init__(self, fields):
+        self.names = []
+        formats = []
+        for name, fmt in fields:
+            match = _field_format.match(fmt)
+            if match is None or (match.group(1) and match.group(2) != "s"):
+                raise ValueError("Unsupported record field format '%s' of field '%s'" % (fmt, name))
+            self.names.append(name)
+            formats.append(fmt)
+        self.formats = formats
+        self.struct = struct.Struct(str("<" + "".join(formats)))
+        self.size = self.struct.size
+        self._dtype = None
+
+    @property
+    def dtype(self):
+        """
+        Equivalent numpy structured dtype.
+        """
+        if self._dtype is None:
+            fields = []
+            for name, fmt in zip(self.names, self.formats):
+                if fmt.endswith("s"):
+                    fields.append((str(name), str("S%s" % (fmt[:-1] or 1))))
+                else:
+                    fields.append((str(name), str(_numpy_types[fmt])))
+            self._dtype = numpy.dtype(fields)
+        return self._dtype
+
+    def pack(self, value):
+        if isinstance(value, dict):
+            value = [value[name] for name in self.names]
+        return self.struct.pack(*value)
+
+    def unpack(self, value):
+        return dict(zip(self.names, self.struct.unpack(value)))
+
+    def unpack_many(self, values, as_numpy=None):
+        """
+        Decode many packed records in one pass.
+
+        Returns a numpy structured array if numpy is available (or
+        ``as_numpy`` is True), otherwise a dict of column lists.
+        """
+        data = b"".join(values)
+        if as_numpy is None:
+            as_numpy = numpy is not None
+        if as_numpy:
+            return numpy.frombuffer(data, dtype=self.dtype)
+
+        if hasattr(self.struct, "iter_unpack"):
+            rows = self.struct.iter_unpack(data)
+        else:
+            rows = [self.struct.unpack_from(data, offset)
+                    for offset in range(0, len(data), self.size)]
+        columns = list(zip(*rows)) or [()] * len(self.names)
+        return dict((name, list(column)) for name, column in zip(self.names, columns))
+
+
+def get_schema(schema):
+    if schema is None or isinstance(schema, RecordSchema):
+        return schema
+    return RecordSchema(schema)
+
+
+class RecordSerializer(BaseSerializer):
+    """
+    Packs records of a fixed schema (RECORD_SCHEMA option) with a
+    precompiled struct layout. Records are given as dicts or sequences
+    in field order and loaded as dicts.
+
+    Integers are stored as they are by the client, values of the size of
+    a record are always loaded as records.
+    """
+
+    def __init__(self, options):
+        self.schema = get_schema(options.get("RECORD_SCHEMA"))
+        if self.schema is None:
+            raise Exception( "RECORD_SCHEMA is required by the record serializer" )
+
+    def dumps(self, value):
+        return self.schema.pack(value)
+
+    def loads(self, value):
+        return self.schema.unpack(force_bytes(value))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import ast
+import struct
+
+from rediscluster_cache.serializers.base import BaseSerializer
+
+try:
+    import pickle
+    pickle.PickleBuffer
+except AttributeError:
+    # Backport of protocol 5 for python < 3.8
+    import pickle5 as pickle
+
+try:
+    import numpy
+    from numpy.lib.format import descr_to_dtype, dtype_to_descr
+except ImportError:
+    numpy = None
+
+# Prefixes of the framed formats, plain pickles never start with a NUL byte.
+NDARRAY_MAGIC = b"\x00rcc-nd:"
+BUFFERS_MAGIC = b"\x00rcc-p5:"
+
+_count = struct.Struct("<I")
+_length = struct.Struct("<Q")
+
+
+class ZeroCopyPickleSerializer(BaseSerializer):
+    """
+    Pickle protocol 5 serializer keeping large buffers out of band.
+
+    ``dumps`` returns plain bytes for values without out of band buffers.
+    Otherwise it returns a list of buffers: a header, the pickle stream and
+    the raw buffers. The client writes them to redis one by one, without
+    joining them, and skips compression for them. C-contiguous NumPy arrays
+    (not of object dtype) take a faster path: a dtype description and shape
+    header followed by the array memory.
+
+    ``loads`` rebuilds buffers and arrays as views over the received bytes,
+    so they are not copied. Arrays rebuilt from ``bytes`` are read-only.
+    """
+
+    def __init__(self, options):
+        self._pickle_version = 5
+        if "PICKLE_VERSION" in options:
+            try:
+                self._pickle_version = max(5, int(options["PICKLE_VERSION"]))
+            except (ValueError, TypeError):
+                raise Exception( "PICKLE_VERSION value must be an integer" )
+
+    def dumps(self, value):
+        if numpy is not None and type(value) is numpy.ndarray and not value.dtype.hasobject:
+            return self._dumps_ndarray(value)
+
+        buffers = []
+        payload = pickle.dumps(value, self._pickle_version, buffer_callback=buffers.append)
+        if not buffers:
+            return payload
+
+        buffers = [buffer.raw() for buffer in buffers]
+        header = [BUFFERS_MAGIC, _count.pack(len(buffers)), _length.pack(len(payload))]
+        header.extend(_length.pack(len(buffer)) for buffer in buffers)
+        return [b"".join(header), payload] + buffers
+
+    def _dumps_ndarray(self, value):
+        # ascontiguousarray would turn 0-d arrays into 1-d ones.
+        if not value.flags.c_contiguous:
+            value = value.copy(order="C")
+        # The description keeps the fields of structured dtypes.
+        dtype = repr(dtype_to_descr(value.dtype)).encode("utf-8")
+        header = [NDARRAY_MAGIC, _count.pack(len(dtype)), dtype, _count.pack(value.ndim)]
+        header.extend(_length.pack(dim) for dim in value.shape)
+        return [b"".join(header), memoryview(value.reshape(-1).view(numpy.uint8))]
+
+    def loads(self, value):
+        view = memoryview(value)
+        if view[:len(NDARRAY_MAGIC)] == NDARRAY_MAGIC:
+            return self._loads_ndarray(value, view)
+        if view[:len(BUFFERS_MAGIC)] == BUFFERS_MAGIC:
+            return self._loads_buffers(view)
+        return pickle.loads(value)
+
+    def _loads_buffers(self, view):
+        offset = len(BUFFERS_MAGIC)
+        count, = _count.unpack_from(view, offset)
+        offset += _count.size
+        lengths = struct.unpack_from("<%dQ" % (count + 1), view, offset)
+        offset += _length.size * (count + 1)
+
+        payload = view[offset:offset + lengths[0]]
+        offset += lengths[0]
+        buffers = []
+        for length in lengths[1:]:
+            buffers.append(view[offset:offset + length])
+            offset += length
+        return pickle.loads(payload, buffers=buffers)
+
+    def _loads_ndarray(self, value, view):
+        if numpy is None:
+            raise Exception( "numpy is required to load cached arrays" )
+        offset = len(NDARRAY_MAGIC)
+        size, = _count.unpack_from(view, offset)
+        offset += _count.size
+        dtype = descr_to_dtype(ast.literal_eval(bytes(view[offset:offset + size]).decode("utf-8")))
+        offset += size
+        ndim, = _count.unpack_from(view, offset)
+        offset += _count.size
+        shape = struct.unpack_from("<%dQ" % ndim, view, offset)
+        offset += _length.size * ndim
+
+        count = 1
+        for dim in shape:
+            count *= dim
+        array = numpy.frombuffer(value, dtype=dtype, count=count, offset=offset)
+        return array.reshape(shape)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Compact binary form of the cluster slot map.
+
+Layout, little endian::
+
+    header      magic (8 bytes), generation (u64), body length (u32)
+    nodes       count (u32), then per node: host length (u16), host, port (u16)
+    groups      count (u32), then per group: node count (u8), node indexes (u16)
+    slot table  group index (u16) of each of the 16384 slots, 0xffff if unassigned
+
+The slot table has a fixed size and comes last, so the group serving a
+slot can be read straight from a memory mapped file.
+'''
+import mmap
+import os
+import struct
+
+SLOTS = 16384
+UNASSIGNED = 0xffff
+
+MAGIC = b"RCCSLOT1"
+_header = struct.Struct( "<8sQI" )
+_u32 = struct.Struct( "<I" )
+_u16 = struct.Struct( "<H" )
+_table = struct.Struct( "<%dH" % SLOTS )
+
+HEADER_SIZE = _header.size
+TABLE_SIZE = _table.size
+
+
+def _native( value ):
+    if isinstance( value, bytes ) and not isinstance( value, str ):
+        return value.decode( "utf-8" )
+    return value
+
+
+def encode_slots( ranges ):
+    """
+    Encode slot ranges, a list of ``(start, end, [(host, port), ...])``
+    with the master first, into the body of a slot map.
+    """
+    nodes = []
+    node_index = {}
+    groups = []
+    group_index = {}
+    table = [UNASSIGNED] * SLOTS
+
+    for start, end, params in ranges:
+        group = []
+        for host, port in params:
+            node = ( _native( host ), int( port ) )
+            if node not in node_index:
+                node_index[node] = len( nodes )
+                nodes.append( node )
+            group.append( node_index[node] )
+        group = tuple( group )
+        if group not in group_index:
+            group_index[group] = len( groups )
+            groups.append( group )
+        for slot in range( start, end + 1 ):
+            table[slot] = group_index[group]
+
+    body = [_u32.pack( len( nodes ) )]
+    for host, port in nodes:
+        host = host.encode( "utf-8" )
+        body.append( _u16.pack( len( host ) ) + host + _u16.pack( port ) )
+    body.append( _u32.pack( len( groups ) ) )
+    for group in groups:
+        body.append( struct.pack( "<B%dH" % len( group ), len( group ), *group ) )
+    body.append( _table.pack( *table ) )
+    return b"".join( body )
+
+
+def decode_groups( buf, offset = 0 ):
+    """
+    Decode the node groups of a slot map body.
+    Returns the groups, as lists of ``(host, port)``, and the offset of
+    the slot table.
+    """
+    count, = _u32.unpack_from( buf, offset )
+    offset += _u32.size
+    nodes = []
+    for _ in range( count ):
+        size, = _u16.unpack_from( buf, offset )
+        offset += _u16.size
+        host = bytes( buf[offset:offset + size] ).decode( "utf-8" )
+        offset += size
+        port, = _u16.unpack_from( buf, offset )
+        offset += _u16.size
+        nodes.append( ( str( host ), port ) )
+
+    count, = _u32.unpack_from( buf, offset )
+    offset += _u32.size
+    groups = []
+    for _ in range( count ):
+        size = struct.unpack_from( "<B", buf, offset )[0]
+        indexes = struct.unpack_from( "<%dH" % size, buf, offset + 1 )
+        offset += 1 + _u16.size * size
+        groups.append( [nodes[index] for index in indexes] )
+    return groups, offset
+
+
+def decode_slots( buf, offset = 0 ):
+    """
+    Decode a slot map body back into slot ranges.
+    """
+    groups, offset = decode_groups( buf, offset )
+    table = _table.unpack_from( buf, offset )
+
+    ranges = []
+    start = 0
+    for slot in range( 1, SLOTS + 1 ):
+        if slot == SLOTS or table[slot] != table[start]:
+            if table[start] != UNASSIGNED:
+                ranges.append( ( start, slot - 1, groups[table[start]] ) )
+            start = slot
+    return ranges
+
+
+def write_snapshot( path, ranges, generation = 0 ):
+    """
+    Atomically replace the snapshot file with the given slot ranges.
+    """
+    body = encode_slots( ranges )
+    tmp_path = "%s.%d.tmp" % ( path, os.getpid() )
+    with open( tmp_path, "wb" ) as f:
+        f.write( _header.pack( MAGIC, generation, len( body ) ) )
+        f.write( body )
+    os.rename( tmp_path, path )
+
+
+def read_snapshot( path ):
+    """
+    Read the slot ranges of a snapshot file, None if it is not valid.
+    """
+    with open( path, "rb" ) as f:
+        buf = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+    try:
+        if len( buf ) < HEADER_SIZE:
+            return None
+        magic, _, size = _header.unpack_from( buf, 0 )
+        if magic != MAGIC or len( buf ) < HEADER_SIZE + size:
+            return None
+        return decode_slots( buf, HEADER_SIZE )
+    finally:
+        buf.close()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Tags: invalidation of every key stored with a tag.
+
+A key set with ``tags`` is first added to a set of each of its tags. The
+members of a tag are sharded over ``TAG_SHARDS`` sets by the slot of the
+key, so that a popular tag is spread over the cluster instead of making
+one node hot. ``invalidate_tags`` reads the shards in parallel, unlinks
+the members and removes them from the sets, with one pipeline per node.
+
+A tag set expires together with its longest lived member. Members which
+expired or were deleted stay in the sets until then, a sample of them is
+pruned now and then when tags are added.
+'''
+import random
+
+# Sets the members of a tag are spread over.
+TAG_SHARDS = 16
+
+# Share of the tag additions pruning a sample of the tag set.
+TAG_PRUNE_RATE = 0.01
+
+# Members checked by a pruning.
+TAG_PRUNE_COUNT = 32
+
+TAG_KEY = "tag:%s:%d"
+
+
+def tag_key( tag, shard ):
+    return TAG_KEY % ( tag, shard )
+
+
+def tag_keys( tag, shards ):
+    """
+    Keys of all the shards of a tag.
+    """
+    return [tag_key( tag, shard ) for shard in range( shards )]
+
+
+def should_prune( rate ):
+    return rate > 0 and random.random() < rate
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Slot map shared by the processes of a host.
+
+The map lives in a memory mapped file of fixed size, in the format of
+``rediscluster_cache.slotmap``. The generation in the header works as a
+sequence lock: the writer makes it odd before touching the body and even
+again once done, readers retry when it is odd or changed while reading.
+
+Only the process holding an exclusive lock on ``path + ".lock"``, the
+leader, watches the cluster and writes the map. The lock is released by
+the system when the leader exits, the next process trying takes over.
+'''
+import mmap
+import os
+import struct
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from rediscluster_cache.slotmap import HEADER_SIZE, MAGIC, TABLE_SIZE, decode_slots, encode_slots
+
+# Room for the header, the slot table and a few hundred nodes.
+SEGMENT_SIZE = 256 * 1024
+
+# Times a reader waits a millisecond for a write in progress, a leader
+# which died while writing leaves the generation odd until the next one
+# publishes.
+READ_RETRIES = 100
+
+_header = struct.Struct( "<8sQI" )
+_generation = struct.Struct( "<Q" )
+GENERATION_OFFSET = 8
+
+
+class SharedTopology( object ):
+    '''
+    Slot map published in a memory mapped file by a leader process.
+    '''
+
+    def __init__( self, path, size = SEGMENT_SIZE ):
+        if fcntl is None:
+            raise Exception( "Shared topology is not supported on this platform" )
+        if size < HEADER_SIZE + TABLE_SIZE:
+            raise ValueError( "Shared topology segment is too small" )
+
+        self.path = path
+        self.size = size
+        self.leader = False
+        self._lock_file = None
+
+        fd = os.open( path, os.O_RDWR | os.O_CREAT, 0o644 )
+        try:
+            # Every process only ever grows the file to the same size.
+            if os.fstat( fd ).st_size < size:
+                os.ftruncate( fd, size )
+            self._buf = mmap.mmap( fd, size )
+        finally:
+            os.close( fd )
+
+    def try_lead( self ):
+        '''
+        Become the leader if no other process is, returns whether this
+        process leads.
+        '''
+        if self.leader:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open( self.path + ".lock", "a" )
+        try:
+            fcntl.flock( self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB )
+        except ( IOError, OSError ):
+            return False
+        self.leader = True
+        return True
+
+    def after_fork( self ):
+        '''
+        Give up the lead inherited from the parent process. The lock file
+        is shared with the parent, the child opens its own to try again.
+        '''
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.leader = False
+
+    def generation( self ):
+        '''
+        Generation of the published map, 0 if nothing was published yet.
+        '''
+        return _generation.unpack_from( self._buf, GENERATION_OFFSET )[0]
+
+    def read( self ):
+        '''
+        Return the generation and the slot ranges of the published map,
+        the ranges are None if there is no readable map.
+        '''
+        for _ in range( READ_RETRIES ):
+            generation = self.generation()
+            if generation % 2:
+                time.sleep( 0.001 )
+                continue
+            if not generation:
+                return 0, None
+            magic, _, size = _header.unpack_from( self._buf, 0 )
+            body = self._buf[HEADER_SIZE:HEADER_SIZE + min( size, self.size - HEADER_SIZE )]
+            if self.generation() != generation:
+                continue
+            if magic != MAGIC:
+                return generation, None
+            return generation, decode_slots( body )
+        return generation, None
+
+    def publish( self, ranges ):
+        '''
+        Write the slot ranges as the new map, returns its generation.
+        Only the leader publishes, other processes get None.
+        '''
+        if not self.leader:
+            return None
+        body = encode_slots( ranges )
+        if HEADER_SIZE + len( body ) > self.size:
+            raise ValueError( "Slot map does not fit in the shared topology segment" )
+
+        generation = self.generation()
+        # A previous leader may have died half way through a write.
+        generation += 1 if generation % 2 else 2
+        _generation.pack_into( self._buf, GENERATION_OFFSET, generation - 1 )
+        _header.pack_into( self._buf, 0, MAGIC, generation - 1, len( body ) )
+        self._buf[HEADER_SIZE:HEADER_SIZE + len( body )] = body
+        _generation.pack_into( self._buf, GENERATION_OFFSET, generation )
+        return generation
+
+    def close( self ):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.leader = False
+        self._buf.close()
@@ -182,7 +182,7 @@ def force_bytes( s, encoding = 'utf-8', strings_only = False, errors = 'strict'
             return s.decode( 'utf-8', errors ).encode( encoding, errors )
     if strings_only and is_protected_type( s ):
         return s
-    if isinstance( s, memoryview ):
+    if isinstance( s, ( memoryview, bytearray ) ):
         return bytes( s )
     return str( s ).encode( encoding, errors )
 
@@ -220,24 +220,48 @@ else:
 class CacheKey( str ):
     """
     A stub string class that we can use to check if a key was created already.
+    Without instance dict, it costs no more than the string it wraps.
     """
-
-    def __init__( self, key ):
-        self._key = key
+    __slots__ = ()
 
     if sys.version_info[0] < 3:
 
-        def __str__( self ):
-            return smart_bytes( self._key )
-
         def __unicode__( self ):
-            return smart_text( self._key )
-
-    else:
-
-        def __str__( self ):
-            return smart_text( self._key )
+            return smart_text( str( self ) )
 
     def original_key( self ):
-        key = self._key.rsplit( ":", 1 )[1]
+        key = self.rsplit( ":", 1 )[1]
         return key
+
+
+_undecoded = object()
+
+
+class LazyValue( object ):
+    """
+    A cached value kept in its raw form until ``value`` is first read,
+    then decoded once and memoised.
+    """
+    __slots__ = ( "_raw", "_decode", "_value" )
+
+    def __init__( self, raw, decode = None ):
+        self._raw = raw
+        self._decode = decode
+        self._value = _undecoded if decode is not None else raw
+
+    @property
+    def value( self ):
+        if self._value is _undecoded:
+            self._value = self._decode( self._raw )
+            self._raw = None
+            self._decode = None
+        return self._value
+
+    @property
+    def decoded( self ):
+        return self._value is not _undecoded
+
+    def __repr__( self ):
+        if self.decoded:
+            return "<LazyValue %r>" % ( self._value, )
+        return "<LazyValue undecoded, %d bytes>" % len( self._raw )
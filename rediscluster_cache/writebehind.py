@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Write-behind: set, delete and expire queued in the process and written by
+background flushers, so that the caller does not wait for redis.
+
+Writes to the same key are coalesced, the last one wins. The queue is
+split into one shard per flusher thread by the slot of the keys, so that
+the writes of a key are always made in order, each flusher sending its
+batches with one pipeline per node. A full shard applies the drop
+policy:
+
+    ``block``        wait up to ``block_timeout`` seconds for room, then
+                     drop the new write
+    ``drop_newest``  drop the new write
+    ``drop_oldest``  drop the oldest queued write
+
+Pending writes are flushed when the interpreter exits. Enable it with::
+
+    "WRITE_BEHIND": True,
+    "WRITE_BEHIND_KWARGS": {"max_size": 10000, "flushers": 2, "drop_policy": "drop_oldest"},
+'''
+import atexit
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+import weakref
+
+from rediscluster_cache.exceptions import ConnectionInterrupted
+
+BLOCK = "block"
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+
+SET = "set"
+DELETE = "delete"
+EXPIRE = "expire"
+
+# Seconds given to the pending writes when the interpreter exits.
+EXIT_FLUSH_TIMEOUT = 5
+
+_writers = weakref.WeakSet()
+
+logger = logging.getLogger( __name__ )
+
+
+def coalesce( previous, op, args ):
+    """
+    Merge a write into the write queued before for the same key: an
+    expire changes the expiry of a queued set, or deletes it if it is 0,
+    and is moot after a queued delete, other writes replace the queued one.
+    """
+    previous_op, previous_args = previous
+    if op == EXPIRE:
+        if previous_op == SET:
+            value, ex, raw = previous_args
+            seconds = args[0]
+            if seconds == 0:
+                return DELETE, ()
+            return SET, ( value, None if seconds is None else datetime.timedelta( seconds = seconds ), raw )
+        if previous_op == DELETE:
+            return previous
+    return op, args
+
+
+class _Shard( object ):
+    __slots__ = ( "queue", "condition", "thread", "in_flight", "writing" )
+
+    def __init__( self ):
+        self.queue = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.in_flight = 0
+        self.writing = frozenset()
+
+
+class WriteBehindQueue( object ):
+    """
+    Bounded queue of writes flushed by background threads.
+    """
+
+    def __init__( self, client, max_size = 10000, flushers = 1, batch_size = 500,
+                  drop_policy = DROP_OLDEST, block_timeout = 0.1 ):
+        if drop_policy not in ( BLOCK, DROP_NEWEST, DROP_OLDEST ):
+            raise ValueError( "Unknown drop policy %r" % drop_policy )
+        self._client = client
+        self.flushers = max( 1, flushers )
+        self.shard_size = max( 1, max_size // self.flushers )
+        self.batch_size = batch_size
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+        self._closed = False
+        self._lock = threading.Lock()
+        self._start()
+        _writers.add( self )
+
+    def _start( self ):
+        self._pid = os.getpid()
+        self._shards = [_Shard() for _ in range( self.flushers )]
+        for index, shard in enumerate( self._shards ):
+            shard.thread = threading.Thread( target = self._run, args = ( shard, ),
+                                             name = "rediscluster-cache-writer-%d" % index )
+            shard.thread.daemon = True
+            shard.thread.start()
+
+    def _shard( self, key ):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # The writes queued by the parent are its own to make.
+                    self._start()
+        return self._shards[self._client.node_manager.keyslot( key ) % self.flushers]
+
+    def put( self, op, key, *args ):
+        """
+        Queue a write of key, returns False if it was dropped.
+        """
+        shard = self._shard( key )
+        with shard.condition:
+            if self._closed:
+                self.dropped += 1
+                return False
+            previous = shard.queue.pop( key, None )
+            if previous is not None:
+                # Last write wins, queued again at the end.
+                op, args = coalesce( previous, op, args )
+                self.coalesced += 1
+            elif len( shard.queue ) >= self.shard_size and not self._make_room( shard ):
+                self.dropped += 1
+                return False
+            shard.queue[key] = ( op, args )
+            self.enqueued += 1
+            shard.condition.notify_all()
+        return True
+
+    def _make_room( self, shard ):
+        if self.drop_policy == DROP_OLDEST:
+            shard.queue.popitem( last = False )
+            self.dropped += 1
+            return True
+        if self.drop_policy == BLOCK:
+            deadline = time.time() + self.block_timeout
+            while len( shard.queue ) >= self.shard_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                shard.condition.wait( remaining )
+            return True
+        return False
+
+    def discard( self, key ):
+        """
+        Forget the queued write of key, overridden by a direct write, and
+        wait for a write of key the flusher is already making.
+        """
+        shard = self._shard( key )
+        with shard.condition:
+            shard.queue.pop( key, None )
+            if shard.thread is threading.current_thread():
+                return
+            # Made after it, the direct write is the one which lasts.
+            while key in shard.writing and shard.thread.is_alive():
+                shard.condition.wait( 1 )
+
+    def _run( self, shard ):
+        while True:
+            with shard.condition:
+                while not shard.queue and not self._closed:
+                    shard.condition.wait( 1 )
+                if not shard.queue:
+                    return
+                batch = []
+                while shard.queue and len( batch ) < self.batch_size:
+                    batch.append( shard.queue.popitem( last = False ) )
+                shard.in_flight += 1
+                shard.writing = frozenset( key for key, _ in batch )
+                shard.condition.notify_all()
+            try:
+                self._write( batch )
+            except Exception as e:
+                # The batch could not be routed, none of it was written.
+                self._count( failed = len( batch ) )
+                self._client.node_manager.request_refresh()
+                logger.warning( "Failed to write a batch of %d writes behind: %s", len( batch ), e )
+            finally:
+                with shard.condition:
+                    shard.in_flight -= 1
+                    shard.writing = frozenset()
+                    shard.condition.notify_all()
+
+    def _write( self, batch ):
+        client = self._client
+        writes = dict( batch )
+        for node, keys in client.group_by_client( writes, write = True ):
+            pipe = node.pipeline( transaction = False )
+            queued = 0
+            for key in keys:
+                op, args = writes[key]
+                try:
+                    if client.queue_write( node, pipe, op, key, *args ):
+                        queued += 1
+                    else:
+                        self._count( written = 1 )
+                except ConnectionInterrupted:
+                    self._count( failed = 1 )
+                except Exception as e:
+                    self._count( failed = 1 )
+                    logger.warning( "Failed to write %s of %r behind: %s", op, key, e )
+            if not queued:
+                continue
+            try:
+                pipe.execute()
+                self._count( written = queued )
+            except Exception as e:
+                self._count( failed = queued )
+                client.node_manager.report_error( node, e )
+
+    def _count( self, written = 0, failed = 0 ):
+        with self._lock:
+            self.written += written
+            self.failed += failed
+
+    def pending( self ):
+        return sum( len( shard.queue ) + shard.in_flight for shard in self._shards )
+
+    def flush( self, timeout = None ):
+        """
+        Wait until the writes queued so far are made, returns False if
+        some are still pending after timeout seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for shard in self._shards:
+            with shard.condition:
+                while shard.queue or shard.in_flight:
+                    if not shard.thread.is_alive():
+                        return False
+                    remaining = 1 if deadline is None else min( 1, deadline - time.time() )
+                    if remaining <= 0:
+                        return False
+                    shard.condition.wait( remaining )
+        return True
+
+    def close( self, timeout = EXIT_FLUSH_TIMEOUT ):
+        """
+        Flush the pending writes and stop the flushers, later writes are
+        dropped.
+        """
+        if self._pid != os.getpid():
+            return True
+        flushed = self.flush( timeout )
+        self._closed = True
+        for shard in self._shards:
+            with shard.condition:
+                shard.condition.notify_all()
+        for shard in self._shards:
+            if shard.thread is not threading.current_thread():
+                shard.thread.join( 1 )
+        return flushed
+
+    def stats( self ):
+        return {
+            "pending": self.pending(),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+
+@atexit.register
+def _flush_on_exit():
+    for writer in list( _writers ):
+        writer.close()
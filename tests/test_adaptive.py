@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+import zlib
+
+from rediscluster_cache.compressor.adaptive import AdaptiveCompressor, CompressionStats
+
+TEXT = b"the quick brown fox jumps over the lazy dog " * 100
+
+
+class TestCompressionStats( unittest.TestCase ):
+
+    def test_warmup( self ):
+        stats = CompressionStats()
+        for _ in range( 2 ):
+            stats.record( 0.0, 0.001, 100, 100, 0.1, 0, 3 )
+        self.assertTrue( stats.enabled )
+        stats.record( 0.0, 0.001, 100, 100, 0.1, 0, 3 )
+        self.assertFalse( stats.enabled )
+
+    def test_gain_drift( self ):
+        stats = CompressionStats()
+        for _ in range( 3 ):
+            stats.record( 0.0, 0.001, 100, 100, 0.1, 0, 3 )
+        for _ in range( 20 ):
+            stats.record( 0.5, 0.001, 100, 50, 0.1, 0, 3 )
+        self.assertTrue( stats.enabled )
+        self.assertAlmostEqual( stats.gain, 0.5, places = 1 )
+        self.assertEqual( ( stats.bytes_in, stats.bytes_out ), ( 2300, 1300 ) )
+
+    def test_saved_rate( self ):
+        stats = CompressionStats()
+        self.assertEqual( stats.saved_rate(), None )
+        # Half of 1000 bytes saved in a millisecond: 500000 bytes a second.
+        stats.record( 0.5, 0.001, 1000, 500, 0.1, 1000000, 1 )
+        self.assertAlmostEqual( stats.saved_rate(), 500000 )
+        self.assertFalse( stats.enabled )
+        stats.record( 0.5, 0.001, 1000, 500, 0.1, 100000, 1 )
+        self.assertTrue( stats.enabled )
+
+    def test_too_fast_to_tell( self ):
+        stats = CompressionStats()
+        stats.record( 0.5, 0.0, 1000, 500, 0.1, 1000000, 1 )
+        self.assertEqual( stats.saved_rate(), None )
+        self.assertTrue( stats.enabled )
+
+
+class TestAdaptiveCompressor( unittest.TestCase ):
+
+    def make( self, **options ):
+        options.setdefault( "COMPRESS_WARMUP", 3 )
+        options.setdefault( "COMPRESS_RESAMPLE_INTERVAL", 5 )
+        options.setdefault( "COMPRESS_MIN_SAVED_RATE", 0 )
+        return AdaptiveCompressor( options )
+
+    def test_compresses( self ):
+        compressor = self.make()
+        compressed = compressor.compress_group( TEXT, "str" )
+        self.assertTrue( len( compressed ) < len( TEXT ) )
+        self.assertEqual( compressor.decompress( compressed ), TEXT )
+        self.assertEqual( compressor.compress( TEXT ), compressed )
+
+    def test_short_values( self ):
+        compressor = self.make()
+        self.assertEqual( compressor.compress_group( b"short", "str" ), b"short" )
+        self.assertEqual( compressor.stats(), {"str": compressor._groups["str"].as_dict()} )
+        self.assertEqual( compressor.stats()["str"]["samples"], 0 )
+
+    def test_learns_per_group( self ):
+        compressor = self.make()
+        noise = os.urandom( 2000 )
+        for _ in range( 3 ):
+            self.assertEqual( compressor.compress_group( noise, "bytes" ), noise )
+            compressor.compress_group( TEXT, "str" )
+        stats = compressor.stats()
+        self.assertFalse( stats["bytes"]["compress"] )
+        self.assertTrue( stats["str"]["compress"] )
+        self.assertTrue( stats["str"]["saved_rate"] is None or stats["str"]["saved_rate"] > 0 )
+
+    def test_resamples( self ):
+        compressor = self.make()
+        noise = os.urandom( 2000 )
+        for _ in range( 3 ):
+            compressor.compress_group( noise, "bytes" )
+        # Skipped, but every fifth value is compressed again.
+        for _ in range( 5 ):
+            compressor.compress_group( TEXT, "bytes" )
+        stats = compressor.stats()["bytes"]
+        self.assertEqual( ( stats["samples"], stats["skipped"] ), ( 4, 5 ) )
+
+    def test_slow_compression( self ):
+        compressor = self.make( COMPRESS_MIN_SAVED_RATE = 1e15 )
+        for _ in range( 3 ):
+            compressor.compress_group( TEXT, "str" )
+        self.assertFalse( compressor.stats()["str"]["compress"] )
+
+    def test_default_group( self ):
+        compressor = self.make()
+        compressor.compress( TEXT )
+        self.assertEqual( list( compressor.stats() ), ["default"] )
+
+    def test_wrapped_compressor( self ):
+        compressor = self.make( ADAPTIVE_COMPRESSOR = "rediscluster_cache.compressor.zlib.ZlibCompressor" )
+        self.assertEqual( zlib.decompress( compressor.compress( TEXT ) ), TEXT )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerOpen
+
+
+class TestCircuitBreaker( unittest.TestCase ):
+
+    def make( self, **kwargs ):
+        options = {"window": 10, "min_calls": 4, "error_rate": 0.5, "open_time": 60}
+        options.update( kwargs )
+        return CircuitBreaker( "node", **options )
+
+    def trip( self, breaker ):
+        for _ in range( breaker.min_calls ):
+            breaker.before()
+            breaker.failure( 0.01 )
+
+    def test_closed_until_min_calls( self ):
+        breaker = self.make()
+        for _ in range( 3 ):
+            breaker.failure( 0.01 )
+        self.assertEqual( breaker.state, CLOSED )
+        breaker.failure( 0.01 )
+        self.assertEqual( breaker.state, OPEN )
+        self.assertEqual( breaker.opened, 1 )
+
+    def test_error_rate( self ):
+        breaker = self.make()
+        for failed in ( False, False, True, False, False, True ):
+            breaker.record( 0.01, failed )
+        self.assertEqual( breaker.state, CLOSED )
+        breaker.failure( 0.01 )
+        breaker.failure( 0.01 )
+        self.assertEqual( breaker.state, OPEN )
+
+    def test_slow_calls_count_as_failures( self ):
+        breaker = self.make( slow_call = 0.5 )
+        for _ in range( 4 ):
+            breaker.success( 0.1 )
+        self.assertEqual( breaker.state, CLOSED )
+        for _ in range( 4 ):
+            breaker.success( 1 )
+        self.assertEqual( breaker.state, OPEN )
+
+    def test_open_rejects( self ):
+        breaker = self.make()
+        self.trip( breaker )
+        self.assertFalse( breaker.allows() )
+        self.assertRaises( CircuitBreakerOpen, breaker.before )
+        self.assertEqual( breaker.rejected, 1 )
+
+    def test_half_open_probe_closes( self ):
+        breaker = self.make( open_time = 0 )
+        self.trip( breaker )
+        breaker.before()
+        self.assertEqual( breaker.state, HALF_OPEN )
+        # Only half_open_calls probes at a time.
+        self.assertRaises( CircuitBreakerOpen, breaker.before )
+        breaker.success( 0.01 )
+        self.assertEqual( breaker.state, CLOSED )
+        self.assertEqual( breaker.stats()["calls"], 0 )
+
+    def test_half_open_probe_failure_opens( self ):
+        breaker = self.make( open_time = 0 )
+        self.trip( breaker )
+        breaker.before()
+        breaker.failure( 0.01 )
+        self.assertEqual( breaker.state, OPEN )
+        self.assertEqual( breaker.opened, 2 )
+
+    def test_cancel_gives_back_the_probe( self ):
+        breaker = self.make( open_time = 0 )
+        self.trip( breaker )
+        breaker.before()
+        self.assertFalse( breaker.allows() )
+        breaker.cancel()
+        self.assertTrue( breaker.allows() )
+        breaker.before()
+        self.assertEqual( breaker.state, HALF_OPEN )
+
+    def test_after_fork_gives_back_the_probes( self ):
+        breaker = self.make( open_time = 0 )
+        self.trip( breaker )
+        breaker.before()
+        breaker.after_fork()
+        self.assertEqual( breaker.state, HALF_OPEN )
+        self.assertTrue( breaker.allows() )
+
+    def test_latency( self ):
+        breaker = self.make()
+        self.assertEqual( breaker.latency(), None )
+        for latency in range( 1, 11 ):
+            breaker.success( latency / 100.0 )
+        self.assertEqual( breaker.latency( 0.5 ), 0.06 )
+        self.assertEqual( breaker.latency( 0.95 ), 0.1 )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.chunking import CHUNK_MANIFEST, MANIFEST_MAX_SIZE, ChunkManifest, can_chunk, \
+    chunk_key, hash_tag, split_chunks
+
+
+def joined( chunks ):
+    return [chunk.tobytes() for chunk in chunks]
+
+
+class TestSplitChunks( unittest.TestCase ):
+
+    def test_one_buffer( self ):
+        self.assertEqual( joined( split_chunks( b"abcdefgh", 3 ) ), [b"abc", b"def", b"gh"] )
+        self.assertEqual( joined( split_chunks( b"abcdef", 3 ) ), [b"abc", b"def"] )
+        self.assertEqual( split_chunks( b"", 3 ), [] )
+
+    def test_no_copy( self ):
+        value = bytearray( b"abcdef" )
+        chunks = split_chunks( value, 3 )
+        value[0:1] = b"X"
+        self.assertEqual( joined( chunks ), [b"Xbc", b"def"] )
+
+    def test_buffers( self ):
+        value = [b"ab", b"cdefg", b"", b"h", b"ijklmnopq"]
+        chunks = joined( split_chunks( value, 4 ) )
+        self.assertEqual( chunks, [b"abcd", b"efgh", b"ijkl", b"mnop", b"q"] )
+
+    def test_small_buffers( self ):
+        chunks = joined( split_chunks( [b"a", b"b", b"c", b"d", b"e"], 2 ) )
+        self.assertEqual( chunks, [b"ab", b"cd", b"e"] )
+
+
+class TestKeys( unittest.TestCase ):
+
+    def test_hash_tag( self ):
+        self.assertEqual( hash_tag( "user:1" ), "user:1" )
+        self.assertEqual( hash_tag( "{user:1}:profile" ), "user:1" )
+        self.assertEqual( hash_tag( "{}:profile" ), "{}:profile" )
+        self.assertEqual( hash_tag( "a{b}{c}" ), "b" )
+
+    def test_chunk_keys_share_the_slot( self ):
+        key = chunk_key( "{user:1}:profile", "g", 2 )
+        self.assertTrue( key.startswith( "{user:1}:chunk:" ) and key.endswith( ":g:2" ) )
+        self.assertEqual( hash_tag( key ), "user:1" )
+        self.assertEqual( hash_tag( chunk_key( "plain", "g", 0 ) ), "plain" )
+
+    def test_chunk_keys_of_keys_sharing_a_hash_tag( self ):
+        self.assertNotEqual( chunk_key( "app:1:{user:42}:avatar", "g", 0 ),
+                             chunk_key( "other:7:{user:42}:report", "g", 0 ) )
+        self.assertEqual( chunk_key( "app:1:{user:42}:avatar", "g", 0 ),
+                          chunk_key( u"app:1:{user:42}:avatar", "g", 0 ) )
+
+    def test_can_chunk( self ):
+        self.assertTrue( can_chunk( "plain" ) )
+        self.assertTrue( can_chunk( "{tag}:key" ) )
+        self.assertFalse( can_chunk( "odd}key" ) )
+
+
+class TestChunkManifest( unittest.TestCase ):
+
+    def test_round_trip( self ):
+        manifest = ChunkManifest( 3, 1500000, raw = True )
+        value = manifest.dumps()
+        self.assertTrue( value.startswith( CHUNK_MANIFEST ) )
+        self.assertTrue( len( value ) < MANIFEST_MAX_SIZE )
+        loaded = ChunkManifest.loads( value )
+        self.assertEqual( ( loaded.generation, loaded.count, loaded.size, loaded.raw ),
+                          ( manifest.generation, 3, 1500000, True ) )
+        self.assertEqual( loaded.keys( "key" ), manifest.keys( "key" ) )
+        self.assertEqual( len( set( manifest.keys( "key" ) ) ), 3 )
+
+    def test_plain_values( self ):
+        self.assertEqual( ChunkManifest.loads( b"plain" ), None )
+        self.assertEqual( ChunkManifest.loads( 10 ), None )
+        self.assertEqual( ChunkManifest.loads( CHUNK_MANIFEST + b"broken" ), None )
+        self.assertEqual( ChunkManifest.loads( CHUNK_MANIFEST + b"\xff:1:2:0" ), None )
+
+
+if __name__ == "__main__":
+    unittest.main()
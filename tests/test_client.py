@@ -0,0 +1,644 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from redis.exceptions import ConnectionError
+
+from rediscluster_cache.chunking import ChunkManifest
+from rediscluster_cache.client.default import DefaultClient
+from rediscluster_cache.exceptions import ConnectionInterrupted
+from rediscluster_cache.scripts import SCRIPTS, Script
+from rediscluster_cache.slotmap import write_snapshot
+from rediscluster_cache.util import CacheKey, default_key_func
+
+SERVER = [{"host": "127.0.0.1", "port": 1}]
+
+SCRIPT_NAMES = dict( ( Script( name, source ).sha, name ) for name, source in SCRIPTS.items() )
+
+
+def to_bytes( value ):
+    if isinstance( value, bytes ):
+        return value
+    if isinstance( value, ( bytearray, memoryview ) ):
+        return bytes( value )
+    if not isinstance( value, type( u"" ) ):
+        value = "%s" % ( value, )
+    return value.encode( "utf-8" )
+
+
+def to_seconds( ex ):
+    if isinstance( ex, datetime.timedelta ):
+        return int( ex.total_seconds() )
+    return ex
+
+
+class FakeRedis( object ):
+    """
+    Node keeping its keys in memory, with their expiry times in ``ttls``
+    (None for no expiry). Time never passes, the scripts of the registry
+    are run by their Python equivalent.
+    """
+
+    def __init__( self ):
+        self.values = {}
+        self.ttls = {}
+        self.commands = []
+        self.connection_pool = self
+        self.connection_kwargs = {"host": "127.0.0.1", "port": 1}
+
+    def _key( self, key ):
+        return "%s" % ( key, )
+
+    def _store( self, key, value, seconds = None ):
+        key = self._key( key )
+        self.values[key] = value
+        self.ttls[key] = seconds
+
+    def _remove( self, key ):
+        key = self._key( key )
+        self.ttls.pop( key, None )
+        return self.values.pop( key, None ) is not None
+
+    def execute_command( self, command, *args ):
+        return getattr( self, command.lower() )( *args )
+
+    def get( self, key ):
+        self.commands.append( ( "GET", self._key( key ) ) )
+        return self.values.get( self._key( key ) )
+
+    def mget( self, keys ):
+        return [self.get( key ) for key in keys]
+
+    def getrange( self, key, start, end ):
+        return ( self.get( key ) or b"" )[start:end + 1]
+
+    def set( self, key, value, ex = None, nx = False, xx = False ):
+        self.commands.append( ( "SET", self._key( key ) ) )
+        exists = self._key( key ) in self.values
+        if ( nx and exists ) or ( xx and not exists ):
+            return None
+        self._store( key, to_bytes( value ), to_seconds( ex ) )
+        return True
+
+    def append( self, key, value ):
+        self.values[self._key( key )] += to_bytes( value )
+        return len( self.values[self._key( key )] )
+
+    def delete( self, *keys ):
+        return sum( self._remove( key ) for key in keys )
+
+    unlink = delete
+
+    def exists( self, *keys ):
+        return sum( self._key( key ) in self.values for key in keys )
+
+    def expire( self, key, seconds ):
+        if self._key( key ) not in self.values:
+            return 0
+        if int( seconds ) <= 0:
+            self._remove( key )
+        else:
+            self.ttls[self._key( key )] = int( seconds )
+        return 1
+
+    def persist( self, key ):
+        if self.ttls.get( self._key( key ) ) is None:
+            return 0
+        self.ttls[self._key( key )] = None
+        return 1
+
+    def ttl( self, key ):
+        if self._key( key ) not in self.values:
+            return -2
+        ttl = self.ttls[self._key( key )]
+        return -1 if ttl is None else ttl
+
+    def incrby( self, key, delta ):
+        value = int( self.values.get( self._key( key ), 0 ) ) + int( delta )
+        self.values[self._key( key )] = to_bytes( value )
+        self.ttls.setdefault( self._key( key ), None )
+        return value
+
+    def sadd( self, key, *members ):
+        members = set( to_bytes( member ) for member in members )
+        current = self.values.setdefault( self._key( key ), set() )
+        self.ttls.setdefault( self._key( key ), None )
+        added = len( members - current )
+        current.update( members )
+        return added
+
+    def srem( self, key, *members ):
+        current = self.values.get( self._key( key ), set() )
+        members = set( to_bytes( member ) for member in members ) & current
+        current.difference_update( members )
+        if not current:
+            self._remove( key )
+        return len( members )
+
+    def smembers( self, key ):
+        return set( self.values.get( self._key( key ), set() ) )
+
+    def srandmember( self, key, count ):
+        return list( self.smembers( key ) )[:count]
+
+    def flushall( self ):
+        self.values.clear()
+        self.ttls.clear()
+
+    def script_load( self, source ):
+        return hashlib.sha1( source.encode( "utf-8" ) ).hexdigest()
+
+    def evalsha( self, sha, numkeys, *keys_and_args ):
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        return getattr( self, "script_" + SCRIPT_NAMES[sha] )( keys, args )
+
+    def script_incr_existing( self, keys, args ):
+        if not self.exists( keys[0] ):
+            return None
+        return self.incrby( keys[0], args[0] )
+
+    def script_get_with_ttl( self, keys, args ):
+        value = self.get( keys[0] )
+        if value is None:
+            return None
+        return [value, self.ttl( keys[0] )]
+
+    def script_get_and_touch( self, keys, args ):
+        value = self.get( keys[0] )
+        if value is None:
+            return None
+        seconds = int( args[0] )
+        if seconds < 0:
+            self.persist( keys[0] )
+        else:
+            self.expire( keys[0], seconds )
+        return value
+
+    def script_incr_with_ttl( self, keys, args ):
+        value = self.incrby( keys[0], args[0] )
+        seconds = int( args[1] )
+        if seconds == 0:
+            self.delete( keys[0] )
+        elif seconds > 0 and self.ttl( keys[0] ) == -1:
+            self.expire( keys[0], seconds )
+        return value
+
+    def script_compare_and_set( self, keys, args ):
+        current = self.values.get( self._key( keys[0] ) )
+        token = hashlib.sha1( current ).hexdigest() if current is not None else ""
+        if token != to_bytes( args[0] ).decode( "ascii" ):
+            return 0
+        seconds = int( args[2] )
+        if seconds == 0:
+            self.delete( keys[0] )
+        else:
+            self._store( keys[0], to_bytes( args[1] ), seconds if seconds > 0 else None )
+        if current is not None and current.startswith( to_bytes( args[3] ) ):
+            return current
+        return 1
+
+    def script_tag_add( self, keys, args ):
+        created = not self.exists( keys[0] )
+        self.sadd( keys[0], args[0] )
+        timeout = int( args[1] )
+        ttl = self.ttl( keys[0] )
+        if timeout == 0:
+            self.persist( keys[0] )
+        elif created or 0 <= ttl < timeout:
+            self.expire( keys[0], timeout )
+        return 1
+
+    def pipeline( self, transaction = True ):
+        return FakePipeline( self, buffered = True )
+
+    def transaction( self, func, *watches, **kwargs ):
+        pipe = FakePipeline( self, buffered = False )
+        value = func( pipe )
+        results = pipe.execute()
+        return value if kwargs.get( "value_from_callable" ) else results
+
+
+class FakePipeline( object ):
+    """
+    Pipeline of a FakeRedis, running the commands at once until ``multi``
+    unless buffered.
+    """
+
+    def __init__( self, node, buffered ):
+        self._node = node
+        self._buffered = buffered
+        self._calls = []
+
+    def multi( self ):
+        self._buffered = True
+
+    def execute( self, raise_on_error = True ):
+        calls, self._calls = self._calls, []
+        return [call() for call in calls]
+
+    def __getattr__( self, name ):
+        method = getattr( self._node, name )
+
+        def call( *args, **kwargs ):
+            if not self._buffered:
+                return method( *args, **kwargs )
+            self._calls.append( lambda: method( *args, **kwargs ) )
+            return self
+        return call
+
+
+class FakeBackend( object ):
+    key_prefix = "test"
+    version = 1
+    key_func = staticmethod( default_key_func )
+    default_timeout = 300
+
+
+class ClientTestCase( unittest.TestCase ):
+    """
+    Clients whose keys all live on one FakeRedis node.
+    """
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join( self.dir, "slots" )
+        write_snapshot( self.snapshot, [( 0, 16383, [( "127.0.0.1", 1 )] )] )
+        self.clients = []
+
+    def tearDown( self ):
+        for client in self.clients:
+            client.close()
+            client.release()
+        shutil.rmtree( self.dir )
+
+    def make( self, **options ):
+        options.setdefault( "COMPRESSOR", "rediscluster_cache.compressor.identity.IdentityCompressor" )
+        params = {"SLOTS_SNAPSHOT": self.snapshot, "CHECK_INTERVAL": 3600, "OPTIONS": options}
+        client = DefaultClient( SERVER, params, FakeBackend() )
+        self.clients.append( client )
+        self.node = node = FakeRedis()
+        client.get_client = lambda key, write = True: node
+        client.get_clients = lambda: [node]
+        client.group_by_client = lambda keys, write = False: [( node, list( keys ) )] if keys else []
+        return client
+
+
+class TestClose( ClientTestCase ):
+    """
+    Django closes the cache after every request, the client is used again.
+    """
+
+    def test_write_behind_after_close( self ):
+        client = self.make( WRITE_BEHIND = True )
+        self.assertTrue( client.set( "a", 1 ) )
+        writer = client.writer
+        client.close()
+        self.assertTrue( client.set( "b", 2 ) )
+        self.assertTrue( client.delete( "a" ) )
+        self.assertTrue( client.writer is writer )
+        self.assertTrue( writer.flush( 5 ) )
+        self.assertEqual( writer.stats()["dropped"], 0 )
+        self.assertEqual( client.get( "b" ), 2 )
+        self.assertEqual( client.get( "a" ), None )
+
+    def test_release_flushes_write_behind( self ):
+        client = self.make( WRITE_BEHIND = True )
+        client.set( "a", 1 )
+        client.release()
+        self.assertEqual( client.get( "a" ), 1 )
+
+    def test_counters_after_close( self ):
+        client = self.make( COUNTER_AGGREGATOR_KWARGS = {"interval": 3600} )
+        client.counter( "views" ).incr( 2 )
+        aggregator = client.aggregator
+        client.close()
+        self.assertTrue( client.aggregator is aggregator )
+        self.assertTrue( aggregator._thread.is_alive() )
+        client.counter( "views" ).incr( 3 )
+        self.assertEqual( aggregator.flush(), 1 )
+        self.assertEqual( client.get_counter( "views" ), 5 )
+
+    def test_release_flushes_counters( self ):
+        client = self.make( COUNTER_AGGREGATOR_KWARGS = {"interval": 3600} )
+        client.counter( "views", timeout = 60 ).incr( 2 )
+        aggregator = client.aggregator
+        client.release()
+        self.assertFalse( aggregator._thread.is_alive() )
+        self.assertEqual( self.node.values, {"test:1:views": b"2"} )
+        self.assertEqual( self.node.ttls, {"test:1:views": 60} )
+
+
+class TestChunks( ClientTestCase ):
+
+    def make( self, **options ):
+        options.setdefault( "CHUNK_THRESHOLD", 100 )
+        options.setdefault( "CHUNK_SIZE", 64 )
+        return super( TestChunks, self ).make( **options )
+
+    def chunk_keys( self ):
+        return sorted( key for key in self.node.values if ":chunk:" in key )
+
+    def test_round_trip( self ):
+        client = self.make()
+        value = {"data": "x" * 1000}
+        self.assertTrue( client.set( "big", value, timeout = 60 ) )
+        manifest = ChunkManifest.loads( self.node.values["test:1:big"] )
+        self.assertTrue( manifest.count > 1 )
+        self.assertEqual( self.chunk_keys(), sorted( manifest.keys( "test:1:big" ) ) )
+        self.assertEqual( set( self.node.ttls[key] for key in self.chunk_keys() ), set( [60] ) )
+        self.assertEqual( client.get( "big" ), value )
+        self.assertEqual( client.get_many( ["big", "small"] ), {"big": value} )
+        self.assertEqual( client.delete( "big" ), 1 )
+        self.assertEqual( self.node.values, {} )
+
+    def test_raw_bytes( self ):
+        client = self.make()
+        value = os.urandom( 1000 )
+        client.set( "big", value )
+        self.assertEqual( client.get( "big" ), value )
+        self.assertEqual( b"".join( client.get_stream( "big" ) ), value )
+
+    def test_missing_chunk( self ):
+        client = self.make()
+        client.set( "big", b"x" * 1000 )
+        self.node.delete( self.chunk_keys()[0] )
+        self.assertEqual( client.get( "big", default = "gone" ), "gone" )
+
+    def test_keys_sharing_a_hash_tag( self ):
+        client = self.make()
+        first, second = "{user:42}:avatar", "{user:42}:report"
+        client.set( first, b"a" * 1000 )
+        client.set( second, b"b" * 1000 )
+        # Even with the same generation, the chunks are apart.
+        manifest = ChunkManifest.loads( self.node.values[client.make_key( first )] )
+        self.assertFalse( set( manifest.keys( client.make_key( first ) ) ) &
+                          set( manifest.keys( client.make_key( second ) ) ) )
+        self.assertEqual( client.get( first ), b"a" * 1000 )
+        self.assertEqual( client.get( second ), b"b" * 1000 )
+
+    def test_overwritten_by_a_small_value( self ):
+        client = self.make()
+        client.set( "big", b"x" * 1000, timeout = None )
+        self.assertTrue( self.chunk_keys() )
+        self.assertTrue( client.set( "big", "small", timeout = None ) )
+        self.assertEqual( self.chunk_keys(), [] )
+        self.assertEqual( client.get( "big" ), "small" )
+
+    def test_overwritten_by_a_chunked_value( self ):
+        client = self.make()
+        client.set( "big", b"x" * 1000 )
+        first = self.chunk_keys()
+        client.set( "big", b"y" * 1000 )
+        self.assertFalse( set( first ) & set( self.chunk_keys() ) )
+        self.assertEqual( len( self.chunk_keys() ), len( first ) )
+
+    def test_overwritten_by_set_many( self ):
+        client = self.make()
+        client.set( "big", b"x" * 1000, timeout = None )
+        self.assertEqual( client.set_many( {"big": 1, "other": "small"} ), [] )
+        self.assertEqual( self.chunk_keys(), [] )
+        self.assertEqual( client.get_many( ["big", "other"] ), {"big": 1, "other": "small"} )
+
+    def test_overwritten_behind( self ):
+        client = self.make( WRITE_BEHIND = True )
+        client.set( "big", b"x" * 1000, timeout = None, write_behind = False )
+        client.set( "big", "small" )
+        self.assertTrue( client.writer.flush( 5 ) )
+        self.assertEqual( self.chunk_keys(), [] )
+
+    def test_overwritten_by_cas( self ):
+        client = self.make()
+        client.set( "big", b"x" * 1000, timeout = None )
+        value, token = client.gets( "big" )
+        self.assertEqual( value, b"x" * 1000 )
+        self.assertTrue( client.cas( "big", "small", token ) )
+        self.assertEqual( self.chunk_keys(), [] )
+        self.assertEqual( client.get( "big" ), "small" )
+
+    def test_add( self ):
+        client = self.make()
+        self.assertTrue( client.add( "big", b"x" * 1000 ) )
+        self.assertFalse( client.add( "big", "small" ) )
+        self.assertFalse( client.add( "big", b"y" * 1000 ) )
+        self.assertEqual( client.get( "big" ), b"x" * 1000 )
+
+    def test_expire( self ):
+        client = self.make()
+        client.set( "big", b"x" * 1000, timeout = None )
+        self.assertTrue( client.expire( "big", 30 ) )
+        self.assertEqual( set( self.node.ttls.values() ), set( [30] ) )
+        self.assertTrue( client.touch( "big", 0 ) )
+        self.assertEqual( self.node.values, {} )
+
+
+class TestRecords( ClientTestCase ):
+
+    def make( self, **options ):
+        options.setdefault( "SERIALIZER", "rediscluster_cache.serializers.record.RecordSerializer" )
+        options.setdefault( "RECORD_SCHEMA", [( "zip", "5s" )] )
+        return super( TestRecords, self ).make( **options )
+
+    def test_digits_record( self ):
+        client = self.make()
+        self.assertEqual( client.decode( client.encode( {"zip": b"90210"} ) ), {"zip": b"90210"} )
+        client.set( "home", {"zip": b"90210"} )
+        self.assertEqual( client.get( "home" ), {"zip": b"90210"} )
+
+    def test_integers( self ):
+        client = self.make()
+        client.set( "count", 42 )
+        self.assertEqual( client.get( "count" ), 42 )
+        self.assertEqual( client.decode( 42 ), 42 )
+
+
+class TestMakeKey( ClientTestCase ):
+
+    def test_cached( self ):
+        client = self.make()
+        key = client.make_key( "a" )
+        self.assertEqual( key, "test:1:a" )
+        self.assertTrue( isinstance( key, CacheKey ) )
+        self.assertTrue( client.make_key( "a" ) is key )
+        self.assertTrue( client.make_key( key, version = 3 ) is key )
+
+    def test_reset_on_backend_change( self ):
+        client = self.make()
+        client.make_key( "a" )
+        client._backend.version = 2
+        self.assertEqual( client.make_key( "a" ), "test:2:a" )
+        client._backend.key_prefix = "other"
+        self.assertEqual( client.make_key( "a" ), "other:2:a" )
+        self.assertEqual( list( client._made_keys ), ["a"] )
+
+    def test_bounded( self ):
+        client = self.make( KEY_CACHE_SIZE = 2 )
+        client.make_key( "a" )
+        client.make_key( "b" )
+        self.assertEqual( len( client._made_keys ), 2 )
+        self.assertEqual( client.make_key( "c" ), "test:1:c" )
+        self.assertEqual( list( client._made_keys ), ["c"] )
+
+    def test_not_cached( self ):
+        client = self.make()
+        self.assertEqual( client.make_key( "a", version = 3 ), "test:3:a" )
+        self.assertEqual( client.make_key( "a", prefix = "other" ), "other:1:a" )
+        self.assertEqual( client.make_key( "a", group = False ), "test:1:a" )
+        self.assertEqual( client.make_key( 5 ), "test:1:5" )
+        self.assertEqual( client._made_keys, {} )
+
+    def test_key_func( self ):
+        client = self.make()
+        client._backend.key_func = lambda key, prefix, version: "%s|%s|%s" % ( prefix, version, key )
+        self.assertEqual( client.make_key( "a", version = 3 ), "test|3|a" )
+
+    def test_key_groups( self ):
+        client = self.make( KEY_GROUP_FUNCTION = lambda key: key.split( ":" )[0] if ":" in key else None,
+                            KEY_GROUP_SLOTS = 1 )
+        self.assertEqual( client.make_key( "user:1" ), "test:1:{user}:user:1" )
+        self.assertEqual( client.make_key( "user:1", version = 2 ), "test:2:{user}:user:1" )
+        # Keys without a group, tagged already or made without group.
+        self.assertEqual( client.make_key( "plain" ), "test:1:plain" )
+        self.assertEqual( client.make_key( "{x}:user:1" ), "test:1:{x}:user:1" )
+        self.assertEqual( client.make_key( "user:1", group = False ), "test:1:user:1" )
+
+    def test_key_group_slots( self ):
+        client = self.make( KEY_GROUP_FUNCTION = lambda key: "user", KEY_GROUP_SLOTS = 4 )
+        tags = set( client.make_key( "user:%d" % index ).split( "}" )[0] for index in range( 100 ) )
+        self.assertEqual( tags, set( "test:1:{user.%d" % index for index in range( 4 ) ) )
+
+
+class TestCompoundOperations( ClientTestCase ):
+
+    def test_get_with_ttl( self ):
+        client = self.make()
+        self.assertEqual( client.get_with_ttl( "a", default = "missing" ), ( "missing", 0 ) )
+        client.set( "a", {"x": 1}, timeout = 60 )
+        self.assertEqual( client.get_with_ttl( "a" ), ( {"x": 1}, 60 ) )
+        client.set( "b", 2, timeout = None )
+        self.assertEqual( client.get_with_ttl( "b" ), ( 2, None ) )
+
+    def test_get_and_touch( self ):
+        client = self.make()
+        self.assertEqual( client.get_and_touch( "a", timeout = 60, default = "missing" ), "missing" )
+        client.set( "a", "value", timeout = 10 )
+        self.assertEqual( client.get_and_touch( "a", timeout = 60 ), "value" )
+        self.assertEqual( client.ttl( "a" ), 60 )
+        self.assertEqual( client.get_and_touch( "a", timeout = None ), "value" )
+        self.assertEqual( client.ttl( "a" ), None )
+        # Read a last time and expired at once.
+        self.assertEqual( client.get_and_touch( "a", timeout = 0 ), "value" )
+        self.assertEqual( client.get( "a" ), None )
+
+    def test_incr_with_ttl( self ):
+        client = self.make()
+        self.assertEqual( client.incr_with_ttl( "views", 2, timeout = 60 ), 2 )
+        self.assertEqual( client.ttl( "views" ), 60 )
+        # The expiry time of an existing key is kept.
+        self.assertEqual( client.incr_with_ttl( "views", 3, timeout = 600 ), 5 )
+        self.assertEqual( client.ttl( "views" ), 60 )
+        self.assertEqual( client.incr_with_ttl( "forever", timeout = None ), 1 )
+        self.assertEqual( client.ttl( "forever" ), None )
+        self.assertEqual( client.incr_with_ttl( "gone", timeout = 0 ), 1 )
+        self.assertFalse( client.has_key( "gone" ) )
+
+    def test_gets_and_cas( self ):
+        client = self.make()
+        self.assertEqual( client.gets( "a", default = "missing" ), ( "missing", "" ) )
+        self.assertTrue( client.cas( "a", 1, "" ) )
+        self.assertFalse( client.cas( "a", 2, None ) )
+        value, token = client.gets( "a" )
+        self.assertEqual( value, 1 )
+        self.assertTrue( client.cas( "a", 2, token, timeout = 30 ) )
+        self.assertEqual( ( client.get( "a" ), client.ttl( "a" ) ), ( 2, 30 ) )
+        # The token changed with the value.
+        self.assertFalse( client.cas( "a", 3, token ) )
+        self.assertEqual( client.get( "a" ), 2 )
+
+    def test_cas_timeouts( self ):
+        client = self.make()
+        client.set( "a", 1 )
+        self.assertTrue( client.cas( "a", 2, client.gets( "a" )[1], timeout = None ) )
+        self.assertEqual( client.ttl( "a" ), None )
+        self.assertTrue( client.cas( "a", 3, client.gets( "a" )[1], timeout = 0 ) )
+        self.assertFalse( client.has_key( "a" ) )
+
+
+class TestTags( ClientTestCase ):
+
+    def make( self, **options ):
+        options.setdefault( "TAG_SHARDS", 4 )
+        options.setdefault( "TAG_PRUNE_RATE", 0 )
+        client = super( TestTags, self ).make( **options )
+        client.node_manager.logger.disabled = True
+        return client
+
+    def members( self, tag ):
+        members = set()
+        for index in range( 4 ):
+            members.update( self.node.smembers( "test:1:tag:%s:%d" % ( tag, index ) ) )
+        return members
+
+    def test_set_with_tags( self ):
+        client = self.make()
+        self.assertTrue( client.set( "a", 1, timeout = 60, tags = ["users", "admins"] ) )
+        self.assertEqual( self.members( "users" ), set( [b"test:1:a"] ) )
+        self.assertEqual( self.members( "admins" ), set( [b"test:1:a"] ) )
+        # The tag sets live as long as their longest lived member.
+        tag_keys = [key for key in self.node.values if ":tag:" in key]
+        self.assertEqual( [self.node.ttls[key] for key in tag_keys], [60, 60] )
+        client.set( "b", 1, timeout = None, tags = ["users"] )
+        self.assertEqual( self.members( "users" ), set( [b"test:1:a", b"test:1:b"] ) )
+
+    def test_failed_tagging_removes_the_key( self ):
+        client = self.make()
+
+        def evalsha( *args ):
+            raise ConnectionError( "reset" )
+        self.node.evalsha = evalsha
+        self.assertRaises( ConnectionInterrupted, client.set, "a", 1, tags = ["users"] )
+        self.assertEqual( client.get( "a" ), None )
+
+    def test_invalidate_tags( self ):
+        client = self.make()
+        client.set( "a", 1, tags = ["users"] )
+        client.set( "b", 2, tags = ["users", "admins"] )
+        client.set( "c", 3, tags = ["admins"] )
+        client.set( "d", 4 )
+        self.assertEqual( client.invalidate_tags( ["users"] ), 2 )
+        self.assertEqual( client.get_many( ["a", "b", "c", "d"] ), {"c": 3, "d": 4} )
+        self.assertEqual( self.members( "users" ), set() )
+        # Left to be pruned from the other tags.
+        self.assertEqual( self.members( "admins" ), set( [b"test:1:b", b"test:1:c"] ) )
+        self.assertEqual( client.invalidate_tags( ["users"] ), 0 )
+
+    def test_invalidate_keeps_keys_tagged_meanwhile( self ):
+        client = self.make()
+        client.set( "a", 1, tags = ["users"] )
+        unlink = self.node.unlink
+
+        def tagged_meanwhile( *keys ):
+            deleted = unlink( *keys )
+            client.set( "b", 2, tags = ["users"] )
+            return deleted
+        self.node.unlink = tagged_meanwhile
+        self.assertEqual( client.invalidate_tags( ["users"] ), 1 )
+        self.assertEqual( client.get( "b" ), 2 )
+        self.assertEqual( self.members( "users" ), set( [b"test:1:b"] ) )
+
+    def test_prune_tags( self ):
+        client = self.make()
+        client.set( "a", 1, tags = ["users"] )
+        client.set( "b", 2, tags = ["users"] )
+        client.delete( "a" )
+        client.prune_tags( ["users"] )
+        self.assertEqual( self.members( "users" ), set( [b"test:1:b"] ) )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rediscluster_cache.client.default import DefaultClient, _Inline
+from rediscluster_cache.slotmap import write_snapshot
+from rediscluster_cache.util import default_key_func
+
+SERVER = [{"host": "127.0.0.1", "port": 1}]
+
+
+class FakeBackend( object ):
+    key_prefix = "test"
+    version = 1
+    key_func = staticmethod( default_key_func )
+    default_timeout = 300
+
+
+class TestCodecPool( unittest.TestCase ):
+    """
+    Clients routing with a slot map snapshot, nothing is sent.
+    """
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join( self.dir, "slots" )
+        write_snapshot( self.snapshot, [( 0, 16383, [( "127.0.0.1", 1 )] )] )
+        self.clients = []
+
+    def tearDown( self ):
+        for client in self.clients:
+            client.close()
+            client.release()
+        shutil.rmtree( self.dir )
+
+    def make( self, **options ):
+        options.setdefault( "COMPRESSOR", "rediscluster_cache.compressor.zlib.ZlibCompressor" )
+        params = {"SLOTS_SNAPSHOT": self.snapshot, "CHECK_INTERVAL": 3600, "OPTIONS": options}
+        client = DefaultClient( SERVER, params, FakeBackend() )
+        self.clients.append( client )
+        return client
+
+    def test_no_pool( self ):
+        client = self.make()
+        self.assertTrue( client.codec_pool is None )
+        value = {"data": "x" * 100000}
+        encoded = client.encode_async( value )
+        self.assertTrue( isinstance( encoded, _Inline ) )
+        self.assertEqual( encoded.get(), client.encode( value ) )
+        self.assertTrue( isinstance( client.decode_async( encoded.get() ), _Inline ) )
+
+    def test_round_trip( self ):
+        client = self.make( CODEC_WORKERS = 2, CODEC_MIN_SIZE = 1024 )
+        for value in ( {"data": "x" * 100000}, "small", [1, 2, 3], 3.5 ):
+            encoded = client.encode_async( value ).get()
+            self.assertEqual( client.decode_async( encoded ).get(), value )
+            self.assertEqual( client.decode( encoded ), value )
+
+    def test_large_values_use_the_pool( self ):
+        client = self.make( CODEC_WORKERS = 2, CODEC_MIN_SIZE = 1024 )
+        self.assertFalse( isinstance( client.encode_async( "x" * 100000 ), _Inline ) )
+        self.assertTrue( isinstance( client.encode_async( "small" ), _Inline ) )
+        large = client.encode( os.urandom( 4096 ) )
+        self.assertTrue( len( large ) >= 1024 )
+        self.assertFalse( isinstance( client.decode_async( large ), _Inline ) )
+        self.assertTrue( isinstance( client.decode_async( client.encode( "small" ) ), _Inline ) )
+
+    def test_integers_are_not_serialized( self ):
+        client = self.make( CODEC_WORKERS = 2, CODEC_MIN_SIZE = 0 )
+        encoded = client.encode_async( 42 )
+        self.assertTrue( isinstance( encoded, _Inline ) )
+        self.assertEqual( encoded.get(), 42 )
+        self.assertEqual( client.decode_async( b"42" ).get(), 42 )
+        # Booleans are pickled to be given back as booleans.
+        self.assertTrue( client.decode_async( client.encode_async( True ).get() ).get() is True )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.chunking import hash_tag
+from rediscluster_cache.colocation import group_key, segment_group
+
+
+class TestColocation( unittest.TestCase ):
+
+    def test_segment_group( self ):
+        self.assertEqual( segment_group( "user:42:profile" ), "user:42" )
+        self.assertEqual( segment_group( "user:42:orders:7" ), "user:42" )
+        self.assertEqual( segment_group( "user:42" ), None )
+        self.assertEqual( segment_group( b"user:42:profile" ), "user:42" )
+        self.assertEqual( segment_group( "a/b/c", separator = "/", segments = 1 ), "a" )
+
+    def test_group_key( self ):
+        self.assertEqual( group_key( "user:42:profile", "user:42" ), "{user:42}:user:42:profile" )
+        self.assertEqual( hash_tag( group_key( "user:42:orders", "user:42" ) ), "user:42" )
+
+    def test_spread_group( self ):
+        tags = set( hash_tag( group_key( "user:42:%d" % index, "user:42", 4 ) ) for index in range( 100 ) )
+        self.assertEqual( tags, set( "user:42.%d" % slot for slot in range( 4 ) ) )
+        # A key always lands in the same slot of its group.
+        self.assertEqual( group_key( "user:42:1", "user:42", 4 ), group_key( "user:42:1", "user:42", 4 ) )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from rediscluster_cache.counter import Counter, CounterAggregator
+
+
+class FakeNode( object ):
+    """
+    One node holding every counter. Keys in ``errors`` get that error
+    reply, and nothing is applied while ``down``.
+    """
+
+    def __init__( self ):
+        self.values = {}
+        self.timeouts = {}
+        self.errors = {}
+        self.down = False
+
+    def pipeline( self, transaction = True ):
+        return FakePipeline( self )
+
+    def incr( self, key, delta, seconds = None ):
+        if key in self.errors:
+            return ResponseError( self.errors[key] )
+        self.values[key] = self.values.get( key, 0 ) + delta
+        if seconds is not None:
+            self.timeouts[key] = seconds
+        return self.values[key]
+
+
+class FakePipeline( object ):
+
+    def __init__( self, node ):
+        self.node = node
+        self.commands = []
+
+    def incrby( self, key, delta ):
+        self.commands.append( ( key, delta ) )
+
+    def execute( self, raise_on_error = True ):
+        if self.node.down:
+            raise ConnectionError( "down" )
+        return [self.node.incr( key, delta ) for key, delta in self.commands]
+
+
+class FakeClient( object ):
+
+    def __init__( self ):
+        self.node = FakeNode()
+        self.node_manager = self
+        self.scripts = self
+        self.reported = []
+        self.aggregator = None
+
+    def group_by_client( self, keys, write = False ):
+        return [( self.node, list( keys ) )]
+
+    def run_many( self, node, name, calls, raise_on_error = True ):
+        if node.down:
+            raise ConnectionError( "down" )
+        return [node.incr( keys[0], args[0], args[1] ) for keys, args in calls]
+
+    def report_error( self, node, error ):
+        self.reported.append( str( error ) )
+
+    def get_counter( self, key, exact = False ):
+        return self.node.values.get( key, 0 )
+
+
+class TestCounterAggregator( unittest.TestCase ):
+
+    def setUp( self ):
+        self.client = FakeClient()
+        self.aggregator = self.client.aggregator = CounterAggregator( self.client, stripes = 4, interval = 3600,
+                                                                      max_pending = 10 ** 6 )
+
+    def tearDown( self ):
+        self.client.node.down = False
+        self.aggregator.close()
+
+    def test_aggregates( self ):
+        def add():
+            for _ in range( 100 ):
+                self.aggregator.add( "views", 1 )
+
+        threads = [threading.Thread( target = add ) for _ in range( 4 )]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual( self.aggregator.pending( "views" ), 400 )
+        self.assertEqual( self.aggregator.flush(), 1 )
+        self.assertEqual( self.client.node.values, {"views": 400} )
+        self.assertEqual( self.aggregator.pending( "views" ), 0 )
+        self.assertEqual( self.aggregator.flush(), 0 )
+
+    def test_zero_delta_not_sent( self ):
+        self.aggregator.add( "views", 2 )
+        self.aggregator.add( "views", -2 )
+        self.assertEqual( self.aggregator.flush(), 0 )
+        self.assertEqual( self.client.node.values, {} )
+
+    def test_expiring( self ):
+        self.aggregator.add( "views", 1, seconds = 60 )
+        self.aggregator.add( "clicks", 1 )
+        self.assertEqual( self.aggregator.flush(), 2 )
+        self.assertEqual( self.client.node.timeouts, {"views": 60} )
+        # Given again by the next increments only.
+        self.aggregator.add( "views", 1 )
+        self.aggregator.flush()
+        self.assertEqual( self.client.node.values["views"], 2 )
+
+    def test_failed_flush_is_restored( self ):
+        self.aggregator.add( "views", 3, seconds = 60 )
+        self.client.node.down = True
+        self.assertEqual( self.aggregator.flush(), 0 )
+        self.assertEqual( self.aggregator.pending( "views" ), 3 )
+        self.assertEqual( self.client.reported, ["down"] )
+        self.client.node.down = False
+        self.aggregator.add( "views", 1 )
+        self.assertEqual( self.aggregator.flush(), 1 )
+        self.assertEqual( self.client.node.values, {"views": 4} )
+        self.assertEqual( self.client.node.timeouts, {"views": 60} )
+
+    def test_topology_errors_are_retried( self ):
+        self.aggregator.add( "views", 1 )
+        self.aggregator.add( "clicks", 1 )
+        self.client.node.errors["views"] = "MOVED 100 127.0.0.1:7001"
+        self.assertEqual( self.aggregator.flush(), 1 )
+        self.assertEqual( self.aggregator.pending( "views" ), 1 )
+        self.assertEqual( self.client.reported, ["MOVED 100 127.0.0.1:7001"] )
+        del self.client.node.errors["views"]
+        self.aggregator.flush()
+        self.assertEqual( self.client.node.values, {"views": 1, "clicks": 1} )
+
+    def test_other_errors_are_dropped( self ):
+        self.aggregator.add( "views", 1 )
+        self.client.node.errors["views"] = "WRONGTYPE Operation against a key holding the wrong kind of value"
+        self.assertEqual( self.aggregator.flush(), 0 )
+        self.assertEqual( self.aggregator.pending( "views" ), 0 )
+        self.assertEqual( self.aggregator.stats()["failed"], 1 )
+
+
+class TestCounter( unittest.TestCase ):
+
+    def setUp( self ):
+        self.client = FakeClient()
+        self.client.aggregator = CounterAggregator( self.client, interval = 3600, max_pending = 10 ** 6 )
+
+    def tearDown( self ):
+        self.client.aggregator.close()
+
+    def test_get( self ):
+        counter = Counter( self.client, "views" )
+        counter.incr( 5 )
+        counter.decr()
+        self.assertEqual( counter.get(), 0 )
+        self.assertEqual( counter.get( exact = True ), 4 )
+        counter.flush()
+        self.assertEqual( counter.get(), 4 )
+        self.assertEqual( Counter( self.client, "views", exact = True ).get(), 4 )
+
+
+if __name__ == "__main__":
+    unittest.main()
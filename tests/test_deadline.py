@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from rediscluster_cache.deadline import DeadlineExceeded, bound, check, current, deadline_scope, expired, \
+    remaining, with_deadline
+
+
+class TestDeadline( unittest.TestCase ):
+
+    def test_no_deadline( self ):
+        self.assertEqual( current(), None )
+        self.assertEqual( remaining(), None )
+        self.assertFalse( expired() )
+        self.assertEqual( bound( 5 ), 5 )
+        self.assertEqual( bound( None ), None )
+        check()
+
+    def test_budget( self ):
+        with deadline_scope( timeout_budget = 10 ) as at:
+            self.assertEqual( current(), at )
+            self.assertTrue( 9 < remaining() <= 10 )
+            self.assertEqual( bound( 1 ), 1 )
+            self.assertTrue( 9 < bound( None ) <= 10 )
+            self.assertTrue( 9 < bound( 60 ) <= 10 )
+        self.assertEqual( current(), None )
+
+    def test_expired( self ):
+        with deadline_scope( deadline = time.time() - 1 ):
+            self.assertTrue( expired() )
+            self.assertEqual( bound( 5 ), 0 )
+            self.assertRaises( DeadlineExceeded, check )
+
+    def test_nested_scopes_never_extend( self ):
+        with deadline_scope( timeout_budget = 1 ) as outer:
+            with deadline_scope( timeout_budget = 10 ) as inner:
+                self.assertEqual( inner, outer )
+            with deadline_scope( deadline = outer - 0.5 ) as inner:
+                self.assertEqual( inner, outer - 0.5 )
+            self.assertEqual( current(), outer )
+
+    def test_deadline_and_budget( self ):
+        at = time.time() + 5
+        with deadline_scope( deadline = at, timeout_budget = 10 ) as scope:
+            self.assertEqual( scope, at )
+
+    def test_restored_on_error( self ):
+        try:
+            with deadline_scope( timeout_budget = 1 ):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual( current(), None )
+
+    def test_with_deadline( self ):
+        @with_deadline
+        def method( value ):
+            return value, current()
+
+        self.assertEqual( method( 1 ), ( 1, None ) )
+        value, at = method( 2, timeout_budget = 10 )
+        self.assertTrue( 9 < at - time.time() <= 10 )
+        self.assertEqual( method( 3, deadline = 123 ), ( 3, 123 ) )
+        self.assertEqual( current(), None )
+
+
+if __name__ == "__main__":
+    unittest.main()
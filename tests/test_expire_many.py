@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rediscluster_cache.chunking import ChunkManifest
+from rediscluster_cache.client.default import DefaultClient
+from rediscluster_cache.slotmap import write_snapshot
+from rediscluster_cache.util import default_key_func
+
+SERVER = [{"host": "127.0.0.1", "port": 1}]
+
+
+class FakeBackend( object ):
+    key_prefix = "test"
+    version = 1
+    key_func = staticmethod( default_key_func )
+    default_timeout = 300
+
+
+class FakeNode( object ):
+    """
+    Node holding ``values``, with the expiry times of its keys in ``ttls``
+    (None for no expiry).
+    """
+
+    def __init__( self, values ):
+        self.values = dict( values )
+        self.ttls = dict( ( key, None ) for key in values )
+        self.pipelines = 0
+
+    def pipeline( self, transaction = True ):
+        self.pipelines += 1
+        return FakePipeline( self )
+
+    def execute_command( self, command, key, *args ):
+        if key not in self.values:
+            return 0 if command != "GETRANGE" else b""
+        if command == "GETRANGE":
+            return self.values[key][args[0]:args[1] + 1]
+        if command == "EXPIRE":
+            if args[0] <= 0:
+                del self.values[key]
+                del self.ttls[key]
+            else:
+                self.ttls[key] = args[0]
+            return 1
+        if command == "EXISTS":
+            return 1
+        if command == "PERSIST":
+            had = self.ttls[key] is not None
+            self.ttls[key] = None
+            return int( had )
+        raise AssertionError( command )
+
+
+class FakePipeline( object ):
+
+    def __init__( self, node ):
+        self.node = node
+        self.commands = []
+
+    def execute_command( self, *args ):
+        self.commands.append( args )
+
+    def execute( self ):
+        return [self.node.execute_command( *args ) for args in self.commands]
+
+
+class TestExpireMany( unittest.TestCase ):
+    """
+    Clients whose nodes are replaced by FakeNode, split by key.
+    """
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join( self.dir, "slots" )
+        write_snapshot( self.snapshot, [( 0, 16383, [( "127.0.0.1", 1 )] )] )
+        self.clients = []
+
+    def tearDown( self ):
+        for client in self.clients:
+            client.close()
+            client.release()
+        shutil.rmtree( self.dir )
+
+    def make( self, values, **options ):
+        options.setdefault( "COMPRESSOR", "rediscluster_cache.compressor.identity.IdentityCompressor" )
+        params = {"SLOTS_SNAPSHOT": self.snapshot, "CHECK_INTERVAL": 3600, "OPTIONS": options}
+        client = DefaultClient( SERVER, params, FakeBackend() )
+        self.clients.append( client )
+        # Two nodes, by the parity of the last character of the keys.
+        nodes = [FakeNode( {} ), FakeNode( {} )]
+        for key, value in values.items():
+            nkey = client.make_key( key )
+            nodes[ord( nkey[-1] ) % 2].values[nkey] = value
+            nodes[ord( nkey[-1] ) % 2].ttls[nkey] = None
+
+        def group_by_client( keys, write = False ):
+            groups = [( node, [key for key in keys if ord( key[-1] ) % 2 == index] )
+                      for index, node in enumerate( nodes )]
+            return [group for group in groups if group[1]]
+        client.group_by_client = group_by_client
+        return client, nodes
+
+    def ttls( self, client, nodes, keys ):
+        ttls = {}
+        for node in nodes:
+            ttls.update( node.ttls )
+        return dict( ( key, ttls.get( client.make_key( key ), "missing" ) ) for key in keys )
+
+    def test_touch_many( self ):
+        client, nodes = self.make( {"a": b"1", "b": b"2"} )
+        self.assertEqual( client.touch_many( ["a", "b", "c"], timeout = 60 ), {"a": True, "b": True, "c": False} )
+        self.assertEqual( self.ttls( client, nodes, ["a", "b", "c"] ), {"a": 60, "b": 60, "c": "missing"} )
+        # One pipeline per node.
+        self.assertEqual( [node.pipelines for node in nodes], [1, 1] )
+
+    def test_default_timeout( self ):
+        client, nodes = self.make( {"a": b"1"} )
+        client.touch_many( ["a"] )
+        self.assertEqual( self.ttls( client, nodes, ["a"] ), {"a": 300} )
+
+    def test_persist_and_delete( self ):
+        client, nodes = self.make( {"a": b"1", "b": b"2"} )
+        client.expire_many( ["a", "b"], 60 )
+        self.assertEqual( client.touch_many( ["a"], timeout = None ), {"a": True} )
+        self.assertEqual( client.persist_many( ["a", "b", "c"] ), {"a": True, "b": True, "c": False} )
+        self.assertEqual( self.ttls( client, nodes, ["a", "b"] ), {"a": None, "b": None} )
+        # Whether they exist, as touch says, not whether they had an expiry time.
+        self.assertEqual( client.touch_many( ["a", "c"], timeout = None ), {"a": True, "c": False} )
+        self.assertEqual( client.touch_many( ["a"], timeout = 0 ), {"a": True} )
+        self.assertEqual( self.ttls( client, nodes, ["a", "b"] ), {"a": "missing", "b": None} )
+
+    def test_chunks( self ):
+        client, nodes = self.make( {}, CHUNK_THRESHOLD = 10, CHUNK_SIZE = 4 )
+        nkey = client.make_key( "big" )
+        manifest = ChunkManifest( 2, 8 )
+        chunk_keys = [str( key ) for key in manifest.keys( nkey )]
+        for key, value in [( nkey, manifest.dumps() )] + [( key, b"data" ) for key in chunk_keys]:
+            node = nodes[ord( key[-1] ) % 2]
+            node.values[key] = value
+            node.ttls[key] = None
+        self.assertEqual( client.expire_many( ["big"], 60 ), {"big": True} )
+        ttls = {}
+        for node in nodes:
+            ttls.update( node.ttls )
+        self.assertEqual( [ttls[key] for key in [nkey] + chunk_keys], [60, 60, 60] )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from rediscluster_cache.deadline import DeadlineExceeded, deadline_scope
+from rediscluster_cache.hedge import HedgeBudget, Hedger
+
+
+class FakeConnection( object ):
+    """
+    Connection whose reply arrives ``delay`` seconds after the command is
+    sent, never if delay is None.
+    """
+
+    def __init__( self, delay, socket_timeout ):
+        self.delay = delay
+        self.socket_timeout = socket_timeout
+        self.ready_at = None
+        self.disconnected = False
+
+    def send_command( self, *args ):
+        if self.delay is not None:
+            self.ready_at = time.time() + self.delay
+
+    def can_read( self, timeout = 0 ):
+        if self.ready_at is None:
+            time.sleep( timeout or 0 )
+            return False
+        wait = self.ready_at - time.time()
+        if wait > 0:
+            time.sleep( min( wait, timeout or 0 ) )
+        return time.time() >= self.ready_at
+
+    def disconnect( self ):
+        self.disconnected = True
+
+
+class FakePool( object ):
+
+    def __init__( self, connection ):
+        self.connection = connection
+        self.released = 0
+
+    def get_connection( self, command_name ):
+        return self.connection
+
+    def release( self, connection ):
+        self.released += 1
+
+
+class FakePrimary( object ):
+    breaker = None
+    limiter = None
+
+    def __init__( self, delay, value = b"primary", socket_timeout = 5 ):
+        self.connection_pool = FakePool( FakeConnection( delay, socket_timeout ) )
+        self.value = value
+
+    def parse_response( self, connection, command_name ):
+        if not connection.can_read( connection.socket_timeout ):
+            raise TimeoutError( "Timeout reading from socket" )
+        if isinstance( self.value, Exception ):
+            raise self.value
+        return self.value
+
+
+class FakeBackup( object ):
+    """
+    Node answering the pipelines of hedged reads after ``delay`` seconds.
+    """
+
+    def __init__( self, delay, value = b"backup" ):
+        self.delay = delay
+        self.value = value
+        self.pipelines = []
+
+    def pipeline( self, transaction = True ):
+        pipe = FakeBackupPipeline( self )
+        self.pipelines.append( pipe )
+        return pipe
+
+
+class FakeBackupPipeline( object ):
+
+    def __init__( self, node ):
+        self.node = node
+        self.commands = []
+
+    def execute_command( self, *args ):
+        self.commands.append( args )
+
+    def execute( self, raise_on_error = True ):
+        time.sleep( self.node.delay )
+        if isinstance( self.node.value, ConnectionError ):
+            raise self.node.value
+        return [b"OK"] + [self.node.value] * ( len( self.commands ) - 1 )
+
+
+class TestHedgeBudget( unittest.TestCase ):
+
+    def test_burst_and_ratio( self ):
+        budget = HedgeBudget( 0.5, burst = 2 )
+        self.assertTrue( budget.take() )
+        self.assertTrue( budget.take() )
+        self.assertFalse( budget.take() )
+        budget.record()
+        self.assertFalse( budget.take() )
+        budget.record()
+        self.assertTrue( budget.take() )
+        for _ in range( 10 ):
+            budget.record()
+        self.assertEqual( budget._tokens, 2 )
+
+
+class TestHedger( unittest.TestCase ):
+
+    def setUp( self ):
+        self.hedger = Hedger( workers = 2, budget = 1 )
+
+    def tearDown( self ):
+        self.hedger.close()
+
+    def call( self, primary, backup, delay = 0.02 ):
+        return self.hedger.call( primary, ( "GET", "key" ), lambda: backup, delay )
+
+    def test_fast_primary( self ):
+        primary = FakePrimary( 0 )
+        self.assertEqual( self.call( primary, FakeBackup( 0 ) ), b"primary" )
+        self.assertEqual( self.hedger.stats(), {"reads": 1, "hedged": 0, "backup_wins": 0} )
+        self.assertEqual( primary.connection_pool.released, 1 )
+
+    def test_backup_wins( self ):
+        primary = FakePrimary( 1 )
+        backup = FakeBackup( 0 )
+        start = time.time()
+        self.assertEqual( self.call( primary, backup ), b"backup" )
+        # READONLY is sent on the connection of the read.
+        self.assertEqual( [pipe.commands for pipe in backup.pipelines], [[( "READONLY", ), ( "GET", "key" )]] )
+        self.assertTrue( time.time() - start < 0.5 )
+        self.assertEqual( self.hedger.stats()["backup_wins"], 1 )
+        # The reply of primary is still to come on its connection.
+        self.assertTrue( primary.connection_pool.connection.disconnected )
+
+    def test_primary_wins( self ):
+        primary = FakePrimary( 0.05 )
+        self.assertEqual( self.call( primary, FakeBackup( 1 ) ), b"primary" )
+        self.assertEqual( self.hedger.stats()["hedged"], 1 )
+        self.assertFalse( primary.connection_pool.connection.disconnected )
+
+    def test_no_backup( self ):
+        self.assertEqual( self.call( FakePrimary( 0.05 ), None ), b"primary" )
+        self.assertEqual( self.hedger.stats()["hedged"], 0 )
+
+    def test_budget( self ):
+        self.hedger.budget = HedgeBudget( 0, burst = 0 )
+        self.assertEqual( self.call( FakePrimary( 0.05 ), FakeBackup( 0 ) ), b"primary" )
+        self.assertEqual( self.hedger.stats()["hedged"], 0 )
+
+    def test_failed_backup( self ):
+        primary = FakePrimary( 0.05 )
+        self.assertEqual( self.call( primary, FakeBackup( 0, ConnectionError( "down" ) ) ), b"primary" )
+
+    def test_backup_error_reply( self ):
+        primary = FakePrimary( 0.05 )
+        backup = FakeBackup( 0, ResponseError( "MOVED 3999 127.0.0.1:7001" ) )
+        self.assertEqual( self.call( primary, backup ), b"primary" )
+        self.assertEqual( self.hedger.stats()["backup_wins"], 0 )
+
+    def test_failed_primary( self ):
+        primary = FakePrimary( 0.05, ConnectionError( "reset" ) )
+        self.assertEqual( self.call( primary, FakeBackup( 0.1 ) ), b"backup" )
+
+    def test_socket_timeout( self ):
+        primary = FakePrimary( None, socket_timeout = 0.1 )
+        start = time.time()
+        self.assertRaises( TimeoutError, self.call, primary, FakeBackup( 1 ) )
+        self.assertTrue( time.time() - start < 0.5 )
+        self.assertTrue( primary.connection_pool.connection.disconnected )
+
+    def test_deadline( self ):
+        primary = FakePrimary( None )
+        with deadline_scope( timeout_budget = 0.1 ):
+            self.assertRaises( DeadlineExceeded, self.call, primary, FakeBackup( 1 ) )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.limiter import AdmissionRejected, ConcurrencyLimiter
+
+
+class TestConcurrencyLimiter( unittest.TestCase ):
+
+    def test_rejects_over_the_limit( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 2, min_limit = 1, queue_timeout = 0.01 )
+        limiter.acquire()
+        limiter.acquire()
+        self.assertRaises( AdmissionRejected, limiter.acquire )
+        self.assertEqual( limiter.stats()["rejected"], 1 )
+        limiter.release( 0.01 )
+        limiter.acquire()
+        self.assertEqual( limiter.in_flight, 2 )
+
+    def test_cancel_does_not_adapt( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 8 )
+        limiter.acquire()
+        limiter.cancel()
+        self.assertEqual( limiter.in_flight, 0 )
+        self.assertEqual( limiter.limit, 8 )
+        self.assertEqual( limiter.stats()["latency"], None )
+
+    def test_additive_increase( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 4, max_limit = 5 )
+        # One more slot for every limit commands answered in time.
+        for _ in range( 4 ):
+            limiter.acquire()
+            limiter.release( 0.01 )
+        self.assertAlmostEqual( limiter.limit, 5, delta = 0.1 )
+        for _ in range( 10 ):
+            limiter.acquire()
+            limiter.release( 0.01 )
+        self.assertEqual( limiter.limit, 5 )
+
+    def test_multiplicative_decrease( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 10, min_limit = 8, latency_target = 0.1, backoff = 0.5 )
+        limiter.acquire()
+        limiter.release( 0.01, failed = True )
+        self.assertEqual( limiter.limit, 8 )
+
+    def test_one_decrease_per_burst( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 100, latency_target = 0.1, backoff = 0.5 )
+        limiter.acquire()
+        limiter.release( 60 )
+        self.assertEqual( limiter.limit, 50 )
+        # Within one smoothed latency of the last decrease.
+        limiter.acquire()
+        limiter.release( 60 )
+        self.assertEqual( limiter.limit, 50 )
+
+    def test_not_adaptive( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 4, adaptive = False )
+        limiter.acquire()
+        limiter.release( 10, failed = True )
+        self.assertEqual( limiter.limit, 4 )
+
+    def test_after_fork( self ):
+        limiter = ConcurrencyLimiter( "node", limit = 1, queue_timeout = 0.01 )
+        limiter.acquire()
+        limiter.after_fork()
+        limiter.acquire()
+        self.assertEqual( limiter.in_flight, 1 )
+
+
+if __name__ == "__main__":
+    unittest.main()
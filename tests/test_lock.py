@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from redis.exceptions import LockError
+
+from rediscluster_cache.lock import MIN_WAKE_WAIT, WAKE_INTERVAL, WAKE_TTL, ClusterLock, local_lock
+
+
+class FakePool( object ):
+
+    def __init__( self, socket_timeout = None ):
+        self.connection_kwargs = {"socket_timeout": socket_timeout}
+
+
+class FakeNode( object ):
+
+    def __init__( self, socket_timeout = None ):
+        self.connection_pool = FakePool( socket_timeout )
+
+
+class FakeClient( object ):
+    """
+    Answers the lock scripts with the given replies, in order.
+    """
+
+    def __init__( self, replies, socket_timeout = None ):
+        self.node = FakeNode( socket_timeout )
+        self.replies = list( replies )
+        self.calls = []
+
+    def get_client( self, key, write = False ):
+        return self.node
+
+    def run_script( self, node, name, keys, args ):
+        self.calls.append( ( name, keys, args ) )
+        return self.replies.pop( 0 )
+
+
+class WaitingLock( ClusterLock ):
+    """
+    Records the waits on the wake list, blocking only if ``block``.
+    """
+    block = False
+
+    def _blpop( self, node, wait ):
+        self.waits.append( wait )
+        if self.block:
+            time.sleep( wait )
+
+
+class TestClusterLock( unittest.TestCase ):
+
+    def make( self, replies, name = "{job}:lock", socket_timeout = None, **kwargs ):
+        lock = WaitingLock( FakeClient( replies, socket_timeout ), name, **kwargs )
+        lock.waits = []
+        return lock
+
+    def test_keys( self ):
+        lock = self.make( [] )
+        self.assertEqual( lock.wake_key, "{job}:lock-wake:{job}:lock" )
+        self.assertEqual( lock.fence_key, "{job}:lock-fence:{job}:lock" )
+        lock = self.make( [], name = "odd}name" )
+        self.assertEqual( ( lock.wake_key, lock.fence_key ), ( None, None ) )
+        self.assertEqual( lock._keys( lock.fence_key ), ["odd}name"] )
+
+    def test_lease( self ):
+        self.assertEqual( self.make( [], timeout = 1.5 )._lease(), 1500 )
+        self.assertEqual( self.make( [], timeout = None )._lease(), 0 )
+
+    def test_fencing_token( self ):
+        lock = self.make( [[1, 41], 1, [1, 42], 1], timeout = 10 )
+        self.assertTrue( lock.acquire() )
+        self.assertEqual( lock.fencing_token, 41 )
+        name, keys, args = lock._client.calls[0]
+        self.assertEqual( ( name, keys, args[1] ), ( "lock_acquire", [lock.name, lock.fence_key], 10000 ) )
+        lock.release()
+        self.assertEqual( lock._client.calls[1][1:], ( [lock.name, lock.wake_key], [args[0], WAKE_TTL] ) )
+        self.assertTrue( lock.acquire() )
+        self.assertEqual( lock.fencing_token, 42 )
+        lock.release()
+
+    def test_no_fencing_token( self ):
+        lock = self.make( [[1, 0], 1], name = "odd}name" )
+        self.assertTrue( lock.acquire() )
+        self.assertEqual( lock.fencing_token, None )
+        lock.release()
+
+    def test_waits_for_the_lease( self ):
+        lock = self.make( [[0, 250], [0, 5000], [1, 1], 1] )
+        self.assertTrue( lock.acquire() )
+        self.assertEqual( lock.waits, [0.25, WAKE_INTERVAL] )
+        lock.release()
+
+    def test_wait_bounds( self ):
+        lock = self.make( [[0, 1], [0, -1], [1, 1], 1], socket_timeout = 0.5 )
+        self.assertTrue( lock.acquire() )
+        # Never shorter than BLPOP can wait, nor longer than half the
+        # socket timeout.
+        self.assertEqual( lock.waits, [MIN_WAKE_WAIT, 0.25] )
+        lock.release()
+
+    def test_blocking_timeout( self ):
+        lock = self.make( [[0, 5000]] * 100, blocking_timeout = 0.05 )
+        lock.block = True
+        start = time.time()
+        self.assertFalse( lock.acquire() )
+        self.assertTrue( time.time() - start < 1 )
+        self.assertTrue( all( wait <= 0.05 for wait in lock.waits ) )
+        self.assertEqual( lock.token, None )
+
+    def test_not_blocking( self ):
+        lock = self.make( [[0, 5000]] )
+        self.assertFalse( lock.acquire( blocking = False ) )
+        self.assertEqual( lock.waits, [] )
+
+    def test_lost_lock( self ):
+        lock = self.make( [[1, 1], 0] )
+        lock.acquire()
+        self.assertRaises( LockError, lock.release )
+        self.assertRaises( LockError, lock.release )
+
+    def test_extend( self ):
+        lock = self.make( [[1, 1], 1, 1, 0, 1], timeout = 10 )
+        lock.acquire()
+        self.assertTrue( lock.extend( 2.5 ) )
+        self.assertEqual( lock._client.calls[-1][2][1:], [2500, 1] )
+        self.assertTrue( lock.renew() )
+        self.assertEqual( lock._client.calls[-1][2][1:], [10000, 0] )
+        self.assertRaises( LockError, lock.renew )
+        lock.release()
+
+    def test_extend_without_lease( self ):
+        lock = self.make( [[1, 1], 1] )
+        lock.acquire()
+        self.assertRaises( LockError, lock.extend, 1 )
+        lock.release()
+        self.assertRaises( LockError, lock.extend, 1 )
+
+
+class TestLocalLock( unittest.TestCase ):
+
+    def test_shared_by_name( self ):
+        lock = local_lock( "shared" )
+        self.assertTrue( local_lock( "shared" ) is lock )
+        self.assertFalse( local_lock( "other" ) is lock )
+
+    def test_timeout( self ):
+        lock = local_lock( "timeout" )
+        self.assertTrue( lock.acquire() )
+        self.assertFalse( lock.acquire( blocking = False ) )
+        start = time.time()
+        self.assertFalse( lock.acquire( timeout = 0.05 ) )
+        self.assertTrue( time.time() - start >= 0.04 )
+        threading.Timer( 0.05, lock.release ).start()
+        self.assertTrue( lock.acquire( timeout = 5 ) )
+        lock.release()
+
+
+if __name__ == "__main__":
+    unittest.main()
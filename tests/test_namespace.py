@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.exceptions import ConnectionInterrupted
+from rediscluster_cache.namespace import Namespace, NamespaceGenerations, initial_generation
+
+
+class FakeClient( object ):
+    """
+    Generations of namespaces as redis keeps them, unreachable if ``down``.
+    """
+
+    def __init__( self ):
+        self.generations = {}
+        self.reads = 0
+        self.down = False
+
+    def run_namespace_script( self, name, namespace ):
+        if self.down:
+            raise ConnectionInterrupted( connection = None, parent = Exception( "down" ) )
+        if name == "namespace_generation":
+            self.reads += 1
+            return self.generations.setdefault( namespace, 100 )
+        self.generations[namespace] = self.generations.get( namespace, 100 ) + 1
+        return self.generations[namespace]
+
+
+class FakeCache( object ):
+    """
+    Dict backed cache with the generations of FakeClient.
+    """
+
+    def __init__( self ):
+        self._ignore_exceptions = False
+        self.data = {}
+        self.client = self
+        self._generations = NamespaceGenerations( FakeClient(), timeout = 60 )
+
+    def namespace_generation( self, name ):
+        return self._generations.get( name )
+
+    def invalidate_namespace( self, name ):
+        return self._generations.bump( name )
+
+    def get( self, key, default = None ):
+        return self.data.get( key, default )
+
+    def set( self, key, value ):
+        self.data[key] = value
+
+    def get_many( self, keys ):
+        return dict( ( key, self.data[key] ) for key in keys if key in self.data )
+
+
+class TestNamespaceGenerations( unittest.TestCase ):
+
+    def setUp( self ):
+        self.client = FakeClient()
+        self.generations = NamespaceGenerations( self.client, timeout = 60 )
+
+    def test_cached( self ):
+        self.assertEqual( self.generations.get( "users" ), 100 )
+        self.assertEqual( self.generations.get( "users" ), 100 )
+        self.assertEqual( self.client.reads, 1 )
+
+    def test_expired( self ):
+        self.generations.timeout = 0
+        self.generations.get( "users" )
+        self.generations.get( "users" )
+        self.assertEqual( self.client.reads, 2 )
+
+    def test_bump( self ):
+        self.generations.get( "users" )
+        self.assertEqual( self.generations.bump( "users" ), 101 )
+        self.assertEqual( self.generations.get( "users" ), 101 )
+
+    def test_stale_on_error( self ):
+        self.generations.timeout = 0
+        self.generations.get( "users" )
+        self.client.down = True
+        self.assertEqual( self.generations.get( "users" ), 100 )
+        self.assertRaises( ConnectionInterrupted, self.generations.get, "orders" )
+
+    def test_initial_generation( self ):
+        self.assertTrue( initial_generation() > 1500000000000 )
+
+
+class TestNamespace( unittest.TestCase ):
+
+    def setUp( self ):
+        self.cache = FakeCache()
+        self.users = Namespace( self.cache, "users" )
+
+    def test_keys( self ):
+        self.assertEqual( self.users.make_key( 42 ), "users:100:42" )
+        self.assertEqual( self.users.make_key( 42, 7 ), "users:7:42" )
+
+    def test_invalidate( self ):
+        self.users.set( 42, "user" )
+        self.assertEqual( self.users.get( 42 ), "user" )
+        self.assertEqual( self.users.invalidate(), 101 )
+        self.assertEqual( self.users.get( 42, "gone" ), "gone" )
+
+    def test_get_many( self ):
+        self.users.set( 1, "one" )
+        self.users.set( 2, "two" )
+        self.assertEqual( self.users.get_many( [1, 2, 3] ), {1: "one", 2: "two"} )
+
+    def test_unreachable( self ):
+        self.cache._generations._client.down = True
+        self.assertRaises( Exception, self.users.get, 42 )
+        self.cache._ignore_exceptions = True
+        self.assertEqual( self.users.get( 42, "default" ), "default" )
+        self.assertEqual( self.users.get_many( [42] ), {} )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from rediscluster_cache.breaker import CircuitBreakerOpen
+from rediscluster_cache.deadline import DeadlineExceeded
+from rediscluster_cache.nodemanager import NodeManager, get_node_manager, manager_key, release_node_manager
+from rediscluster_cache.slotmap import write_snapshot
+
+# Nothing listens there: the managers route with the snapshot and their
+# refreshes fail.
+SERVER = [{"host": "127.0.0.1", "port": 1}]
+
+
+class NodeManagerTestCase( unittest.TestCase ):
+    """
+    Node managers built from a slot map snapshot, without a cluster.
+    """
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join( self.dir, "slots" )
+        write_snapshot( self.snapshot, [( 0, 16383, [( "127.0.0.1", 1 )] )] )
+        self.managers = []
+
+    def tearDown( self ):
+        for manager in self.managers:
+            manager.close()
+        shutil.rmtree( self.dir )
+
+    def options( self, **kwargs ):
+        options = {"SLOTS_SNAPSHOT": self.snapshot, "CHECK_INTERVAL": 3600}
+        options.update( kwargs )
+        return options
+
+    def make( self, **options ):
+        manager = NodeManager( SERVER, self.options( **options ) )
+        self.managers.append( manager )
+        return manager
+
+
+class TestSharedManagers( NodeManagerTestCase ):
+
+    def test_manager_key( self ):
+        seeds = [{"host": "a", "port": 1}, {"host": "b", "port": 2}]
+        self.assertEqual( manager_key( seeds, {"CHECK_INTERVAL": 1, "TIMEOUT": 5} ),
+                          manager_key( list( reversed( seeds ) ), {"CHECK_INTERVAL": 1, "KEY_PREFIX": "x"} ) )
+        self.assertNotEqual( manager_key( seeds, {"CHECK_INTERVAL": 1} ), manager_key( seeds, {"CHECK_INTERVAL": 2} ) )
+        self.assertEqual( manager_key( "a:1,b:2", {} ), manager_key( ["b:2", "a:1"], {} ) )
+
+    def test_shared_until_released( self ):
+        options = self.options()
+        manager = get_node_manager( SERVER, options )
+        self.assertTrue( get_node_manager( SERVER, dict( options, KEY_PREFIX = "other" ) ) is manager )
+        release_node_manager( manager )
+        self.assertTrue( manager.checking )
+        release_node_manager( manager )
+        self.assertFalse( manager.checking )
+        other = get_node_manager( SERVER, options )
+        self.assertFalse( other is manager )
+        release_node_manager( other )
+
+    def test_separate_clusters( self ):
+        manager = get_node_manager( SERVER, self.options() )
+        other = get_node_manager( SERVER, self.options( CHECK_INTERVAL = 60 ) )
+        self.assertFalse( other is manager )
+        release_node_manager( manager )
+        release_node_manager( other )
+
+
+class TestRefresh( NodeManagerTestCase ):
+
+    def refreshes( self, manager, fail ):
+        calls = []
+
+        def refresh_topology( force = False ):
+            calls.append( force )
+            if fail:
+                raise Exception( "down" )
+            return True
+        manager.refresh_topology = refresh_topology
+        return calls
+
+    def test_refresh_delay( self ):
+        manager = self.make( REFRESH_BACKOFF = 0.5, REFRESH_BACKOFF_MAX = 30 )
+        self.assertTrue( 0.25 <= manager.refresh_delay( 1 ) <= 0.5 )
+        self.assertTrue( 1 <= manager.refresh_delay( 3 ) <= 2 )
+        self.assertTrue( 15 <= manager.refresh_delay( 100 ) <= 30 )
+
+    def test_requests_keep_the_backoff( self ):
+        manager = self.make( MIN_REFRESH_INTERVAL = 0, REFRESH_BACKOFF = 1 )
+        manager.logger.disabled = True
+        calls = self.refreshes( manager, True )
+        end = time.time() + 0.4
+        while time.time() < end:
+            manager.request_refresh()
+            time.sleep( 0.005 )
+        self.assertTrue( len( calls ) <= 1 )
+
+    def test_forced_refresh( self ):
+        manager = self.make( MIN_REFRESH_INTERVAL = 0 )
+        calls = self.refreshes( manager, False )
+        manager.request_refresh( force = True )
+        end = time.time() + 3
+        while True not in calls and time.time() < end:
+            time.sleep( 0.005 )
+        self.assertTrue( True in calls )
+
+    def test_report_error( self ):
+        manager = self.make()
+        requests = []
+        manager.request_refresh = lambda force = False: requests.append( force )
+        manager.report_error( None, ResponseError( "MOVED 3999 127.0.0.1:7001" ) )
+        manager.report_error( None, ResponseError( "ASK 3999 127.0.0.1:7001" ) )
+        manager.report_error( None, ResponseError( "CLUSTERDOWN The cluster is down" ) )
+        manager.report_error( None, ConnectionError( "reset" ) )
+        self.assertEqual( requests, [True, True, False, False] )
+        # Nothing to do with the topology.
+        manager.report_error( None, ResponseError( "WRONGTYPE Operation against a key" ) )
+        manager.report_error( None, CircuitBreakerOpen( "open" ) )
+        manager.report_error( None, DeadlineExceeded( "late" ) )
+        self.assertEqual( len( requests ), 4 )
+
+
+class TestBackupNode( NodeManagerTestCase ):
+
+    def test_replica_without_round_trip( self ):
+        write_snapshot( self.snapshot, [( 0, 16383, [( "127.0.0.1", 1 ), ( "127.0.0.1", 2 )] )] )
+        manager = self.make()
+        master = manager.get_node( "key", write = True )
+        sent = []
+        for node in manager._nodes[manager.keyslot( "key" )]:
+            node.execute_command = lambda *args, **options: sent.append( args )
+        backup = manager.get_backup_node( "key", master )
+        self.assertFalse( backup is master )
+        self.assertEqual( backup.connection_pool.connection_kwargs["port"], 2 )
+        # READONLY goes with the hedged read, on its connection.
+        self.assertEqual( sent, [] )
+        self.assertTrue( manager.get_backup_node( "key", backup ) is master )
+
+
+@unittest.skipIf( not hasattr( os, "fork" ), "fork is not available" )
+class TestFork( NodeManagerTestCase ):
+
+    def test_check_fork( self ):
+        manager = self.make()
+        checker = manager._checker
+        manager._lock.acquire()
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                manager.check_fork()
+                # A new checker thread, and locks nobody holds.
+                if manager._checker is not checker and manager._checker.is_alive() and \
+                        manager._lock.acquire( False ):
+                    code = 0
+            finally:
+                os._exit( code )
+        self.assertEqual( os.waitpid( pid, 0 )[1], 0 )
+        manager._lock.release()
+        self.assertTrue( manager._checker is checker )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import time
+import unittest
+
+from redis.exceptions import ConnectionError
+
+from rediscluster_cache.deadline import DeadlineExceeded, deadline_scope
+from rediscluster_cache.pool import NodeConnectionPool
+
+
+class TestNodeConnectionPool( unittest.TestCase ):
+    """
+    Connections are only created, nothing is sent.
+    """
+
+    def make( self, **kwargs ):
+        options = {"host": "127.0.0.1", "port": 7000, "max_connections": 3, "timeout": 0.01}
+        options.update( kwargs )
+        return NodeConnectionPool( **options )
+
+    def test_bounded( self ):
+        pool = self.make()
+        connections = [pool.get_connection( "GET" ) for _ in range( 3 )]
+        self.assertRaises( ConnectionError, pool.get_connection, "GET" )
+        stats = pool.stats()
+        self.assertEqual( ( stats["connections"], stats["in_use"], stats["idle"] ), ( 3, 3, 0 ) )
+        for connection in connections:
+            pool.release( connection )
+        stats = pool.stats()
+        self.assertEqual( ( stats["in_use"], stats["idle"], stats["checkouts"], stats["connects"] ),
+                          ( 0, 3, 3, 3 ) )
+
+    def test_reuses_connections( self ):
+        pool = self.make()
+        connection = pool.get_connection( "GET" )
+        pool.release( connection )
+        self.assertTrue( pool.get_connection( "GET" ) is connection )
+        self.assertEqual( pool.stats()["connects"], 1 )
+
+    def test_release_from_another_process( self ):
+        pool = self.make()
+        connection = pool.get_connection( "GET" )
+        connection.pid = -1
+        pool.release( connection )
+        self.assertEqual( pool.stats()["in_use"], 1 )
+
+    def test_deadline( self ):
+        pool = self.make( max_connections = 1, timeout = 5 )
+        pool.get_connection( "GET" )
+        start = time.time()
+        with deadline_scope( timeout_budget = 0.05 ):
+            self.assertRaises( DeadlineExceeded, pool.get_connection, "GET" )
+        self.assertTrue( time.time() - start < 1 )
+
+    def test_reap( self ):
+        pool = self.make( min_connections = 1, idle_timeout = 60 )
+        connections = [pool.get_connection( "GET" ) for _ in range( 3 )]
+        for connection in connections:
+            pool.release( connection )
+        self.assertEqual( pool.reap(), 0 )
+        connections[0].last_used -= 120
+        connections[1].last_used -= 120
+        self.assertEqual( pool.reap(), 2 )
+        self.assertEqual( pool.stats()["connections"], 1 )
+        # The open connection is reused before new ones are made.
+        self.assertTrue( pool.get_connection( "GET" ) is connections[2] )
+
+    def test_reap_keeps_min_connections( self ):
+        pool = self.make( min_connections = 2, idle_timeout = 60 )
+        connections = [pool.get_connection( "GET" ) for _ in range( 3 )]
+        for connection in connections:
+            pool.release( connection )
+            connection.last_used -= 120
+        self.assertEqual( pool.reap(), 1 )
+        self.assertEqual( pool.stats()["connections"], 2 )
+
+    def test_no_idle_timeout( self ):
+        pool = self.make()
+        pool.release( pool.get_connection( "GET" ) )
+        self.assertEqual( pool.reap(), 0 )
+
+
+@unittest.skipIf( not hasattr( os, "fork" ), "fork is not available" )
+class TestFork( unittest.TestCase ):
+
+    def test_child_drops_inherited_connections( self ):
+        pool = NodeConnectionPool( host = "127.0.0.1", port = 7000, max_connections = 2, timeout = 0.01 )
+        connection = pool.get_connection( "GET" )
+        parent_end, peer = socket.socketpair()
+        connection._sock = parent_end
+        pool.release( connection )
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                fresh = pool.get_connection( "GET" )
+                if fresh is not connection and connection._sock is None and \
+                        pool.stats()["connections"] == 1:
+                    code = 0
+            finally:
+                os._exit( code )
+        self.assertEqual( os.waitpid( pid, 0 )[1], 0 )
+
+        # Closed in the child only, the socket still works in the parent.
+        self.assertTrue( connection._sock is parent_end )
+        parent_end.sendall( b"PING" )
+        self.assertEqual( peer.recv( 4 ), b"PING" )
+        parent_end.close()
+        peer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.serializers.record import RecordSchema, RecordSerializer, get_schema
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FIELDS = [( "id", "q" ), ( "score", "d" ), ( "flag", "?" ), ( "name", "8s" )]
+
+
+class TestRecordSchema( unittest.TestCase ):
+
+    def setUp( self ):
+        self.schema = RecordSchema( FIELDS )
+        self.records = [{"id": index, "score": index / 2.0, "flag": bool( index % 2 ), "name": b"n%d" % index}
+                        for index in range( 3 )]
+
+    def test_layout( self ):
+        self.assertEqual( self.schema.names, ["id", "score", "flag", "name"] )
+        # Little endian without padding.
+        self.assertEqual( self.schema.size, 8 + 8 + 1 + 8 )
+
+    def test_unsupported_formats( self ):
+        for fmt in ( "x", "2q", "s2", "p", "" ):
+            self.assertRaises( ValueError, RecordSchema, [( "field", fmt )] )
+
+    def test_pack( self ):
+        packed = self.schema.pack( self.records[1] )
+        self.assertEqual( len( packed ), self.schema.size )
+        self.assertEqual( packed, self.schema.pack( [1, 0.5, True, b"n1"] ) )
+        record = self.schema.unpack( packed )
+        self.assertEqual( record["name"], b"n1\x00\x00\x00\x00\x00\x00" )
+        self.assertEqual( ( record["id"], record["score"], record["flag"] ), ( 1, 0.5, True ) )
+
+    def test_unpack_many_columns( self ):
+        columns = self.schema.unpack_many( [self.schema.pack( record ) for record in self.records],
+                                           as_numpy = False )
+        self.assertEqual( columns["id"], [0, 1, 2] )
+        self.assertEqual( columns["score"], [0.0, 0.5, 1.0] )
+        self.assertEqual( columns["flag"], [False, True, False] )
+
+    def test_unpack_many_empty( self ):
+        self.assertEqual( self.schema.unpack_many( [], as_numpy = False ),
+                          {"id": [], "score": [], "flag": [], "name": []} )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_unpack_many_numpy( self ):
+        array = self.schema.unpack_many( [self.schema.pack( record ) for record in self.records] )
+        self.assertEqual( array.dtype.itemsize, self.schema.size )
+        self.assertEqual( list( array["id"] ), [0, 1, 2] )
+        self.assertEqual( list( array["score"] ), [0.0, 0.5, 1.0] )
+        self.assertEqual( array["name"][2], b"n2" )
+
+    def test_get_schema( self ):
+        self.assertEqual( get_schema( None ), None )
+        self.assertTrue( get_schema( self.schema ) is self.schema )
+        self.assertEqual( get_schema( FIELDS ).names, self.schema.names )
+
+
+class TestRecordSerializer( unittest.TestCase ):
+
+    def test_round_trip( self ):
+        serializer = RecordSerializer( {"RECORD_SCHEMA": [( "id", "I" ), ( "score", "f" )]} )
+        self.assertEqual( serializer.loads( serializer.dumps( {"id": 7, "score": 0.25} ) ),
+                          {"id": 7, "score": 0.25} )
+
+    def test_schema_required( self ):
+        self.assertRaises( Exception, RecordSerializer, {} )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import unittest
+
+from redis.exceptions import NoScriptError, ResponseError
+
+from rediscluster_cache.scripts import SCRIPTS, ScriptRegistry, value_token
+
+
+class FakePool( object ):
+
+    def __init__( self, port ):
+        self.connection_kwargs = {"host": "127.0.0.1", "port": port}
+
+
+class FakeNode( object ):
+    """
+    Node running the scripts it has loaded: a script returns its first
+    argument, or an error reply if it is "error".
+    """
+
+    def __init__( self, port = 7000 ):
+        self.connection_pool = FakePool( port )
+        self.scripts = set()
+        self.loads = 0
+        self.calls = 0
+
+    def script_load( self, source ):
+        self.loads += 1
+        sha = hashlib.sha1( source.encode( "utf-8" ) ).hexdigest()
+        self.scripts.add( sha )
+        return sha
+
+    def evalsha( self, sha, numkeys, *keys_and_args ):
+        reply = self._reply( sha, keys_and_args[numkeys] )
+        if isinstance( reply, Exception ):
+            raise reply
+        return reply
+
+    def _reply( self, sha, arg ):
+        self.calls += 1
+        if sha not in self.scripts:
+            return NoScriptError( "NOSCRIPT No matching script" )
+        if arg == "error":
+            return ResponseError( "WRONGTYPE" )
+        return arg
+
+    def pipeline( self, transaction = True ):
+        return FakePipeline( self )
+
+
+class FakePipeline( object ):
+
+    def __init__( self, node ):
+        self.node = node
+        self.commands = []
+
+    def evalsha( self, sha, numkeys, *keys_and_args ):
+        self.commands.append( ( sha, keys_and_args[numkeys] ) )
+
+    def execute( self, raise_on_error = True ):
+        return [self.node._reply( sha, arg ) for sha, arg in self.commands]
+
+
+class TestScriptRegistry( unittest.TestCase ):
+
+    def setUp( self ):
+        self.registry = ScriptRegistry( {"echo": "return ARGV[1]"} )
+        self.node = FakeNode()
+
+    def test_default_scripts( self ):
+        registry = ScriptRegistry()
+        self.assertEqual( sorted( registry._scripts ), sorted( SCRIPTS ) )
+
+    def test_loaded_once_per_node( self ):
+        self.assertEqual( self.registry.run( self.node, "echo", ["key"], ["a"] ), "a" )
+        self.assertEqual( self.registry.run( self.node, "echo", ["key"], ["b"] ), "b" )
+        self.assertEqual( self.node.loads, 1 )
+        other = FakeNode( 7001 )
+        self.registry.run( other, "echo", ["key"], ["a"] )
+        self.assertEqual( other.loads, 1 )
+
+    def test_loaded_again_on_noscript( self ):
+        self.registry.run( self.node, "echo", ["key"], ["a"] )
+        # SCRIPT FLUSH, or a failover to a replica which never saw it.
+        self.node.scripts.clear()
+        self.assertEqual( self.registry.run( self.node, "echo", ["key"], ["b"] ), "b" )
+        self.assertEqual( self.node.loads, 2 )
+
+    def test_run_many( self ):
+        calls = [( ["key%d" % index], [index] ) for index in range( 3 )]
+        self.assertEqual( self.registry.run_many( self.node, "echo", calls ), [0, 1, 2] )
+        self.assertEqual( self.node.loads, 1 )
+
+    def test_run_many_loaded_again_on_noscript( self ):
+        self.registry.run( self.node, "echo", ["key"], ["a"] )
+        self.node.scripts.clear()
+        self.node.calls = 0
+        calls = [( ["key%d" % index], [index] ) for index in range( 3 )]
+        self.assertEqual( self.registry.run_many( self.node, "echo", calls ), [0, 1, 2] )
+        self.assertEqual( self.node.calls, 6 )
+
+    def test_run_many_errors( self ):
+        calls = [( ["a"], ["error"] ), ( ["b"], [1] )]
+        self.assertRaises( ResponseError, self.registry.run_many, self.node, "echo", calls )
+        results = self.registry.run_many( self.node, "echo", calls, raise_on_error = False )
+        self.assertTrue( isinstance( results[0], ResponseError ) )
+        self.assertEqual( results[1], 1 )
+
+    def test_after_fork( self ):
+        self.registry._lock.acquire()
+        self.registry.after_fork()
+        self.registry.run( self.node, "echo", ["key"], ["a"] )
+
+
+class TestValueToken( unittest.TestCase ):
+
+    def test_value_token( self ):
+        self.assertEqual( value_token( None ), "" )
+        self.assertEqual( value_token( b"value" ), hashlib.sha1( b"value" ).hexdigest() )
+        self.assertNotEqual( value_token( b"" ), value_token( None ) )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rediscluster_cache.slotmap import SLOTS, decode_slots, encode_slots, read_snapshot, write_snapshot
+
+RANGES = [
+    ( 0, 5460, [( "10.0.0.1", 7000 ), ( "10.0.0.4", 7003 )] ),
+    ( 5461, 10922, [( "10.0.0.2", 7001 ), ( "10.0.0.5", 7004 )] ),
+    ( 10923, 16383, [( "10.0.0.3", 7002 )] ),
+]
+
+
+class TestSlotMap( unittest.TestCase ):
+
+    def test_round_trip( self ):
+        self.assertEqual( decode_slots( encode_slots( RANGES ) ), RANGES )
+
+    def test_bytes_hosts( self ):
+        ranges = [( 0, SLOTS - 1, [( b"10.0.0.1", "7000" )] )]
+        self.assertEqual( decode_slots( encode_slots( ranges ) ), [( 0, SLOTS - 1, [( "10.0.0.1", 7000 )] )] )
+
+    def test_unassigned_slots( self ):
+        ranges = [( 100, 199, [( "10.0.0.1", 7000 )] ), ( 300, 300, [( "10.0.0.2", 7001 )] )]
+        self.assertEqual( decode_slots( encode_slots( ranges ) ), ranges )
+
+    def test_shared_groups( self ):
+        # Ranges of one group stay apart, but the group is stored once.
+        group = [( "10.0.0.1", 7000 )]
+        ranges = [( 0, 99, group ), ( 100, 199, [( "10.0.0.2", 7001 )] ), ( 200, 299, group )]
+        body = encode_slots( ranges )
+        self.assertEqual( decode_slots( body ), ranges )
+        self.assertEqual( len( body ), len( encode_slots( ranges[:2] ) ) )
+
+    def test_offset( self ):
+        body = encode_slots( RANGES )
+        self.assertEqual( decode_slots( b"junk" + body, 4 ), RANGES )
+
+
+class TestSnapshot( unittest.TestCase ):
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join( self.dir, "slots" )
+
+    def tearDown( self ):
+        shutil.rmtree( self.dir )
+
+    def test_round_trip( self ):
+        write_snapshot( self.path, RANGES, 3 )
+        self.assertEqual( read_snapshot( self.path ), RANGES )
+        self.assertEqual( os.listdir( self.dir ), ["slots"] )
+
+    def test_invalid( self ):
+        write_snapshot( self.path, RANGES )
+        with open( self.path, "rb" ) as f:
+            data = f.read()
+        with open( self.path, "wb" ) as f:
+            f.write( b"X" + data[1:] )
+        self.assertEqual( read_snapshot( self.path ), None )
+        with open( self.path, "wb" ) as f:
+            f.write( data[:-1] )
+        self.assertEqual( read_snapshot( self.path ), None )
+        with open( self.path, "wb" ) as f:
+            f.write( data[:10] )
+        self.assertEqual( read_snapshot( self.path ), None )
+
+
+if __name__ == "__main__":
+    unittest.main()
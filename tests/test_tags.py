@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.tags import should_prune, tag_key, tag_keys
+from rediscluster_cache.util import crc16
+
+
+class TestTags( unittest.TestCase ):
+
+    def test_tag_keys( self ):
+        self.assertEqual( tag_key( "users", 3 ), "tag:users:3" )
+        self.assertEqual( tag_keys( "users", 3 ), ["tag:users:0", "tag:users:1", "tag:users:2"] )
+
+    def test_shards_spread_over_slots( self ):
+        # Not hash tagged, the shards of a tag are spread over the cluster.
+        slots = set( crc16( key.encode( "utf-8" ) ) % 16384 for key in tag_keys( "users", 16 ) )
+        self.assertEqual( len( slots ), 16 )
+
+    def test_should_prune( self ):
+        self.assertFalse( should_prune( 0 ) )
+        self.assertTrue( should_prune( 1.01 ) )
+        pruned = sum( should_prune( 0.5 ) for _ in range( 1000 ) )
+        self.assertTrue( 350 < pruned < 650 )
+
+
+if __name__ == "__main__":
+    unittest.main()
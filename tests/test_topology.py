@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rediscluster_cache.topology import GENERATION_OFFSET, SharedTopology, _generation
+
+RANGES = [
+    ( 0, 8191, [( "10.0.0.1", 7000 ), ( "10.0.0.3", 7002 )] ),
+    ( 8192, 16383, [( "10.0.0.2", 7001 )] ),
+]
+
+
+class TestSharedTopology( unittest.TestCase ):
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join( self.dir, "topology" )
+        self.topologies = []
+
+    def tearDown( self ):
+        for topology in self.topologies:
+            topology.close()
+        shutil.rmtree( self.dir )
+
+    def open( self ):
+        topology = SharedTopology( self.path )
+        self.topologies.append( topology )
+        return topology
+
+    def test_empty( self ):
+        self.assertEqual( self.open().read(), ( 0, None ) )
+
+    def test_publish_and_read( self ):
+        leader, follower = self.open(), self.open()
+        self.assertTrue( leader.try_lead() )
+        self.assertEqual( leader.publish( RANGES ), 2 )
+        self.assertEqual( follower.read(), ( 2, RANGES ) )
+        self.assertEqual( leader.publish( RANGES[:1] ), 4 )
+        self.assertEqual( follower.read(), ( 4, RANGES[:1] ) )
+
+    def test_single_leader( self ):
+        leader, follower = self.open(), self.open()
+        self.assertTrue( leader.try_lead() )
+        self.assertFalse( follower.try_lead() )
+        self.assertEqual( follower.publish( RANGES ), None )
+        leader.close()
+        self.topologies.remove( leader )
+        self.assertTrue( follower.try_lead() )
+
+    def test_after_fork_gives_up_the_lead( self ):
+        topology = self.open()
+        topology.try_lead()
+        topology.after_fork()
+        self.assertFalse( topology.leader )
+        self.assertEqual( topology.publish( RANGES ), None )
+
+    def test_interrupted_write( self ):
+        leader, follower = self.open(), self.open()
+        leader.try_lead()
+        leader.publish( RANGES )
+        # A leader which died half way through a write.
+        _generation.pack_into( leader._buf, GENERATION_OFFSET, 3 )
+        self.assertEqual( follower.read(), ( 3, None ) )
+        self.assertEqual( leader.publish( RANGES ), 4 )
+        self.assertEqual( follower.read(), ( 4, RANGES ) )
+
+    def test_too_small( self ):
+        self.assertRaises( ValueError, SharedTopology, self.path, 1024 )
+
+
+if __name__ == "__main__":
+    unittest.main()
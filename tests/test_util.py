@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from rediscluster_cache.util import CacheKey, LazyValue, crc16, default_key_func
+
+
+class TestLazyValue( unittest.TestCase ):
+
+    def test_decoded_once( self ):
+        calls = []
+
+        def decode( raw ):
+            calls.append( raw )
+            return raw.upper()
+
+        value = LazyValue( b"raw", decode )
+        self.assertFalse( value.decoded )
+        self.assertEqual( value.value, b"RAW" )
+        self.assertEqual( value.value, b"RAW" )
+        self.assertTrue( value.decoded )
+        self.assertEqual( calls, [b"raw"] )
+
+    def test_without_decode( self ):
+        value = LazyValue( 10 )
+        self.assertTrue( value.decoded )
+        self.assertEqual( value.value, 10 )
+
+    def test_decoded_none( self ):
+        value = LazyValue( b"", lambda raw: None )
+        self.assertEqual( value.value, None )
+        self.assertTrue( value.decoded )
+
+    def test_repr( self ):
+        value = LazyValue( b"abc", int )
+        self.assertEqual( repr( value ), "<LazyValue undecoded, 3 bytes>" )
+        value = LazyValue( b"12", int )
+        value.value
+        self.assertEqual( repr( value ), "<LazyValue 12>" )
+
+    def test_errors_are_raised_on_read( self ):
+        value = LazyValue( b"junk", int )
+        self.assertRaises( ValueError, getattr, value, "value" )
+        self.assertFalse( value.decoded )
+
+
+class TestKeys( unittest.TestCase ):
+
+    def test_cache_key( self ):
+        key = CacheKey( default_key_func( "user:1", "app", 2 ) )
+        self.assertEqual( key, "app:2:user:1" )
+        self.assertFalse( hasattr( key, "__dict__" ) )
+        self.assertEqual( hash( key ), hash( "app:2:user:1" ) )
+        self.assertEqual( {key: 1}["app:2:user:1"], 1 )
+
+    def test_crc16( self ):
+        self.assertEqual( crc16( b"123456789" ), 0x31c3 )
+        # CLUSTER KEYSLOT of redis.
+        self.assertEqual( crc16( b"foo" ) % 16384, 12182 )
+        self.assertEqual( crc16( b"" ), 0 )
+
+
+if __name__ == "__main__":
+    unittest.main()
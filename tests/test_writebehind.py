@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import threading
+import time
+import unittest
+
+from rediscluster_cache.writebehind import BLOCK, DELETE, DROP_NEWEST, DROP_OLDEST, EXPIRE, SET, \
+    WriteBehindQueue, coalesce
+
+
+class FakeClient( object ):
+    """
+    Client of one node which writes once ``gate`` is set.
+    """
+
+    def __init__( self ):
+        self.node_manager = self
+        self.gate = threading.Event()
+        self.writes = []
+        self.refreshes = 0
+        self.broken = False
+
+    def keyslot( self, key ):
+        return 0
+
+    def request_refresh( self ):
+        self.refreshes += 1
+
+    def report_error( self, node, error ):
+        pass
+
+    def group_by_client( self, keys, write = False ):
+        if self.broken:
+            raise Exception( "no route" )
+        return [( self, list( keys ) )]
+
+    def pipeline( self, transaction = True ):
+        return self
+
+    def queue_write( self, node, pipe, op, key, *args ):
+        self.gate.wait( 5 )
+        self.writes.append( ( op, key ) + args )
+        return False
+
+
+class TestCoalesce( unittest.TestCase ):
+
+    def test_replace( self ):
+        self.assertEqual( coalesce( ( SET, ( 1, None, False ) ), SET, ( 2, None, False ) ),
+                          ( SET, ( 2, None, False ) ) )
+        self.assertEqual( coalesce( ( SET, ( 1, None, False ) ), DELETE, () ), ( DELETE, () ) )
+        self.assertEqual( coalesce( ( DELETE, () ), SET, ( 2, None, False ) ), ( SET, ( 2, None, False ) ) )
+
+    def test_expire_a_set( self ):
+        self.assertEqual( coalesce( ( SET, ( 1, None, True ) ), EXPIRE, ( 10, ) ),
+                          ( SET, ( 1, datetime.timedelta( seconds = 10 ), True ) ) )
+        self.assertEqual( coalesce( ( SET, ( 1, datetime.timedelta( seconds = 10 ), False ) ), EXPIRE, ( None, ) ),
+                          ( SET, ( 1, None, False ) ) )
+        self.assertEqual( coalesce( ( SET, ( 1, None, False ) ), EXPIRE, ( 0, ) ), ( DELETE, () ) )
+
+    def test_expire_a_delete( self ):
+        self.assertEqual( coalesce( ( DELETE, () ), EXPIRE, ( 10, ) ), ( DELETE, () ) )
+
+    def test_expire_an_expire( self ):
+        self.assertEqual( coalesce( ( EXPIRE, ( 5, ) ), EXPIRE, ( 10, ) ), ( EXPIRE, ( 10, ) ) )
+
+
+class TestWriteBehindQueue( unittest.TestCase ):
+
+    def setUp( self ):
+        self.client = FakeClient()
+        self.queues = []
+
+    def tearDown( self ):
+        self.client.gate.set()
+        for queue in self.queues:
+            queue.close()
+
+    def make( self, **kwargs ):
+        options = {"max_size": 2, "batch_size": 1}
+        options.update( kwargs )
+        queue = WriteBehindQueue( self.client, **options )
+        self.queues.append( queue )
+        return queue
+
+    def put_blocked( self, queue ):
+        # The flusher takes the first write and waits on the gate.
+        queue.put( SET, "first", 0, None, False )
+        deadline = time.time() + 5
+        while "first" not in queue._shards[0].writing and time.time() < deadline:
+            time.sleep( 0.001 )
+
+    def flushed( self, queue ):
+        self.client.gate.set()
+        self.assertTrue( queue.flush( 5 ) )
+        return [write[1] for write in self.client.writes]
+
+    def test_unknown_drop_policy( self ):
+        self.assertRaises( ValueError, WriteBehindQueue, self.client, drop_policy = "drop_all" )
+
+    def test_coalesces( self ):
+        queue = self.make()
+        self.put_blocked( queue )
+        queue.put( SET, "a", 1, None, False )
+        queue.put( SET, "a", 2, None, False )
+        self.assertEqual( queue.pending(), 2 )
+        self.assertEqual( self.flushed( queue ), ["first", "a"] )
+        self.assertEqual( self.client.writes[-1], ( SET, "a", 2, None, False ) )
+        self.assertEqual( queue.stats()["coalesced"], 1 )
+        self.assertEqual( queue.stats()["written"], 2 )
+
+    def test_drop_oldest( self ):
+        queue = self.make( drop_policy = DROP_OLDEST )
+        self.put_blocked( queue )
+        for key in ( "a", "b", "c" ):
+            self.assertTrue( queue.put( DELETE, key ) )
+        self.assertEqual( self.flushed( queue ), ["first", "b", "c"] )
+        self.assertEqual( queue.stats()["dropped"], 1 )
+
+    def test_drop_newest( self ):
+        queue = self.make( drop_policy = DROP_NEWEST )
+        self.put_blocked( queue )
+        self.assertTrue( queue.put( DELETE, "a" ) )
+        self.assertTrue( queue.put( DELETE, "b" ) )
+        self.assertFalse( queue.put( DELETE, "c" ) )
+        # Writes of a queued key still coalesce.
+        self.assertTrue( queue.put( DELETE, "a" ) )
+        self.assertEqual( self.flushed( queue ), ["first", "b", "a"] )
+        self.assertEqual( queue.stats()["dropped"], 1 )
+
+    def test_block( self ):
+        queue = self.make( drop_policy = BLOCK, block_timeout = 0.05 )
+        self.put_blocked( queue )
+        queue.put( DELETE, "a" )
+        queue.put( DELETE, "b" )
+        start = time.time()
+        self.assertFalse( queue.put( DELETE, "c" ) )
+        self.assertTrue( time.time() - start >= 0.04 )
+        threading.Timer( 0.05, self.client.gate.set ).start()
+        queue.block_timeout = 5
+        self.assertTrue( queue.put( DELETE, "c" ) )
+        self.assertEqual( self.flushed( queue ), ["first", "a", "b", "c"] )
+
+    def test_discard( self ):
+        queue = self.make()
+        self.put_blocked( queue )
+        queue.put( DELETE, "a" )
+        queue.discard( "a" )
+        self.assertEqual( self.flushed( queue ), ["first"] )
+
+    def test_failed_batch( self ):
+        queue = self.make()
+        self.client.broken = True
+        queue.put( DELETE, "a" )
+        self.assertTrue( queue.flush( 5 ) )
+        self.assertEqual( queue.stats()["failed"], 1 )
+        self.assertEqual( self.client.refreshes, 1 )
+        # The flusher keeps running.
+        self.client.broken = False
+        queue.put( DELETE, "b" )
+        self.assertEqual( self.flushed( queue ), ["b"] )
+
+    def test_closed( self ):
+        queue = self.make()
+        queue.put( DELETE, "a" )
+        self.client.gate.set()
+        self.assertTrue( queue.close() )
+        self.assertFalse( queue.put( DELETE, "b" ) )
+        self.assertEqual( [write[1] for write in self.client.writes], ["a"] )
+
+
+if __name__ == "__main__":
+    unittest.main()
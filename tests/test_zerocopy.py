@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+try:
+    from rediscluster_cache.serializers.zerocopy import ZeroCopyPickleSerializer, pickle
+except ImportError:
+    # Neither python 3.8 nor the pickle5 backport.
+    ZeroCopyPickleSerializer = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def joined( value ):
+    if isinstance( value, list ):
+        return b"".join( bytes( part ) for part in value )
+    return value
+
+
+@unittest.skipIf( ZeroCopyPickleSerializer is None, "pickle protocol 5 is not available" )
+class TestZeroCopyPickleSerializer( unittest.TestCase ):
+
+    def setUp( self ):
+        self.serializer = ZeroCopyPickleSerializer( {} )
+
+    def test_plain_values( self ):
+        value = {"a": [1, 2.5, "three"]}
+        dumped = self.serializer.dumps( value )
+        self.assertTrue( isinstance( dumped, bytes ) )
+        self.assertEqual( self.serializer.loads( dumped ), value )
+
+    def test_out_of_band_buffers( self ):
+        data = bytearray( b"x" * 1000 )
+        dumped = self.serializer.dumps( {"data": pickle.PickleBuffer( data )} )
+        self.assertTrue( isinstance( dumped, list ) )
+        self.assertEqual( len( dumped ), 3 )
+        loaded = self.serializer.loads( joined( dumped ) )
+        self.assertEqual( bytes( loaded["data"] ), bytes( data ) )
+
+    def test_pickle_version( self ):
+        self.assertEqual( ZeroCopyPickleSerializer( {"PICKLE_VERSION": 2} )._pickle_version, 5 )
+        self.assertRaises( Exception, ZeroCopyPickleSerializer, {"PICKLE_VERSION": "five"} )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_ndarray( self ):
+        array = numpy.arange( 12, dtype = "<f8" ).reshape( 3, 4 )
+        dumped = self.serializer.dumps( array )
+        self.assertEqual( len( dumped ), 2 )
+        loaded = self.serializer.loads( joined( dumped ) )
+        self.assertEqual( loaded.dtype, array.dtype )
+        self.assertTrue( ( loaded == array ).all() )
+        # A view over the received bytes.
+        self.assertFalse( loaded.flags.writeable )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_non_contiguous_ndarray( self ):
+        array = numpy.arange( 12, dtype = "<i4" ).reshape( 3, 4 )[:, 1]
+        loaded = self.serializer.loads( joined( self.serializer.dumps( array ) ) )
+        self.assertEqual( loaded.tolist(), [1, 5, 9] )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_structured_ndarray( self ):
+        array = numpy.array( [( 1, 2.5, b"ab" ), ( 3, 4.5, b"cd" )],
+                             dtype = [( "id", "<i4" ), ( "score", "<f8" ), ( "code", "S2" )] )
+        loaded = self.serializer.loads( joined( self.serializer.dumps( array ) ) )
+        self.assertEqual( loaded.dtype, array.dtype )
+        self.assertEqual( loaded.dtype.names, ( "id", "score", "code" ) )
+        self.assertEqual( loaded["score"].tolist(), [2.5, 4.5] )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_padded_structured_ndarray( self ):
+        dtype = numpy.dtype( {"names": ["a", "b"], "formats": ["<i4", "<f8"], "offsets": [0, 8], "itemsize": 16} )
+        array = numpy.zeros( 3, dtype = dtype )
+        array["b"] = [1.5, 2.5, 3.5]
+        loaded = self.serializer.loads( joined( self.serializer.dumps( array ) ) )
+        self.assertEqual( loaded.dtype, dtype )
+        self.assertEqual( loaded["b"].tolist(), [1.5, 2.5, 3.5] )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_zero_dimensional_ndarray( self ):
+        array = numpy.array( 3.5 )
+        loaded = self.serializer.loads( joined( self.serializer.dumps( array ) ) )
+        self.assertEqual( loaded.shape, () )
+        self.assertEqual( loaded, 3.5 )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_object_ndarray( self ):
+        array = numpy.array( [1, "a", None], dtype = object )
+        loaded = self.serializer.loads( joined( self.serializer.dumps( array ) ) )
+        self.assertEqual( loaded.tolist(), [1, "a", None] )
+
+
+if __name__ == "__main__":
+    unittest.main()